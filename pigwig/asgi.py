@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import io
+import sys
+import tempfile
+import time
+import traceback
+import typing
+
+from . import exceptions, multipart
+from .request_response import NO_JSON, Response
+from .static import file_chunks
+from .timing import Timing
+
+if typing.TYPE_CHECKING:
+	from .pigwig import PigWig
+	from .request_response import Request
+
+	Scope = typing.Dict[str, typing.Any]
+	Message = typing.Dict[str, typing.Any]
+	Receive = typing.Callable[[], typing.Awaitable[Message]]
+	Send = typing.Callable[[Message], typing.Awaitable[None]]
+
+async def handle(app: PigWig, scope: Scope, receive: Receive, send: Send) -> None:
+	""" serve one ASGI connection for ``app``. see :func:`.PigWig.asgi` """
+	if scope['type'] == 'lifespan':
+		await _lifespan(app, receive, send)
+		return
+	if scope['type'] != 'http':
+		raise ValueError('unsupported ASGI scope type: %r' % scope['type'])
+
+	start = time.perf_counter()
+	environ = build_environ(scope)
+	errors = environ['wsgi.errors']
+	loop = asyncio.get_running_loop()
+	request = None
+	try:
+		try:
+			if scope['method'] == 'OPTIONS':
+				headers = _encode_headers(Response.DEFAULT_HEADERS)
+				await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+				await send({'type': 'http.response.body', 'body': b''})
+				return
+
+			request = app.build_request(environ)
+			if app.server_timing or app.timing_handler is not None:
+				request.timing = Timing()
+			encoding = app._negotiate(request)
+			response, cache_ttl = await _handle(app, request, errors, encoding, receive, loop)
+			if cache_ttl is not None and response.code == 200:
+				await _buffer(app, response, loop)
+			app._finish(request, response, cache_ttl, encoding)
+			if request.timing.enabled:
+				app._report_timing(request, response)
+			await send({
+				'type': 'http.response.start',
+				'status': response.code,
+				'headers': _encode_headers(response.headers),
+			})
+		except Exception: # something went very wrong handling OPTIONS, in error handling, or in sending the response
+			errors.write(traceback.format_exc())
+			await send({'type': 'http.response.start', 'status': 500, 'headers': []})
+			await send({'type': 'http.response.body', 'body': b'internal server error'})
+			return
+
+		try:
+			nbytes = await _send_body(app, request, response, send, loop)
+		except Exception: # the headers are gone, so all we can do is cut the response short
+			errors.write(traceback.format_exc())
+			return
+		if app.metrics is not None:
+			route = request.route.path if request.route is not None else ''
+			app.metrics.observe(request.method, route, response.code, time.perf_counter() - start, nbytes)
+		if app.response_done_handler:
+			app.response_done_handler(request, response)
+	finally:
+		# after sending, since a file body may be reading them
+		environ['wsgi.input'].close()
+		if request is not None:
+			for upload in request.uploads():
+				upload.file.close()
+
+def build_environ(scope: Scope) -> dict:
+	""" build a WSGI environ for an ASGI ``http`` scope. the body is filled in later """
+	server = scope.get('server') or ('localhost', 80)
+	environ = {
+		'REQUEST_METHOD': scope['method'],
+		'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+		# build_request decodes PATH_INFO the way WSGI servers encode it
+		'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+		'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+		'SERVER_NAME': server[0],
+		'SERVER_PORT': str(server[1]),
+		'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+		'wsgi.version': (1, 0),
+		'wsgi.url_scheme': scope.get('scheme', 'http'),
+		'wsgi.input': io.BytesIO(),
+		'wsgi.errors': sys.stderr,
+		'wsgi.multithread': True,
+		'wsgi.multiprocess': False,
+		'wsgi.run_once': False,
+		'asgi.scope': scope,
+	}
+	client = scope.get('client')
+	if client:
+		environ['REMOTE_ADDR'] = client[0]
+		environ['REMOTE_PORT'] = str(client[1])
+	for name, value in scope['headers']:
+		key = name.decode('latin-1').upper().replace('-', '_')
+		if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+			key = 'HTTP_' + key
+		if key in environ:
+			separator = '; ' if key == 'HTTP_COOKIE' else ','
+			environ[key] += separator + value.decode('latin-1')
+		else:
+			environ[key] = value.decode('latin-1')
+	return environ
+
+def executor(app: PigWig) -> concurrent.futures.ThreadPoolExecutor:
+	""" the pool that runs ``app``'s plain (non-``async``) handlers and sync body generators """
+	if app._executor is None:
+		app._executor = concurrent.futures.ThreadPoolExecutor(app.asgi_threads, 'pigwig-asgi')
+	return app._executor
+
+async def _handle(app: PigWig, request: Request, errors: typing.TextIO, encoding: str | None, receive: Receive,
+		loop: asyncio.AbstractEventLoop) -> tuple[Response, float | None]:
+	""" the async counterpart of :func:`.PigWig._handle` """
+	try:
+		try:
+			cached, kwargs, cache_ttl = app._dispatch(request, encoding)
+			if cached is not None:
+				return cached, None
+			assert request.route is not None
+			await _read_body(app, request, receive)
+			handler = request.route.handler
+			with request.timing.span('handler'):
+				if inspect.iscoroutinefunction(handler):
+					response = await handler(request, **kwargs)
+				else:
+					if app.profiler is not None and app.profiler.sample(request):
+						call = functools.partial(app.profiler.run, request, handler, kwargs)
+					else:
+						call = functools.partial(handler, request, **kwargs)
+					if app.memory_tracker is not None and app.memory_tracker.sample(request):
+						call = functools.partial(app.memory_tracker.run, request, call)
+					if app.watchdog is not None:
+						call = functools.partial(app.watchdog.run, request, call)
+					response = await loop.run_in_executor(executor(app), call)
+					if inspect.isawaitable(response):
+						response = await response
+			return response, cache_ttl
+		except exceptions.HTTPException as e:
+			return app.http_exception_handler(e, errors, request, app), None
+	except Exception as e: # something went wrong in handler or http_exception_handler
+		return app.exception_handler(e, errors, request, app), None
+
+async def _read_body(app: PigWig, request: Request, receive: Receive) -> None:
+	"""
+	read the whole request body into ``wsgi.input`` so that sync code can parse it. enforces
+	``max_body_size`` the same way :func:`.PigWig._handle` does for WSGI
+	"""
+	assert request.route is not None
+	environ = request.wsgi_environ
+	max_body_size = request.route.options.get('max_body_size', app.max_body_size)
+	content_length = environ.get('CONTENT_LENGTH')
+	if max_body_size is not None and content_length and content_length.isdigit() and \
+			int(content_length) > max_body_size:
+		raise exceptions.HTTPException(413, 'request body too large')
+
+	body = tempfile.SpooledTemporaryFile(multipart.spool_size)
+	environ['wsgi.input'].close()
+	environ['wsgi.input'] = body
+	size = 0
+	while True:
+		message = await receive()
+		if message['type'] == 'http.disconnect':
+			raise exceptions.HTTPException(400, 'client disconnected')
+		chunk = message.get('body', b'')
+		size += len(chunk)
+		if max_body_size is not None and size > max_body_size:
+			raise exceptions.HTTPException(413, 'request body too large')
+		body.write(chunk)
+		if not message.get('more_body', False):
+			break
+	body.seek(0)
+	if not content_length:
+		environ['CONTENT_LENGTH'] = str(size)
+
+async def _buffer(app: PigWig, response: Response, loop: asyncio.AbstractEventLoop) -> None:
+	""" read a body that is about to be stored in the response cache without blocking the loop """
+	if app.json_codec is not None and response.json_obj is not NO_JSON:
+		return # the codec replaces the body anyway
+	if inspect.isasyncgen(response.body):
+		response.body = b''.join([chunk async for chunk in response.body])
+	elif inspect.isgenerator(response.body):
+		chunks = typing.cast(typing.Iterator[bytes], response.body)
+		response.body = await loop.run_in_executor(executor(app), b''.join, chunks)
+
+async def _send_body(app: PigWig, request: Request, response: Response, send: Send,
+		loop: asyncio.AbstractEventLoop) -> int:
+	""" send the response body, returning how many bytes it had """
+	body = response.body
+	nbytes = 0
+	try:
+		if request.method == 'HEAD':
+			await send({'type': 'http.response.body', 'body': b''})
+			return 0
+		if isinstance(body, bytes):
+			await send({'type': 'http.response.body', 'body': body})
+			return len(body)
+		if inspect.isasyncgen(body):
+			async for chunk in body:
+				if chunk:
+					nbytes += len(chunk)
+					await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+		else:
+			if hasattr(body, 'read'):
+				body = file_chunks(typing.cast(typing.BinaryIO, body))
+			chunks = typing.cast(typing.Iterator[bytes], body)
+			while True:
+				chunk = await loop.run_in_executor(executor(app), next, chunks, None)
+				if chunk is None:
+					break
+				if chunk:
+					nbytes += len(chunk)
+					await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+		await send({'type': 'http.response.body', 'body': b''})
+		return nbytes
+	finally:
+		if inspect.isasyncgen(body):
+			await body.aclose()
+		else:
+			close = getattr(body, 'close', None)
+			if close is not None:
+				close()
+
+async def _lifespan(app: PigWig, receive: Receive, send: Send) -> None:
+	while True:
+		message = await receive()
+		if message['type'] == 'lifespan.startup':
+			await send({'type': 'lifespan.startup.complete'})
+		elif message['type'] == 'lifespan.shutdown':
+			if app._executor is not None:
+				app._executor.shutdown(wait=False)
+				app._executor = None
+			await send({'type': 'lifespan.shutdown.complete'})
+			return
+
+def _encode_headers(headers: typing.Iterable[tuple[str, str]]) -> list[tuple[bytes, bytes]]:
+	return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import collections
+import threading
+import time
+import typing
+
+class CacheStore(typing.Protocol):
+	"""
+	what :class:`.response_cache.ResponseCache` and
+	:class:`.templates_jinja.JinjaTemplateEngine` need from their storage. :class:`LRUCache` and
+	:class:`.mmap_cache.MmapCache` both implement it
+
+	:func:`set`'s ``ttl`` is in seconds and ``size`` is the entry's approximate size in bytes, for
+	stores that limit memory use
+	"""
+
+	hits: int
+	misses: int
+	evictions: int
+
+	def get(self, key: typing.Hashable, default: typing.Any=None) -> typing.Any:
+		...
+
+	def set(self, key: typing.Hashable, value: typing.Any, ttl: float | None=None, size: int=0) -> None:
+		...
+
+	def delete(self, key: typing.Hashable) -> None:
+		...
+
+	def keys(self) -> list[typing.Hashable]:
+		...
+
+	def clear(self) -> None:
+		...
+
+class LRUCache:
+	"""
+	a mapping that holds at most ``maxsize`` entries, evicting the least recently used one when
+	full. safe to share between threads.
+
+	:param ttl: if not ``None``, the default number of seconds an entry lives for. expired entries
+	  are dropped when next looked up
+	:param max_bytes: if not ``None``, also evict entries while the ``size`` passed to :func:`set`
+	  adds up to more than this
+
+	has the following instance attrs:
+
+	* ``maxsize``
+	* ``ttl``
+	* ``max_bytes``
+	* ``bytes`` - the sum of the ``size`` of every entry
+	* ``hits`` - number of :func:`get` calls that found their key
+	* ``misses`` - number of :func:`get` calls that didn't (including ones that found it expired)
+	* ``evictions`` - number of entries dropped to make room for new ones
+	"""
+
+	def __init__(self, maxsize: int, ttl: float | None=None, max_bytes: int | None=None) -> None:
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.bytes = 0
+		self.hits = self.misses = self.evictions = 0
+		# values are (value, expiry time or None, size)
+		self._data: collections.OrderedDict[typing.Hashable, tuple[typing.Any, float | None, int]] = \
+				collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: typing.Hashable, default: typing.Any=None) -> typing.Any:
+		with self._lock:
+			try:
+				value, expires, size = self._data[key]
+			except KeyError:
+				self.misses += 1
+				return default
+			if expires is not None and expires <= time.monotonic():
+				del self._data[key]
+				self.bytes -= size
+				self.misses += 1
+				return default
+			self._data.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def set(self, key: typing.Hashable, value: typing.Any, ttl: float | None=None, size: int=0) -> None:
+		""" ``ttl`` overrides the cache's default for this entry """
+		if ttl is None:
+			ttl = self.ttl
+		expires = None if ttl is None else time.monotonic() + ttl
+		with self._lock:
+			old = self._data.pop(key, None)
+			if old is not None:
+				self.bytes -= old[2]
+			self._data[key] = (value, expires, size)
+			self.bytes += size
+			while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+				_, (_, _, evicted_size) = self._data.popitem(last=False)
+				self.bytes -= evicted_size
+				self.evictions += 1
+
+	def delete(self, key: typing.Hashable) -> None:
+		with self._lock:
+			old = self._data.pop(key, None)
+			if old is not None:
+				self.bytes -= old[2]
+
+	def keys(self) -> list[typing.Hashable]:
+		with self._lock:
+			return list(self._data)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+			self.bytes = 0
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def __repr__(self) -> str:
+		return '%s(maxsize=%d, hits=%d, misses=%d, evictions=%d)' % (self.__class__.__name__,
+				self.maxsize, self.hits, self.misses, self.evictions)
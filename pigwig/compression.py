@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import typing
+import zlib
+
+if typing.TYPE_CHECKING:
+	from .request_response import Response
+
+_WBITS = {
+	'gzip': 16 + zlib.MAX_WBITS,
+	'deflate': zlib.MAX_WBITS, # HTTP's "deflate" is the zlib format, not raw deflate
+}
+
+class Compression:
+	"""
+	compresses response bodies for a :class:`.PigWig` app (see its ``compression`` param) with
+	``gzip`` or ``deflate``, whichever the request's ``Accept-Encoding`` prefers. ``bytes`` bodies
+	are compressed in one shot and get a new ``Content-Length``. generator bodies are compressed as
+	they stream, with a sync flush after each chunk so the client never waits on data that the server
+	has already produced.
+
+	responses are sent as-is when they have a file body (so that it can still be sent with
+	``wsgi.file_wrapper``), have a 204, 206, or 304 code, already have a ``Content-Encoding`` or
+	``Content-Range``, are ``bytes`` shorter than ``min_size``, or have a content type that is
+	already compressed (see :attr:`incompressible_types`). every other response gets
+	``Vary: Accept-Encoding``. ``HEAD`` responses are compressed (and their bodies dropped) so that
+	they get the same headers as ``GET``.
+
+	:type level: int
+	:param level: the zlib compression level, 1 (fastest) to 9 (smallest)
+	:type min_size: int
+	:param min_size: ``bytes`` bodies shorter than this are sent uncompressed
+	:type encodings: tuple
+	:param encodings: the encodings to offer, most preferred first. used to break ties between
+	  equal q-values
+	"""
+
+	#: content types (without parameters) that are never compressed. ``image/``, ``audio/``, and
+	#: ``video/`` types other than ``image/svg+xml`` are also skipped
+	incompressible_types = frozenset([
+		'application/gzip', 'application/x-gzip', 'application/zip', 'application/x-bzip2', 'application/x-xz',
+		'application/zstd', 'application/x-7z-compressed', 'application/x-rar-compressed', 'application/pdf',
+		'application/octet-stream', 'font/woff', 'font/woff2',
+	])
+
+	def __init__(self, level: int=6, min_size: int=1024, encodings: tuple[str, ...]=('gzip', 'deflate')) -> None:
+		for encoding in encodings:
+			if encoding not in _WBITS:
+				raise ValueError('unsupported encoding: %r' % encoding)
+		self.level = level
+		self.min_size = min_size
+		self.encodings = encodings
+
+	def negotiate(self, accept_encoding: str | None) -> str | None:
+		""" the encoding to use for a request with this ``Accept-Encoding``, or ``None`` """
+		if not accept_encoding:
+			return None
+		qvalues = _parse_accept_encoding(accept_encoding)
+		best = None
+		best_q = 0.0
+		for encoding in self.encodings:
+			q = qvalues.get(encoding, qvalues.get('*', 0.0))
+			if q > best_q:
+				best = encoding
+				best_q = q
+		return best
+
+	def compressible(self, response: Response) -> bool:
+		""" whether ``response``, whose body must already be ``bytes``, a generator, or a file, may be compressed """
+		if response.code in (204, 206, 304) or hasattr(response.body, 'read'):
+			return False
+		if isinstance(response.body, bytes) and len(response.body) < self.min_size:
+			return False
+		for name, value in response.headers:
+			if name in ('Content-Encoding', 'Content-Range'): # a range's offsets are into the uncompressed body
+				return False
+			if name == 'Content-Type':
+				content_type = value.split(';', 1)[0].strip().lower()
+				if content_type in self.incompressible_types:
+					return False
+				if content_type.startswith(('image/', 'audio/', 'video/')) and content_type != 'image/svg+xml':
+					return False
+		return True
+
+	def compress(self, response: Response, encoding: str) -> None:
+		""" compress ``response``'s body with ``encoding`` and fix up its headers """
+		compressor = zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[encoding])
+		headers = [(k, v) for k, v in response.headers if k != 'Content-Length']
+		if isinstance(response.body, bytes):
+			response.body = compressor.compress(response.body) + compressor.flush()
+			headers.append(('Content-Length', str(len(response.body))))
+		elif inspect.isasyncgen(response.body):
+			response.body = _compress_async_stream(response.body, compressor)
+		else:
+			response.body = _compress_stream(typing.cast(typing.Iterator[bytes], response.body), compressor)
+		headers.append(('Content-Encoding', encoding))
+		response.headers = headers
+		# the compressed bytes differ, but they still mean the same thing
+		if response.etag is not None and not response.etag.startswith('W/'):
+			response.etag = 'W/' + response.etag
+
+def _compress_stream(chunks: typing.Iterator[bytes], compressor: typing.Any) -> typing.Iterator[bytes]:
+	try:
+		for chunk in chunks:
+			if not chunk:
+				continue
+			data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+			if data:
+				yield data
+		yield compressor.flush()
+	finally:
+		close = getattr(chunks, 'close', None)
+		if close is not None:
+			close()
+
+async def _compress_async_stream(chunks: typing.AsyncGenerator[bytes, None],
+		compressor: typing.Any) -> typing.AsyncIterator[bytes]:
+	try:
+		async for chunk in chunks:
+			if not chunk:
+				continue
+			data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+			if data:
+				yield data
+		yield compressor.flush()
+	finally:
+		await chunks.aclose()
+
+@functools.lru_cache(maxsize=64)
+def _parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+	qvalues = {}
+	for item in accept_encoding.split(','):
+		coding, _, params = item.partition(';')
+		coding = coding.strip().lower()
+		if not coding:
+			continue
+		if coding == 'x-gzip':
+			coding = 'gzip'
+		q = 1.0
+		for param in params.split(';'):
+			name, _, value = param.partition('=')
+			if name.strip().lower() == 'q':
+				try:
+					q = float(value)
+				except ValueError:
+					q = 0.0
+		qvalues[coding] = q
+	return qvalues
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import codecs
+import io
+import json
+import typing
+
+class JSONCodec:
+	"""
+	encodes and decodes JSON for a :class:`.PigWig` app (see its ``json_codec`` param). to plug in a
+	faster library, subclass this and override :func:`loads` and :func:`dumps` (and
+	:func:`iterencode` if the library can stream).
+
+	:type encoder: json.JSONEncoder
+	:param encoder: defaults to a compact encoder (no indentation or spaces after separators).
+	  without indentation, :func:`dumps` runs entirely in the C accelerator
+	:type stream_min_items: int
+	:param stream_min_items: :func:`encode` streams lists, tuples, and dicts with at least this many
+	  items instead of encoding them in one shot
+	:type chunk_size: int
+	:param chunk_size: roughly how many characters of JSON each streamed chunk holds. that's also
+	  the number of bytes unless the encoder has ``ensure_ascii=False``
+	:type buffer_size: int
+	:param buffer_size: streamed output that turns out to be no bigger than this is joined and
+	  returned as ``bytes`` so that its ``Content-Length`` can be sent
+	"""
+
+	def __init__(self, encoder: json.JSONEncoder | None=None, stream_min_items: int=1000,
+			chunk_size: int=4096, buffer_size: int=64 * 1024) -> None:
+		if encoder is None:
+			encoder = json.JSONEncoder(separators=(',', ':'))
+		self.encoder = encoder
+		self.stream_min_items = stream_min_items
+		self.chunk_size = chunk_size
+		self.buffer_size = buffer_size
+
+	def loads(self, data: bytes | str) -> typing.Any:
+		""" decode a request body. ``data`` is ``bytes`` unless the body declared a non-UTF charset """
+		return json.loads(data)
+
+	def dumps(self, obj: typing.Any) -> bytes:
+		""" encode ``obj`` in one shot """
+		return self.encoder.encode(obj).encode('utf-8')
+
+	def iterencode(self, obj: typing.Any) -> typing.Iterator[bytes]:
+		""" encode ``obj`` incrementally, yielding chunks of bytes """
+		return encode_chunks(self.encoder.iterencode(obj), self.chunk_size)
+
+	def encode(self, obj: typing.Any) -> bytes | typing.Iterator[bytes]:
+		"""
+		:func:`iterencode` big containers (see ``stream_min_items``) and :func:`dumps` everything
+		else. returns ``bytes`` whenever the whole encoding is known up front
+		"""
+		if isinstance(obj, (list, tuple, dict)) and len(obj) >= self.stream_min_items:
+			return buffer_chunks(self.iterencode(obj), self.buffer_size)
+		return self.dumps(obj)
+
+	def handle_json(self, body: io.BufferedIOBase, length: int | None, params: dict[str, str]) -> typing.Any:
+		""" a :attr:`.PigWig.content_handlers` handler for ``application/json`` """
+		if length is None:
+			length = -1
+		data = body.read(length)
+		charset = params.get('charset')
+		if charset is not None and not codecs.lookup(charset).name.startswith('utf-'):
+			return self.loads(data.decode(charset))
+		return self.loads(data) # json.loads detects UTF-8, -16, and -32 on its own
+
+def encode_chunks(fragments: typing.Iterable[str], chunk_size: int=4096) -> typing.Iterator[bytes]:
+	"""
+	converts str fragments such as `json.JSONEncoder.iterencode <https://docs.python.org/3/library/json.html#json.JSONEncoder.iterencode>`_
+	output to UTF-8 chunks. fragments are collected until there are about ``chunk_size`` of them
+	(in characters, not encoded bytes, so that each fragment needn't be encoded on its own) and then
+	joined and encoded once
+	"""
+	batch: list[str] = []
+	size = 0
+	for fragment in fragments:
+		batch.append(fragment)
+		size += len(fragment)
+		if size >= chunk_size:
+			yield ''.join(batch).encode('utf-8')
+			batch = []
+			size = 0
+	if batch:
+		yield ''.join(batch).encode('utf-8')
+
+def buffer_chunks(chunks: typing.Iterator[bytes], buffer_size: int) -> bytes | typing.Iterator[bytes]:
+	""" returns ``chunks`` joined if they total at most ``buffer_size`` bytes, otherwise a generator of all of them """
+	buffered = []
+	size = 0
+	for chunk in chunks:
+		buffered.append(chunk)
+		size += len(chunk)
+		if size > buffer_size:
+			return _resume(buffered, chunks)
+	return b''.join(buffered)
+
+def _resume(buffered: list[bytes], chunks: typing.Iterator[bytes]) -> typing.Iterator[bytes]:
+	yield from buffered
+	yield from chunks
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import itertools
+import os
+import sys
+import threading
+import traceback
+import tracemalloc
+import typing
+
+from . import exceptions
+from .multipart import MultipartFile
+from .profiling import check_token
+from .request_response import Response
+
+if typing.TYPE_CHECKING:
+	from .request_response import Request
+
+class MemorySample(typing.NamedTuple):
+	""" the allocations of one sampled request, passed to a :class:`MemoryTracker`'s ``report`` """
+
+	request: Request
+	net_bytes: int #: bytes allocated during the request and still allocated at its end
+	peak: int | None #: the most bytes traced at once during the request, if tracemalloc was started for it
+	sites: list[tuple[str, int, int]] #: the top ``(site, net bytes, net allocations)``, biggest first
+	body_bytes: int | None #: how much of the parsed ``request.body`` is held in memory, if it was parsed
+
+class RouteMemory:
+	""" what a :class:`MemoryTracker` has recorded for one route template """
+
+	def __init__(self) -> None:
+		self.samples = 0
+		self.net_bytes = 0 #: summed over every sample
+		self.peak = 0 #: the highest sample ``peak``
+		self.body_peak = 0 #: the most bytes of parsed ``request.body`` held in memory by one sample
+		self.multipart_peak = 0 #: the same, for ``multipart/form-data`` bodies only
+		self.sites: dict[str, list[int]] = {} # site -> [net bytes, net allocations], summed over every sample
+
+class MemoryTracker:
+	"""
+	tracks the allocations of a sample of a :class:`.PigWig` app's route handlers (see its
+	``memory_tracker`` param) with ``tracemalloc`` and adds up, for each route template, how many
+	bytes they left allocated and where. use it to find the routes behind a worker that keeps
+	growing.
+
+	if tracemalloc isn't already tracing, it's started for each sampled request and stopped after,
+	so requests that aren't sampled run at full speed. only one request is sampled at a time, but
+	allocations made by other threads meanwhile are counted too. under ASGI, only plain
+	(non-``async``) handlers are sampled.
+
+	sampled requests that parse their ``request.body`` also have the bytes the parsed body holds in
+	memory measured; uploads spooled to disk don't count.
+
+	:type every: int
+	:param every: sample one in this many requests
+	:param routes: if not ``None``, only requests matching these route templates (``'/post/<id>'``)
+	  are sampled
+	:type frames: int
+	:param frames: how many stack frames tracemalloc records per allocation. more than 1 groups
+	  allocation sites by their callers too, at a higher cost
+	:type top: int
+	:param top: how many allocation sites a :class:`MemorySample` has
+	:type token: str
+	:param token: the secret :func:`handler` requires. if ``None``, the handler always refuses
+	:param report: if not ``None``, a function that is passed a :class:`MemorySample` after each
+	  sampled request
+	"""
+
+	def __init__(self, every: int=100, routes: typing.Iterable[str] | None=None, frames: int=1, top: int=10,
+			token: str | None=None, report: typing.Callable[[MemorySample], typing.Any] | None=None) -> None:
+		self.every = every
+		self.routes = frozenset(routes) if routes is not None else None
+		self.frames = frames
+		self.top = top
+		self.token = token
+		self.report = report
+		self.stats: dict[str, RouteMemory] = {}
+		self._counter = itertools.count()
+		self._sampling = threading.Lock()
+		self._stats_lock = threading.Lock()
+		self._filters = [
+			tracemalloc.Filter(False, tracemalloc.__file__),
+			tracemalloc.Filter(False, __file__),
+			tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+			tracemalloc.Filter(False, '<unknown>'),
+		]
+
+	def sample(self, request: Request) -> bool:
+		""" whether to track this request's allocations """
+		if request.route is None:
+			return False
+		if self.routes is not None and request.route.path not in self.routes:
+			return False
+		return next(self._counter) % self.every == 0
+
+	def run(self, request: Request, func: typing.Callable[[], Response]) -> Response:
+		""" call ``func``, tracking its allocations unless another request's are being tracked """
+		if not self._sampling.acquire(blocking=False):
+			return func()
+		try:
+			started = not tracemalloc.is_tracing()
+			before = None
+			if started:
+				tracemalloc.start(self.frames)
+			else:
+				before = tracemalloc.take_snapshot()
+			try:
+				return func()
+			finally:
+				peak = tracemalloc.get_traced_memory()[1] if started else None
+				after = tracemalloc.take_snapshot()
+				if started:
+					tracemalloc.stop()
+				try:
+					self._add(request, before, after, peak)
+				except Exception: # don't let a failed measurement change the response
+					errors = typing.cast(typing.TextIO, request.wsgi_environ.get('wsgi.errors', sys.stderr))
+					errors.write(traceback.format_exc())
+		finally:
+			self._sampling.release()
+
+	def _add(self, request: Request, before: tracemalloc.Snapshot | None, after: tracemalloc.Snapshot,
+			peak: int | None) -> None:
+		assert request.route is not None
+		key = 'lineno' if self.frames == 1 else 'traceback'
+		after = after.filter_traces(self._filters)
+		sites: list[tuple[str, int, int]]
+		if before is None: # tracemalloc was started for this request, so everything traced is new
+			sites = [(_site(stat.traceback), stat.size, stat.count) for stat in after.statistics(key)]
+		else:
+			diffs = after.compare_to(before.filter_traces(self._filters), key)
+			sites = [(_site(diff.traceback), diff.size_diff, diff.count_diff) for diff in diffs if diff.size_diff]
+		net_bytes = sum(size for _, size, _ in sites)
+		body_bytes = _resident_size(request.body) if request.body_parsed else None
+		multipart = request.wsgi_environ.get('CONTENT_TYPE', '').startswith('multipart/form-data')
+
+		with self._stats_lock:
+			stats = self._route_stats(request.route.path)
+			stats.samples += 1
+			stats.net_bytes += net_bytes
+			if peak is not None and peak > stats.peak:
+				stats.peak = peak
+			if body_bytes is not None and body_bytes > stats.body_peak:
+				stats.body_peak = body_bytes
+			if multipart and body_bytes is not None and body_bytes > stats.multipart_peak:
+				stats.multipart_peak = body_bytes
+			for site, size, count in sites:
+				totals = stats.sites.get(site)
+				if totals is None:
+					stats.sites[site] = [size, count]
+				else:
+					totals[0] += size
+					totals[1] += count
+		if self.report is not None:
+			sites.sort(key=lambda site: site[1], reverse=True)
+			self.report(MemorySample(request, net_bytes, peak, sites[:self.top], body_bytes))
+
+	def _route_stats(self, route: str) -> RouteMemory:
+		stats = self.stats.get(route)
+		if stats is None:
+			stats = self.stats[route] = RouteMemory()
+		return stats
+
+	def clear(self) -> None:
+		with self._stats_lock:
+			self.stats.clear()
+
+	def handler(self, request: Request) -> Response:
+		"""
+		a route handler showing each route's stats and its top allocation sites. it needs the
+		``token`` like :func:`.Profiler.handler`. params:
+
+		* ``route`` - only show this route template
+		* ``limit`` - how many allocation sites to show per route (default 10)
+		"""
+		check_token(request, self.token)
+		route = request.query.get('route')
+		try:
+			limit = int(typing.cast(str, request.query.get('limit', '10')))
+		except ValueError:
+			raise exceptions.HTTPException(400, 'invalid limit') from None
+		lines = []
+		with self._stats_lock:
+			for name, stats in sorted(self.stats.items()):
+				if route is not None and name != route:
+					continue
+				lines.append('==== %s (%d samples, pid %d) ====' % (name, stats.samples, os.getpid()))
+				lines.append('net bytes: %d' % stats.net_bytes)
+				lines.append('peak traced bytes: %d' % stats.peak)
+				lines.append('peak body bytes: %d' % stats.body_peak)
+				lines.append('peak multipart bytes: %d' % stats.multipart_peak)
+				sites = sorted(stats.sites.items(), key=lambda site: site[1][0], reverse=True)
+				for site, (size, count) in sites[:limit]:
+					lines.append('%12d B %8d allocs  %s' % (size, count, site))
+		return Response('\n'.join(lines) + '\n')
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+	""" the most recent frame first """
+	return ' < '.join('%s:%d' % (frame.filename, frame.lineno) for frame in reversed(traceback))
+
+def _resident_size(body: typing.Any) -> int:
+	""" roughly how many bytes of data a parsed body holds in memory """
+	size = 0
+	values = [body] # walked without recursion so deeply nested JSON can't overflow the stack
+	while values:
+		value = values.pop()
+		if isinstance(value, (bytes, bytearray, str)):
+			size += len(value)
+		elif isinstance(value, MultipartFile):
+			if value.in_memory:
+				size += value.size or 0
+		elif isinstance(value, dict):
+			values.extend(value.keys())
+			values.extend(value.values())
+		elif isinstance(value, (list, tuple)):
+			values.extend(value)
+		else:
+			size += sys.getsizeof(value)
+	return size
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+import typing
+
+from .request_response import Response
+
+if typing.TYPE_CHECKING:
+	from .request_response import Request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+	"""
+	per-route request metrics for a :class:`.PigWig` app (see its ``metrics`` param). requests are
+	grouped by method and route template (``/post/<id>``, not ``/post/1``; ``''`` if no route
+	matched) and counted by status code along with the bytes of body sent. durations go into a
+	histogram. a request is timed from when the app is called until the server closes the body, so
+	streamed responses are measured in full.
+
+	:func:`handler` serves the metrics in the Prometheus text format::
+
+		metrics = Metrics()
+		app = PigWig([..., ('GET', '/metrics', metrics.handler)], metrics=metrics)
+
+	:param buckets: the upper bounds, in seconds, of the latency histogram's buckets
+	:type directory: str
+	:param directory: if not ``None``, each process writes its metrics to a file here (at most every
+	  ``flush_interval`` seconds) and :func:`handler` adds up every process's file, so any worker of
+	  a multi-process server can serve the totals. clear the directory when the server starts
+	"""
+
+	def __init__(self, buckets: typing.Sequence[float]=DEFAULT_BUCKETS, directory: str | None=None,
+			flush_interval: float=1.0) -> None:
+		self.buckets = tuple(sorted(buckets))
+		self.directory = directory
+		self.flush_interval = flush_interval
+		self._lock = threading.Lock()
+		self._requests: dict[tuple[str, str, str], list[int]] = {} # (method, route, code) -> [count, bytes]
+		# (method, route) -> per-bucket counts (the last is +Inf), then the sum of durations
+		self._durations: dict[tuple[str, str], list[float]] = {}
+		self._flushed = time.monotonic()
+
+	def observe(self, method: str, route: str, code: int, seconds: float, nbytes: int) -> None:
+		""" record one finished request """
+		with self._lock:
+			requests = self._requests.get((method, route, str(code)))
+			if requests is None:
+				requests = self._requests[method, route, str(code)] = [0, 0]
+			requests[0] += 1
+			requests[1] += nbytes
+			durations = self._durations.get((method, route))
+			if durations is None:
+				durations = self._durations[method, route] = [0] * (len(self.buckets) + 2)
+			durations[bisect.bisect_left(self.buckets, seconds)] += 1
+			durations[-1] += seconds
+		if self.directory is not None and time.monotonic() - self._flushed > self.flush_interval:
+			self.flush()
+
+	def wrap(self, body: typing.Iterable[bytes], request: Request, response: Response,
+			start: float) -> typing.Iterable[bytes]:
+		""" return ``body`` set up to :func:`observe` the request when the server closes it """
+		route = request.route.path if request.route is not None else ''
+		observe = functools.partial(self.observe, request.method, route, response.code)
+		if hasattr(body, 'filelike'): # a wsgi.file_wrapper; keep it so the server can still sendfile it
+			length = 0
+			for name, value in response.headers:
+				if name == 'Content-Length':
+					length = int(value)
+			close = getattr(body, 'close', None)
+			def close_and_observe() -> None:
+				try:
+					if close is not None:
+						close()
+				finally:
+					observe(time.perf_counter() - start, length)
+			body.close = close_and_observe # type: ignore[attr-defined]
+			return body
+		return _MeteredBody(body, observe, start)
+
+	def flush(self) -> None:
+		""" write this process's metrics to its file in ``directory`` """
+		if self.directory is None:
+			return
+		self._flushed = time.monotonic()
+		with self._lock:
+			state = self._state()
+		path = os.path.join(self.directory, 'metrics-%d.json' % os.getpid())
+		with open(path + '.tmp', 'w') as f:
+			json.dump(state, f)
+		os.replace(path + '.tmp', path)
+
+	def _state(self) -> dict:
+		return {
+			'buckets': self.buckets,
+			'requests': [[list(key), value] for key, value in self._requests.items()],
+			'durations': [[list(key), value] for key, value in self._durations.items()],
+		}
+
+	def collect(self) -> tuple[dict[tuple[str, ...], list[int]], dict[tuple[str, ...], list[float]]]:
+		""" the request counts and duration histograms of this process or, with a ``directory``, all of them """
+		with self._lock:
+			states = [self._state()]
+		if self.directory is not None:
+			own = 'metrics-%d.json' % os.getpid()
+			for filename in os.listdir(self.directory):
+				if filename == own or not filename.startswith('metrics-') or not filename.endswith('.json'):
+					continue
+				try:
+					with open(os.path.join(self.directory, filename)) as f:
+						states.append(json.load(f))
+				except (OSError, ValueError):
+					continue
+
+		requests: dict[tuple[str, ...], list[int]] = {}
+		durations: dict[tuple[str, ...], list[float]] = {}
+		for state in states:
+			if tuple(state['buckets']) != self.buckets:
+				continue
+			for key, value in state['requests']:
+				total = requests.setdefault(tuple(key), [0, 0])
+				total[0] += value[0]
+				total[1] += value[1]
+			for key, value in state['durations']:
+				total_durations = durations.setdefault(tuple(key), [0] * len(value))
+				for i, v in enumerate(value):
+					total_durations[i] += v
+		return requests, durations
+
+	def render(self) -> str:
+		""" the metrics in the Prometheus text format """
+		requests, durations = self.collect()
+		lines = [
+			'# HELP pigwig_requests_total Requests handled, by route template and status code.',
+			'# TYPE pigwig_requests_total counter',
+		]
+		for (method, route, code), (count, _) in sorted(requests.items()):
+			lines.append('pigwig_requests_total{%s} %d' % (_labels(method=method, route=route, code=code), count))
+		lines.append('# HELP pigwig_response_bytes_total Response body bytes sent.')
+		lines.append('# TYPE pigwig_response_bytes_total counter')
+		for (method, route, code), (_, nbytes) in sorted(requests.items()):
+			labels = _labels(method=method, route=route, code=code)
+			lines.append('pigwig_response_bytes_total{%s} %d' % (labels, nbytes))
+		lines.append('# HELP pigwig_request_duration_seconds Time from the request to the end of the response.')
+		lines.append('# TYPE pigwig_request_duration_seconds histogram')
+		for (method, route), values in sorted(durations.items()):
+			labels = _labels(method=method, route=route)
+			cumulative = 0
+			for le, bucket_count in zip((*('%g' % b for b in self.buckets), '+Inf'), values):
+				cumulative += int(bucket_count)
+				lines.append('pigwig_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, le, cumulative))
+			lines.append('pigwig_request_duration_seconds_sum{%s} %r' % (labels, values[-1]))
+			lines.append('pigwig_request_duration_seconds_count{%s} %d' % (labels, cumulative))
+		return '\n'.join(lines) + '\n'
+
+	def handler(self, request: Request) -> Response:
+		""" a route handler serving :func:`render` """
+		return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class _MeteredBody:
+	""" a WSGI body that counts the bytes taken from it and observes the request when closed """
+
+	def __init__(self, body: typing.Iterable[bytes], observe: typing.Callable[[float, int], None],
+			start: float) -> None:
+		self.body = body
+		self.observe = observe
+		self.start = start
+		self.nbytes = 0
+
+	def __iter__(self) -> typing.Iterator[bytes]:
+		for chunk in self.body:
+			self.nbytes += len(chunk)
+			yield chunk
+
+	def close(self) -> None:
+		try:
+			close = getattr(self.body, 'close', None)
+			if close is not None:
+				close()
+		finally:
+			self.observe(time.perf_counter() - self.start, self.nbytes)
+
+def _labels(**labels: str) -> str:
+	return ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+			for name, value in labels.items())
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import typing
+
+class MmapCache:
+	"""
+	a :class:`.cache.CacheStore` in a memory-mapped file, shared by every process that opens the
+	same ``path`` - most usefully, by all of a prefork server's workers when it is created before
+	they fork. no outside service is needed. unix only.
+
+	the file is split into ``slots`` fixed-size slots. a key is hashed by its ``repr`` (so build
+	keys from strs, numbers, and tuples) to a set of ``ways`` neighboring slots and stored in one
+	of them, replacing the least recently written entry of the set if all are taken. keys and
+	values are pickled together and entries that don't fit in ``slot_size`` bytes are not stored.
+	only use files that nothing but your app can write to.
+
+	writes take an ``fcntl`` lock on just the set being written. reads take no lock: each slot has
+	a sequence number that writers make odd while they write, and a read that sees it odd or
+	changed counts as a miss.
+
+	``ttl`` works as with :class:`.cache.LRUCache` (measured with the wall clock so that it means the same
+	thing in every process). ``hits``, ``misses``, and ``evictions`` count this process's
+	operations only
+	"""
+
+	_header = struct.Struct('<Q16sddI') # sequence, key hash, expiry, write time, data length
+
+	def __init__(self, path: str, slots: int=4096, slot_size: int=16 * 1024, ways: int=4,
+			ttl: float | None=None) -> None:
+		if slot_size <= self._header.size:
+			raise ValueError('slot_size must be bigger than %d' % self._header.size)
+		self.path = path
+		self.slots = slots - slots % ways
+		self.slot_size = slot_size
+		self.ways = ways
+		self.ttl = ttl
+		self.hits = self.misses = self.evictions = 0
+		self._lock = threading.Lock() # fcntl locks don't exclude other threads of the same process
+
+		size = self.slots * slot_size
+		fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+		try:
+			if os.fstat(fd).st_size < size:
+				os.ftruncate(fd, size)
+			self._mmap = mmap.mmap(fd, size)
+		finally:
+			os.close(fd)
+		self._file = open(path, 'rb+') # for locking
+
+	def get(self, key: typing.Hashable, default: typing.Any=None) -> typing.Any:
+		digest = _digest(key)
+		for offset in self._set_offsets(digest):
+			seq, slot_digest, expires, _, length = self._header.unpack_from(self._mmap, offset)
+			if slot_digest != digest or seq % 2 == 1:
+				continue
+			start = offset + self._header.size
+			data = self._mmap[start:start + length]
+			if self._header.unpack_from(self._mmap, offset)[0] != seq: # written while we read
+				break
+			if expires and expires <= time.time():
+				break
+			try:
+				slot_key, value = pickle.loads(data)
+			except Exception:
+				break
+			if slot_key != key:
+				break
+			self.hits += 1
+			return value
+		self.misses += 1
+		return default
+
+	def set(self, key: typing.Hashable, value: typing.Any, ttl: float | None=None, size: int=0) -> None:
+		""" ``size`` is ignored: every slot is ``slot_size`` """
+		data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+		if len(data) > self.slot_size - self._header.size:
+			return
+		if ttl is None:
+			ttl = self.ttl
+		now = time.time()
+		expires = now + ttl if ttl is not None else 0.0
+		digest = _digest(key)
+		offsets = self._set_offsets(digest)
+		with self._locked(offsets[0]):
+			# overwrite the key's own slot if it has one, so that it's never stored twice
+			victim = None
+			free = None
+			oldest = None
+			for offset in offsets:
+				_, slot_digest, slot_expires, written, length = self._header.unpack_from(self._mmap, offset)
+				if slot_digest == digest:
+					victim = offset
+					break
+				if free is None and (length == 0 or (slot_expires and slot_expires <= now)):
+					free = offset
+				if oldest is None or written < oldest[0]:
+					oldest = (written, offset)
+			if victim is None:
+				victim = free
+			if victim is None:
+				assert oldest is not None
+				victim = oldest[1]
+				self.evictions += 1
+			self._write(victim, digest, expires, now, data)
+
+	def delete(self, key: typing.Hashable) -> None:
+		digest = _digest(key)
+		offsets = self._set_offsets(digest)
+		with self._locked(offsets[0]):
+			for offset in offsets:
+				if self._header.unpack_from(self._mmap, offset)[1] == digest:
+					self._write(offset, bytes(16), 0.0, 0.0, b'')
+
+	def keys(self) -> list[typing.Hashable]:
+		keys = []
+		for offset in range(0, self.slots * self.slot_size, self.slot_size):
+			seq, _, _, _, length = self._header.unpack_from(self._mmap, offset)
+			if length == 0 or seq % 2 == 1:
+				continue
+			start = offset + self._header.size
+			try:
+				keys.append(pickle.loads(self._mmap[start:start + length])[0])
+			except Exception:
+				continue
+		return keys
+
+	def clear(self) -> None:
+		with self._lock:
+			fcntl.lockf(self._file, fcntl.LOCK_EX)
+			try:
+				for offset in range(0, self.slots * self.slot_size, self.slot_size):
+					self._write(offset, bytes(16), 0.0, 0.0, b'')
+			finally:
+				fcntl.lockf(self._file, fcntl.LOCK_UN)
+
+	def close(self) -> None:
+		self._mmap.close()
+		self._file.close()
+
+	def _set_offsets(self, digest: bytes) -> list[int]:
+		first = int.from_bytes(digest[:8], 'little') % (self.slots // self.ways) * self.ways
+		return [(first + i) * self.slot_size for i in range(self.ways)]
+
+	@contextlib.contextmanager
+	def _locked(self, offset: int) -> typing.Iterator[None]:
+		length = self.ways * self.slot_size
+		with self._lock:
+			fcntl.lockf(self._file, fcntl.LOCK_EX, length, offset)
+			try:
+				yield
+			finally:
+				fcntl.lockf(self._file, fcntl.LOCK_UN, length, offset)
+
+	def _write(self, offset: int, digest: bytes, expires: float, written: float, data: bytes) -> None:
+		seq = self._header.unpack_from(self._mmap, offset)[0]
+		struct.pack_into('<Q', self._mmap, offset, seq + 1) # odd: readers skip this slot
+		start = offset + self._header.size
+		self._mmap[start:start + len(data)] = data
+		self._header.pack_into(self._mmap, offset, seq + 1, digest, expires, written, len(data))
+		struct.pack_into('<Q', self._mmap, offset, seq + 2)
+
+def _digest(key: typing.Hashable) -> bytes:
+	# not hash(), which is salted per process, or pickle, whose output depends on object identity
+	return hashlib.blake2b(repr(key).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
@@ -1,84 +1,73 @@
 from __future__ import annotations
 
+import email.message
 import http.client
 import io
 import re
+import tempfile
 import typing
 
-maxlen = 1024 * 1024 * 1024 # 1 GB
+from . import exceptions
 
-def parse_multipart(fp: io.BufferedIOBase, pdict: dict) -> dict[str, list[bytes | MultipartFile]]:
+maxlen = 1024 * 1024 * 1024 # 1 GB, for the whole body
+max_parts = 1000
+spool_size = 1024 * 1024 # uploads bigger than this are written to a temporary file
+chunk_size = 64 * 1024
+max_header_size = 16 * 1024
+
+def parse_multipart(fp: io.BufferedIOBase, pdict: dict, length: int | None=None, max_size: int | None=None,
+		part_limit: int | None=None) -> dict[str, list[bytes | MultipartFile]]:
 	"""
-		most of this code is copied straight from
-		`cgi.parse_multipart <https://github.com/python/cpython/blob/ad76602f69d884e491b0913c641dd8e42902c36c/Lib/cgi.py#L201>`_.
-		the only difference is that it returns a :class:`.MultipartFile` for any part with a ``filename``
-		param in its content-disposition (instead of just the bytes).
+		parses a ``multipart/form-data`` body, reading ``fp`` in ``chunk_size`` chunks and
+		splitting parts wherever the boundary is found. returns a dict of form field name to a list
+		of values: ``bytes`` for plain fields and a :class:`.MultipartFile` for any part with a
+		``filename`` param in its content-disposition. uploads bigger than ``spool_size`` are kept in
+		a temporary file rather than in memory.
+
+		:param pdict: params of the ``Content-Type`` header. ``boundary`` must be ``bytes``
+		:param length: the ``Content-Length`` of the body. never reads past it
+		:param max_size: defaults to ``maxlen``. a bigger body raises a 413
+		  :class:`.exceptions.HTTPException`
+		:param part_limit: defaults to ``max_parts``. more parts than this raises a 413
 	"""
 	boundary = pdict.get('boundary', b'')
 	if re.match(b'^[ -~]{0,200}[!-~]$', boundary) is None:
 		raise ValueError('Invalid boundary in multipart form: %r' % boundary)
+	if max_size is None:
+		max_size = maxlen
+	if part_limit is None:
+		part_limit = max_parts
 
-	nextpart = b'--' + boundary
-	lastpart = b'--' + boundary + b'--'
+	parser = _Parser(fp, boundary, length, max_size)
 	partdict: dict[str, list[bytes | MultipartFile]] = {}
-	terminator = b''
-	while terminator != lastpart:
-		read = -1
-		data: bytes | MultipartFile | None = None
-		if terminator:
-			# At start of next part.  Read headers first.
-			headers = http.client.parse_headers(fp)
-			clength = headers.get('content-length')
-			if clength:
-				try:
-					read = int(clength)
-				except ValueError:
-					pass
-			if read > 0:
-				if maxlen and read > maxlen:
-					raise ValueError('Maximum content length exceeded')
-				data = fp.read(read)
-			else:
-				data = b''
-		# read lines until end of part
-		lines = []
-		while True:
-			line = fp.readline()
-			if not line:
-				terminator = lastpart
-				break
-			if line.startswith(b'--'):
-				terminator = line.rstrip()
-				if terminator in (nextpart, lastpart):
-					break
-			lines.append(line)
-		# done with part
-		if data is None:
-			continue
-		if read < 0:
-			if lines:
-				# strip final line terminator
-				line = lines[-1]
-				if line[-2:] == b'\r\n':
-					line = line[:-2]
-				elif line[-1:] == b'\n':
-					line = line[:-1]
-				lines[-1] = line
-				data = b''.join(lines)
+	last = parser.read_part(None) # preamble
+	parts = 0
+	while not last:
+		parts += 1
+		if parts > part_limit:
+			raise exceptions.HTTPException(413, 'too many parts in multipart form')
+		headers = parser.read_headers()
 		content_disposition = headers['content-disposition']
-		if not content_disposition:
-			continue
-		key, params = parse_header(content_disposition)
-		if key != 'form-data':
-			continue
-		if 'name' in params:
-			name = params['name']
+		if content_disposition:
+			key, params = parse_header(content_disposition)
 		else:
+			key, params = '', {}
+		name = params.get('name')
+		if key != 'form-data' or name is None:
+			last = parser.read_part(None)
 			continue
 
+		data: bytes | MultipartFile
 		if 'filename' in params:
-			assert isinstance(data, bytes)
-			data = MultipartFile(data, params['filename'])
+			f = tempfile.SpooledTemporaryFile(max_size=spool_size)
+			last = parser.read_part(f.write)
+			size = f.tell()
+			f.seek(0)
+			data = MultipartFile(typing.cast(typing.BinaryIO, f), params['filename'], size, size <= spool_size)
+		else:
+			buf = bytearray()
+			last = parser.read_part(buf.extend)
+			data = bytes(buf)
 		if name in partdict:
 			partdict[name].append(data)
 		else:
@@ -86,6 +75,108 @@ def parse_multipart(fp: io.BufferedIOBase, pdict: dict) -> dict[str, list[bytes
 
 	return partdict
 
+class _Parser:
+	def __init__(self, fp: io.BufferedIOBase, boundary: bytes, length: int | None, max_size: int) -> None:
+		self.fp = fp
+		self.delimiter = b'\n--' + boundary
+		self.remaining = length
+		self.max_size = max_size
+		self.size = 0
+		self.buf = bytearray(b'\n') # so that a boundary at the very start of the body is found
+
+	def fill(self) -> bool:
+		""" append the next chunk of the body to the buffer. returns False at the end of the body """
+		size = chunk_size
+		if self.remaining is not None:
+			size = min(size, self.remaining)
+			if size <= 0:
+				return False
+		chunk = self.fp.read(size)
+		if not chunk:
+			return False
+		if self.remaining is not None:
+			self.remaining -= len(chunk)
+		self.size += len(chunk)
+		if self.size > self.max_size:
+			raise exceptions.HTTPException(413, 'multipart body too large')
+		self.buf += chunk
+		return True
+
+	def read_part(self, write: typing.Callable[[bytearray], typing.Any] | None) -> bool:
+		"""
+		pass everything up to the next boundary to ``write`` (or discard it if ``write`` is None)
+		and consume the boundary line. returns True if that was the closing boundary or the body
+		ended without one
+		"""
+		buf = self.buf
+		delimiter_len = len(self.delimiter)
+		start = 0
+		while True:
+			idx = buf.find(self.delimiter, start)
+			if idx == -1:
+				# keep enough to match a delimiter split across chunks, plus the \r before it
+				flush = len(buf) - delimiter_len - 1
+				if flush > 0:
+					if write is not None:
+						write(buf[:flush])
+					del buf[:flush]
+				start = 0
+				if not self.fill():
+					self._write_end(write, len(buf))
+					return True
+				continue
+
+			after = idx + delimiter_len
+			if buf[after:after + 2] == b'--':
+				self._write_end(write, idx)
+				buf.clear()
+				return True
+			newline = buf.find(b'\n', after)
+			if newline == -1:
+				if len(buf) - after <= max_header_size and self.fill():
+					continue
+				newline = len(buf) # the boundary line runs to the end of the body
+			if buf[after:newline].strip():
+				start = idx + 1 # looks like our boundary but continues into other text
+				continue
+			self._write_end(write, idx)
+			del buf[:newline + 1]
+			return False
+
+	def _write_end(self, write: typing.Callable[[bytearray], typing.Any] | None, end: int) -> None:
+		if write is None:
+			return
+		if self.buf[end - 1:end] == b'\r':
+			end -= 1
+		if end > 0:
+			write(self.buf[:end])
+
+	def read_headers(self) -> email.message.Message:
+		buf = self.buf
+		while True:
+			if buf[:1] == b'\n':
+				end = 1
+				break
+			if buf[:2] == b'\r\n':
+				end = 2
+				break
+			crlf = buf.find(b'\n\r\n')
+			lf = buf.find(b'\n\n')
+			if crlf != -1 and (lf == -1 or crlf < lf):
+				end = crlf + 3
+				break
+			if lf != -1:
+				end = lf + 2
+				break
+			if len(buf) > max_header_size:
+				raise exceptions.HTTPException(413, 'multipart headers too large')
+			if not self.fill():
+				end = len(buf)
+				break
+		headers = http.client.parse_headers(io.BytesIO(bytes(buf[:end])))
+		del buf[:end]
+		return headers
+
 def parse_header(line: str) -> tuple[str, dict[str, str]]:
 	"""Parse a Content-type like header.
 
@@ -121,12 +212,45 @@ class MultipartFile:
 	"""
 		instance attrs:
 
-		* ``data`` - a bytes
+		* ``file`` - a binary file object holding the upload, positioned at its start. small uploads
+		  are held in memory and bigger ones are spooled to a temporary file (see ``spool_size``)
 		* ``filename`` - a str
+		* ``size`` - the length of the upload in bytes, or ``None`` if it isn't known
+		* ``in_memory`` - whether ``file`` is held in memory rather than on disk
+
+		``data`` returns the whole upload as bytes (reading all of ``file`` each time). assigning
+		bytes to it replaces ``file`` with an in-memory one holding them
 	"""
-	def __init__(self, data: bytes, filename: str) -> None:
-		self.data = data
+	def __init__(self, file: bytes | typing.BinaryIO, filename: str, size: int | None=None,
+			in_memory: bool | None=None) -> None:
+		if isinstance(file, bytes):
+			size = len(file)
+			in_memory = True
+			file = io.BytesIO(file)
+		elif isinstance(file, io.BytesIO):
+			if size is None:
+				size = file.getbuffer().nbytes
+			in_memory = True
+		elif in_memory is None:
+			in_memory = False
+		self.file = file
 		self.filename = filename
+		self.size = size
+		self.in_memory = in_memory
+
+	@property
+	def data(self) -> bytes:
+		self.file.seek(0)
+		data = self.file.read()
+		self.file.seek(0)
+		return data
+
+	@data.setter
+	def data(self, data: bytes) -> None:
+		self.file.close()
+		self.file = io.BytesIO(data)
+		self.size = len(data)
+		self.in_memory = True
 
 	def __repr__(self) -> str:
-		return '%s(%r, %r)' % (self.__class__.__name__, self.data, self.filename)
+		return '%s(%r, %r)' % (self.__class__.__name__, self.file, self.filename)
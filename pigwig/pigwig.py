@@ -1,21 +1,35 @@
 from __future__ import annotations
 
+import concurrent.futures
 import copy
+import datetime
+import email.utils
+import functools
 import http.client
-import http.cookies
-import json
+import socketserver
 import sys
 import textwrap
+import time
 import traceback
-import urllib.parse
 import wsgiref.simple_server
-from inspect import isgenerator
-from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping, MutableMapping, TextIO, cast
-
-from . import exceptions, multipart
-from .request_response import HTTPHeaders, Request, Response
+import zlib
+from inspect import isasyncgen, isgenerator
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterable, Iterator, Mapping, TextIO, cast
+
+from . import asgi, exceptions, multipart
+from .compression import Compression
+from .json_codec import JSONCodec
+from .memory import MemoryTracker
+from .metrics import Metrics
+from .profiling import Profiler
+from .request_response import NO_JSON, BoundedReader, Request, Response, parse_qs
+from .response_cache import ResponseCache
 from .routes import build_route_tree
+from .server import ThreadedServer
+from .static import file_chunks
 from .templates_jinja import JinjaTemplateEngine
+from .timing import Timing
+from .watchdog import Watchdog
 
 if TYPE_CHECKING:
 	import io
@@ -38,12 +52,17 @@ ExceptionHandler = Callable[[Exception, TextIO, Request, 'PigWig'], Response]
 class PigWig:
 	"""
 		main WSGI entrypoint. this is a class but defines a :func:`.__call__` so instances of it can
-		be passed directly to WSGI servers.
+		be passed directly to WSGI servers. responses with a ``bytes`` (or ``str``) body get a
+		``Content-Length``.
 
 		:type routes: list or function
 		:param routes: a list of 3-tuples: ``(method, path, handler)`` or a function that returns
-		  such a list
-		    * ``method`` is the HTTP method/verb (``GET``, ``POST``, etc.)
+		  such a list. a tuple may have a fourth item, a dict of per-route options:
+		  ``max_body_size`` and ``max_multipart_parts`` (override the app-wide ones), ``cache`` and
+		  ``cache_vary`` (see :class:`.response_cache.ResponseCache`)
+		    * ``method`` is the HTTP method/verb (``GET``, ``POST``, etc.). ``HEAD`` requests without a
+		      ``HEAD`` route go to the ``GET`` handler. either way, the body is dropped (generator
+		      bodies are closed without being iterated) and only the headers are sent
 		    * ``path`` can either be a static path (``/foo/bar``) or have params (``/post/<id>``).
 		      params can be prefixed with ``path:`` to eat up the rest of the path
 		      (``/tree/<path:subdir>`` matches ``/tree/a/b/c``). params are passed to the handler as
@@ -61,8 +80,10 @@ class PigWig:
 		  will be relative to the current working directory.
 
 		:param template_engine: a class that takes a ``template_dir`` in the constructor and has a
-		  ``.stream`` method that takes ``template_name, context`` as arguments (passed from user
-		  code - for jinja2, context is a dictionary)
+		  ``.render`` method that takes ``template_name, context`` as arguments (passed from user
+		  code - for jinja2, context is a dictionary) and returns a ``str``. to support
+		  ``Response.render(..., stream=True)``, it also needs a ``.stream`` method taking the same
+		  arguments and returning a generator of ``bytes``
 
 		:type cookie_secret: str
 		:param cookie_secret: app-wide secret used for signing secure cookies. see
@@ -83,6 +104,67 @@ class PigWig:
 		  back to the WSGI server. it will be passed a request and response. be careful: raising an
 		  exception here is very bad.
 
+		:type route_cache_size: int
+		:param route_cache_size: if non-zero, remember this many routing results (including 404s
+		  and 405s) keyed on ``(method, path)`` so repeated requests skip walking the route tree.
+		  hit/miss counters are on ``routes.cache``
+
+		:type max_body_size: int
+		:param max_body_size: if not ``None``, the most bytes of request body that will be read.
+		  a bigger ``Content-Length`` gets a 413 before any of the body is read, and bodies without
+		  a ``Content-Length`` get a 413 as soon as they go over. ``multipart/form-data`` bodies are
+		  held to it too, or to :data:`.multipart.maxlen` if it's ``None``
+
+		:type max_multipart_parts: int
+		:param max_multipart_parts: if not ``None``, the most parts a ``multipart/form-data`` body
+		  may have before it gets a 413. defaults to :data:`.multipart.max_parts`
+
+		:type json_codec: :class:`.json_codec.JSONCodec`
+		:param json_codec: if not ``None``, decodes ``application/json`` request bodies and encodes
+		  :func:`Response.json` bodies in place of :attr:`Response.json_encoder`. ``JSONCodec()``
+		  produces compact JSON, encoding small objects in one shot with the C accelerator and
+		  streaming only big ones. subclass it to use a different JSON library
+
+		:type etags: bool
+		:param etags: if true, 200 responses to ``GET`` and ``HEAD`` with a ``str`` or ``bytes`` body
+		  (or a JSON body that ``json_codec`` encodes in one piece) and no ``etag`` of their own get a
+		  weak ETag from a CRC-32 of the body. a matching ``If-None-Match`` gets an empty 304. see
+		  :class:`.Response`'s ``etag`` and ``last_modified`` for validating streamed bodies
+
+		:type compression: :class:`.compression.Compression`
+		:param compression: if not ``None``, response bodies are gzipped or deflated for clients that
+		  send a matching ``Accept-Encoding``
+
+		:type asgi_threads: int
+		:param asgi_threads: the most threads :func:`asgi` runs plain (non-``async``) handlers in.
+		  ``None`` uses the ``concurrent.futures.ThreadPoolExecutor`` default
+
+		:type metrics: :class:`.metrics.Metrics`
+		:param metrics: if not ``None``, every request's route, status, size, and duration are
+		  recorded here
+
+		:type server_timing: bool
+		:param server_timing: if true, each request's :class:`.timing.Timing` spans (``request.timing``)
+		  are sent in a ``Server-Timing`` header. browsers show these in their developer tools
+
+		:param timing_handler: if not ``None``, a function that will be passed the request and its
+		  :class:`.timing.Timing` once the response's headers are ready, for logging slow phases.
+		  with neither this nor ``server_timing``, timing costs next to nothing
+
+		:type profiler: :class:`.profiling.Profiler`
+		:param profiler: if not ``None``, profiles a sample of requests' handlers
+
+		:type watchdog: :class:`.watchdog.Watchdog`
+		:param watchdog: if not ``None``, samples the stacks of requests that run too long
+
+		:type memory_tracker: :class:`.memory.MemoryTracker`
+		:param memory_tracker: if not ``None``, tracks the allocations of a sample of requests' handlers
+		  and the size of their parsed request bodies
+
+		:type response_cache: :class:`.response_cache.ResponseCache`
+		:param response_cache: where responses of routes with a ``cache`` option are stored. if
+		  ``None``, a ``ResponseCache()`` with default limits is used
+
 		has the following instance attrs:
 
 		* ``routes`` - an internal representation of the route tree - not the list passed to the
@@ -91,16 +173,36 @@ class PigWig:
 		* ``cookie_secret``
 		* ``http_exception_handler``
 		* ``exception_handler``
+		* ``max_body_size``
+		* ``max_multipart_parts``
+		* ``json_codec``
+		* ``response_cache``
+		* ``etags``
+		* ``compression``
+		* ``asgi_threads``
+		* ``metrics``
+		* ``server_timing``
+		* ``timing_handler``
+		* ``profiler``
+		* ``watchdog``
+		* ``memory_tracker``
 	"""
 
 	def __init__(self, routes: RouteDefinition | Callable[[], RouteDefinition], template_dir: str | None=None,
 			template_engine: type=JinjaTemplateEngine, cookie_secret: bytes | None=None,
 			http_exception_handler: HTTPExceptionHandler=default_http_exception_handler,
 			exception_handler: ExceptionHandler=default_exception_handler,
-			response_done_handler: Callable[[Request, Response], Any] | None=None) -> None:
+			response_done_handler: Callable[[Request, Response], Any] | None=None,
+			route_cache_size: int=0, max_body_size: int | None=None, json_codec: JSONCodec | None=None,
+			response_cache: ResponseCache | None=None, etags: bool=True,
+			compression: Compression | None=None, asgi_threads: int | None=None,
+			metrics: Metrics | None=None, server_timing: bool=False,
+			timing_handler: Callable[[Request, Timing], Any] | None=None, profiler: Profiler | None=None,
+			watchdog: Watchdog | None=None, memory_tracker: MemoryTracker | None=None,
+			max_multipart_parts: int | None=None) -> None:
 		if callable(routes):
 			routes = routes()
-		self.routes = build_route_tree(routes)
+		self.routes = build_route_tree(routes, route_cache_size)
 
 		if template_dir:
 			self.template_engine = template_engine(template_dir)
@@ -111,93 +213,307 @@ class PigWig:
 		self.http_exception_handler = http_exception_handler
 		self.exception_handler = exception_handler
 		self.response_done_handler = response_done_handler
+		self.max_body_size = max_body_size
+		self.max_multipart_parts = max_multipart_parts
+		self.json_codec = json_codec
+		if json_codec is not None:
+			self.content_handlers = {**self.content_handlers, 'application/json': json_codec.handle_json}
+		if response_cache is None:
+			response_cache = ResponseCache()
+		self.response_cache = response_cache
+		self.etags = etags
+		self.compression = compression
+		self.asgi_threads = asgi_threads
+		self.metrics = metrics
+		self.server_timing = server_timing
+		self.timing_handler = timing_handler
+		self.profiler = profiler
+		self.watchdog = watchdog
+		self.memory_tracker = memory_tracker
+		self._executor: concurrent.futures.ThreadPoolExecutor | None = None
 
 	def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
 		""" main WSGI entrypoint """
+		start = time.perf_counter()
 		errors = cast(TextIO, environ.get('wsgi.errors', sys.stderr))
 		try:
 			if environ['REQUEST_METHOD'] == 'OPTIONS':
 				start_response('200 OK', copy.copy(Response.DEFAULT_HEADERS))
 				return []
 
-			request, err = self.build_request(environ)
-			try:
-				try:
-					if err:
-						raise err
-
-					handler, kwargs = self.routes.route(request.method, request.path)
-					response = handler(request, **kwargs)
-				except exceptions.HTTPException as e:
-					response = self.http_exception_handler(e, errors, request, self)
-			except Exception as e: # something went wrong in handler or http_exception_handler
-				response = self.exception_handler(e, errors, request, self)
-
-			if isinstance(response.body, str):
-				response.body = [response.body.encode('utf-8')]
+			request = self.build_request(environ)
+			if self.watchdog is not None:
+				self.watchdog.begin(request)
+			if self.server_timing or self.timing_handler is not None:
+				request.timing = Timing()
+			encoding = self._negotiate(request)
+			response, cache_ttl = self._handle(request, errors, encoding)
+			self._finish(request, response, cache_ttl, encoding)
+			if request.timing.enabled:
+				self._report_timing(request, response)
+
+			body: Iterable[bytes]
+			if request.method == 'HEAD':
+				close = getattr(response.body, 'close', None)
+				if close is not None:
+					close()
+				body = []
 			elif isinstance(response.body, bytes):
-				response.body = [response.body]
-			elif response.body is None:
-				response.body = []
-			elif not isgenerator(response.body):
-				raise Exception('unhandled view response type: %s' % type(response.body))
-
+				body = [response.body]
+			elif hasattr(response.body, 'read'):
+				file_wrapper = environ.get('wsgi.file_wrapper')
+				if file_wrapper is not None:
+					body = file_wrapper(response.body, Response.file_chunk_size)
+				else:
+					body = file_chunks(cast(BinaryIO, response.body))
+			elif isasyncgen(response.body):
+				raise Exception('async generator bodies need the ASGI entrypoint')
+			else:
+				body = cast(Iterator[bytes], response.body)
+			uploads = request.uploads()
+			if uploads:
+				body = _close_uploads(body, uploads)
+			if self.metrics is not None:
+				body = self.metrics.wrap(body, request, response, start)
 			status_line = '%d %s' % (response.code, http.client.responses[response.code])
 			start_response(status_line, response.headers)
 			if self.response_done_handler:
 				self.response_done_handler(request, response)
-			return response.body
+			return body
 		except Exception: # something went very wrong handling OPTIONS, in error handling, or in sending the response
 			errors.write(traceback.format_exc())
 			start_response('500 Internal Server Error', [])
 			return [b'internal server error']
+		finally:
+			if self.watchdog is not None:
+				self.watchdog.end()
+
+	async def asgi(self, scope: dict, receive: Callable, send: Callable) -> None:
+		"""
+		main ASGI entrypoint. pass ``app.asgi`` to an ASGI server (``uvicorn module:app.asgi``).
+		routing, the response cache, conditional requests, compression, and the exception handlers
+		all work the same as under WSGI.
+
+		handlers may be ``async def``; they run on the event loop. other handlers run in a pool of
+		``asgi_threads`` threads so they don't block it. the request body is read in full (spooling
+		big ones to a temporary file) before the handler runs. bodies may also be async generators,
+		and plain generator and file bodies are read in the thread pool.
+		"""
+		await asgi.handle(self, scope, receive, send)
 
-	def build_request(self, environ: dict) -> tuple[Request, Exception | None]:
-		""" builds :class:`.Response` objects. for internal use. """
+	def _negotiate(self, request: Request) -> str | None:
+		""" the content encoding to compress the response with, if any """
+		if self.compression is None:
+			return None
+		return self.compression.negotiate(request.wsgi_environ.get('HTTP_ACCEPT_ENCODING'))
+
+	def _handle(self, request: Request, errors: TextIO, encoding: str | None=None) -> tuple[Response, float | None]:
+		"""
+		route the request and run its handler (or the exception handlers), or take the response
+		from the response cache. returns the response and, if it was freshly generated and should
+		be added to the response cache, its ttl
+		"""
+		try:
+			try:
+				response, kwargs, cache_ttl = self._dispatch(request, encoding)
+				if response is None:
+					assert request.route is not None
+					self._limit_body(request)
+					with request.timing.span('handler'):
+						if self.memory_tracker is not None and self.memory_tracker.sample(request):
+							call = functools.partial(self._call_handler, request, kwargs)
+							response = self.memory_tracker.run(request, call)
+						else:
+							response = self._call_handler(request, kwargs)
+				return response, cache_ttl
+			except exceptions.HTTPException as e:
+				return self.http_exception_handler(e, errors, request, self), None
+		except Exception as e: # something went wrong in handler or http_exception_handler
+			return self.exception_handler(e, errors, request, self), None
+
+	def _limit_body(self, request: Request) -> None:
+		"""
+		enforce the route's ``max_body_size`` before the handler runs, however it reads the body: a
+		bigger ``Content-Length`` raises a 413 and a body without one is wrapped in a reader that
+		raises once it goes over
+		"""
+		assert request.route is not None
+		max_body_size = request.route.options.get('max_body_size', self.max_body_size)
+		if max_body_size is None:
+			return
+		environ = request.wsgi_environ
+		content_length = environ.get('CONTENT_LENGTH')
+		if not content_length:
+			environ['wsgi.input'] = BoundedReader(environ['wsgi.input'], max_body_size)
+			return
+		try:
+			if int(content_length) > max_body_size:
+				raise exceptions.HTTPException(413, 'request body too large')
+		except ValueError:
+			raise exceptions.HTTPException(400, 'invalid Content-Length: %r' % content_length) from None
+
+	def _call_handler(self, request: Request, kwargs: dict) -> Response:
+		assert request.route is not None
+		if self.profiler is not None and self.profiler.sample(request):
+			return self.profiler.run(request, request.route.handler, kwargs)
+		return request.route.handler(request, **kwargs)
+
+	def _dispatch(self, request: Request, encoding: str | None) -> tuple[Response | None, dict, float | None]:
+		"""
+		route the request. returns a response from the response cache (preferably its ``encoding``
+		variant) or ``None`` and the kwargs to call the handler with, and the ttl to store the
+		handler's response with
+		"""
+		with request.timing.span('route'):
+			request.route, kwargs = self.routes.match(request.method, request.path)
+			cache_ttl = request.route.options.get('cache')
+			if cache_ttl is None or request.method not in ('GET', 'HEAD'):
+				return None, kwargs, None
+			response = None
+			if encoding is not None:
+				response = self.response_cache.get(request, encoding)
+			if response is None:
+				response = self.response_cache.get(request)
+			if response is not None:
+				return response, kwargs, None
+		if request.method == 'HEAD': # storing it would mean reading a body that isn't sent
+			cache_ttl = None
+		return None, kwargs, cache_ttl
+
+	def _finish(self, request: Request, response: Response, cache_ttl: float | None, encoding: str | None) -> None:
+		"""
+		everything between the handler and sending the response: conditional requests,
+		serialization, storing in the response cache, compression, and headers
+		"""
+		validate = request.method in ('GET', 'HEAD') and response.code == 200
+		# with a validator from the handler (or the response cache), a 304 skips serialization
+		not_modified = False
+		if validate and (response.etag is not None or response.last_modified is not None):
+			validate = False
+			not_modified = self._not_modified(request, response)
+		if not not_modified:
+			with request.timing.span('serialize'):
+				self._serialize(response)
+			store = cache_ttl is not None and response.code == 200 and \
+					not any(header == 'Set-Cookie' for header, _ in response.headers)
+			if store and hasattr(response.body, 'read'):
+				with cast(BinaryIO, response.body) as f:
+					response.body = f.read()
+			elif store and not isinstance(response.body, bytes):
+				response.body = b''.join(cast(Iterator[bytes], response.body))
+			if validate and self.etags and isinstance(response.body, bytes):
+				response.etag = 'W/"%x-%x"' % (len(response.body), zlib.crc32(response.body))
+			if store:
+				assert cache_ttl is not None
+				self.response_cache.set(request, response, cache_ttl)
+			if validate:
+				self._not_modified(request, response)
+			# HEAD is compressed too so that its headers (including Content-Length) match GET's
+			if self.compression is not None and self.compression.compressible(response):
+				response.headers.append(('Vary', 'Accept-Encoding'))
+				if encoding is not None:
+					self._compress(request, response, encoding)
+		if response.etag is not None:
+			response.headers.append(('ETag', response.etag))
+		if response.last_modified is not None:
+			response.headers.append(('Last-Modified', response.last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT')))
+
+		if isinstance(response.body, bytes) and response.code not in (204, 304) and \
+				not any(header == 'Content-Length' for header, _ in response.headers):
+			response.headers.append(('Content-Length', str(len(response.body))))
+
+	def _serialize(self, response: Response) -> None:
+		""" turn the body into ``bytes``, a (possibly async) generator of ``bytes``, or a file """
+		if self.json_codec is not None and response.json_obj is not NO_JSON:
+			response.body = self.json_codec.encode(response.json_obj)
+
+		if isinstance(response.body, str):
+			response.body = response.body.encode('utf-8')
+		elif response.body is None:
+			response.body = b''
+		elif not isinstance(response.body, bytes) and not isgenerator(response.body) and \
+				not isasyncgen(response.body) and not hasattr(response.body, 'read'):
+			raise Exception('unhandled view response type: %s' % type(response.body))
+
+	def _report_timing(self, request: Request, response: Response) -> None:
+		timing = request.timing
+		timing.add('total', time.perf_counter_ns() - timing.start)
+		if self.server_timing:
+			response.headers.append(('Server-Timing', timing.header()))
+		if self.timing_handler is not None:
+			self.timing_handler(request, timing)
+
+	def _compress(self, request: Request, response: Response, encoding: str) -> None:
+		""" compress the response, storing the compressed variant if the route's responses are cached """
+		assert self.compression is not None
+		with request.timing.span('compress'):
+			self.compression.compress(response, encoding)
+		if request.route is None or request.method != 'GET' or response.code != 200 or \
+				not isinstance(response.body, bytes):
+			return
+		cache_ttl = request.route.options.get('cache')
+		if cache_ttl is not None and not any(header == 'Set-Cookie' for header, _ in response.headers):
+			self.response_cache.set(request, response, cache_ttl, encoding)
+
+	@staticmethod
+	def _not_modified(request: Request, response: Response) -> bool:
+		"""
+		if the request's ``If-None-Match`` (or, without one, ``If-Modified-Since``) matches the
+		response's validators, turn it into an empty 304 and return True
+		"""
+		if_none_match = request.wsgi_environ.get('HTTP_IF_NONE_MATCH')
+		if if_none_match is not None:
+			if response.etag is None:
+				return False
+			etag = _strip_weak(response.etag)
+			matched = any(tag == '*' or _strip_weak(tag) == etag
+					for tag in (t.strip() for t in if_none_match.split(',')))
+		else:
+			if_modified_since = request.wsgi_environ.get('HTTP_IF_MODIFIED_SINCE')
+			if if_modified_since is None or response.last_modified is None:
+				return False
+			try:
+				since = email.utils.parsedate_to_datetime(if_modified_since)
+			except (TypeError, ValueError):
+				return False
+			last_modified = response.last_modified
+			if last_modified.tzinfo is None:
+				last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+			if since.tzinfo is None:
+				since = since.replace(tzinfo=datetime.timezone.utc)
+			matched = last_modified.replace(microsecond=0) <= since
+		if not matched:
+			return False
+
+		close = getattr(response.body, 'close', None)
+		if close is not None:
+			close()
+		response.code = 304
+		response.body = b''
+		response.headers = [(k, v) for k, v in response.headers if k not in ('Content-Length', 'Content-Type')]
+		return True
+
+	def build_request(self, environ: dict) -> Request:
+		"""
+		builds :class:`.Request` objects. for internal use. the query string, headers, cookies, and
+		body are parsed lazily by the :class:`.Request`
+		"""
 		method = environ['REQUEST_METHOD']
 		path = environ['PATH_INFO'].encode('latin-1').decode('utf-8') # https://github.com/python/cpython/issues/60883
-		query: Mapping[str, list[str] | str] = {}
-		headers = HTTPHeaders()
-		cookies = http.cookies.SimpleCookie()
-		body = {}
-		err = None
+		return Request(self, method, path, wsgi_environ=environ)
 
-		try:
-			qs = environ.get('QUERY_STRING')
-			if qs:
-				query = parse_qs(qs)
-
-			content_length_str: str | None = environ.get('CONTENT_LENGTH')
-			if content_length_str:
-				headers['Content-Length'] = content_length_str
-				content_length = int(content_length_str)
-			else:
-				content_length = None
-			content_type = environ.get('CONTENT_TYPE')
-			if content_type:
-				headers['Content-Type'] = content_type
-				media_type, params = multipart.parse_header(content_type)
-				handler = self.content_handlers.get(media_type)
-				if handler:
-					body = handler(environ['wsgi.input'], content_length, params)
-
-			http_cookie = environ.get('HTTP_COOKIE')
-			if http_cookie:
-				cookies.load(http_cookie)
-
-			for key, val in environ.items():
-				if key.startswith('HTTP_'):
-					headers[key[5:].replace('_', '-')] = val
-		except Exception as e:
-			err = e
-
-		return Request(self, method, path, query, headers, body, cookies, environ), err
-
-	def main(self, host: str='0.0.0.0', port: int | None=None) -> None:
+	def main(self, host: str='0.0.0.0', port: int | None=None, threads: int=0, idle_timeout: float=5.0,
+			request_timeout: float=30.0) -> None:
 		"""
 		sets up the autoreloader and runs a
 		`wsgiref.simple_server <https://docs.python.org/3/library/wsgiref.html#module-wsgiref.simple_server>`_.
 		useful for development.
+
+		:type threads: int
+		:param threads: if non-zero, run a :class:`.server.ThreadedServer` with this many threads
+		  instead. it keeps connections alive (closing them after ``idle_timeout`` seconds without a
+		  request) and drops clients that stall for ``request_timeout`` seconds, so it's also fine
+		  for load testing and light production use
 		"""
 
 		have_reloader = True
@@ -222,10 +538,37 @@ class PigWig:
 			port = 8000
 			if len(sys.argv) == 2:
 				port = int(sys.argv[1])
-		server = wsgiref.simple_server.make_server(host, port, self)
+		server: socketserver.BaseServer
+		if threads:
+			server = ThreadedServer((host, port), self, threads, idle_timeout, request_timeout)
+		else:
+			server = wsgiref.simple_server.make_server(host, port, self)
 		print('listening on', port)
 		server.serve_forever()
 
+	def serve(self, host: str='0.0.0.0', port: int=8000, workers: int | None=None, max_requests: int=0,
+			reuse_port: bool=False, graceful_timeout: float=30.0) -> None:
+		"""
+		runs a prefork server for production use (unix only). the app is already loaded, so the
+		workers share its memory; forking happens after a ``gc.freeze()`` to keep it shared. crashed
+		workers are restarted. on ``SIGTERM`` or ``SIGINT``, the workers finish the request they're
+		on and exit.
+
+		:type workers: int
+		:param workers: how many worker processes to fork. defaults to the number of CPUs
+		:type max_requests: int
+		:param max_requests: if non-zero, a worker exits and is replaced after serving this many
+		  requests, which bounds how much memory a leak can use
+		:type reuse_port: bool
+		:param reuse_port: if true, each worker binds its own ``SO_REUSEPORT`` socket so the kernel
+		  spreads connections among them. otherwise, they all accept on one socket bound before forking
+		:type graceful_timeout: float
+		:param graceful_timeout: how many seconds workers get to exit after being told to stop
+		  before they are killed
+		"""
+		from . import prefork
+		prefork.serve(self, host, port, workers, max_requests, reuse_port, graceful_timeout)
+
 	@staticmethod
 	def handle_urlencoded(body: io.BufferedIOBase, length: int | None,
 			params: dict[str, str]) -> Mapping[str, str | list[str]]:
@@ -236,16 +579,14 @@ class PigWig:
 
 	@staticmethod
 	def handle_json(body: io.BufferedIOBase, length: int | None, params: dict[str, str]) -> Any:
-		if length is None:
-			length = -1
-		charset = params.get('charset', 'utf-8')
-		return json.loads(body.read(length).decode(charset))
+		return _default_json_codec.handle_json(body, length, params)
 
 	@staticmethod
-	def handle_multipart(body: io.BufferedIOBase,
-				length: int | None, params: dict[str, Any]) -> dict[str, list[bytes | multipart.MultipartFile]]:
+	def handle_multipart(body: io.BufferedIOBase, length: int | None, params: dict[str, Any],
+			max_size: int | None=None, part_limit: int | None=None) -> dict[str, list[bytes | multipart.MultipartFile]]:
+		""" ``max_size`` and ``part_limit`` are passed to :func:`.multipart.parse_multipart` """
 		params['boundary'] = params['boundary'].encode()
-		form = multipart.parse_multipart(body, params)
+		form = multipart.parse_multipart(body, params, length, max_size, part_limit)
 		for k, v in form.items():
 			if len(v) == 1:
 				form[k] = v[0] # type: ignore[assignment]
@@ -253,26 +594,38 @@ class PigWig:
 
 	content_handlers: dict[str, Callable[[io.BufferedIOBase, int | None, dict[str, str]], Any]]
 
+_default_json_codec = JSONCodec()
+
 PigWig.content_handlers = {
 	'application/json': PigWig.handle_json,
 	'application/x-www-form-urlencoded': PigWig.handle_urlencoded,
 	'multipart/form-data': PigWig.handle_multipart,
 }
 
-def parse_qs(qs: str) -> Mapping[str, str | list[str]]:
-	if not qs:
-		return {}
-	try:
-		parsed: MutableMapping[str, Any] = urllib.parse.parse_qs(qs,
-				keep_blank_values=True, strict_parsing=True, errors='strict')
-	except UnicodeDecodeError as e:
-		qs_trunc = qs
-		if len(qs_trunc) > 24:
-			qs_trunc = qs_trunc[:24] + '...'
-		raise exceptions.HTTPException(400, '%s\n%r' % (e, qs_trunc)) # "'utf-8' codec can't decode byte ..."
-	except ValueError as e:
-		raise exceptions.HTTPException(400, e.args[0]) # "bad query field: ..."
-	for k, v in parsed.items():
-		if len(v) == 1:
-			parsed[k] = v[0]
-	return parsed
+def _close_uploads(body: Iterable[bytes], uploads: list[multipart.MultipartFile]) -> Iterable[bytes]:
+	""" return ``body`` set up to close the files of ``uploads`` when the server closes it """
+	close = getattr(body, 'close', None)
+	def close_all() -> None:
+		try:
+			if close is not None:
+				close()
+		finally:
+			for upload in uploads:
+				upload.file.close()
+	if hasattr(body, 'filelike'): # a wsgi.file_wrapper; keep it so the server can still sendfile it
+		body.close = close_all # type: ignore[attr-defined]
+		return body
+	return _ClosingBody(body, close_all)
+
+class _ClosingBody:
+	def __init__(self, body: Iterable[bytes], close: Callable[[], None]) -> None:
+		self.body = body
+		self.close = close
+
+	def __iter__(self) -> Iterator[bytes]:
+		return iter(self.body)
+
+def _strip_weak(etag: str) -> str:
+	if etag.startswith('W/'):
+		return etag[2:]
+	return etag
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+import typing
+import wsgiref.simple_server
+
+if typing.TYPE_CHECKING:
+	from .pigwig import PigWig
+
+def serve(app: PigWig, host: str='0.0.0.0', port: int=8000, workers: int | None=None, max_requests: int=0,
+		reuse_port: bool=False, graceful_timeout: float=30.0, backlog: int=1024) -> None:
+	""" see :func:`.PigWig.serve` """
+	if workers is None:
+		workers = os.cpu_count() or 1
+	sock = None
+	if not reuse_port:
+		sock = _listen(host, port, backlog, reuse_port=False)
+
+	# the workers share everything allocated so far. freezing it keeps the garbage collector from
+	# touching (and so copying) those pages in every worker
+	gc.collect()
+	if hasattr(gc, 'freeze'):
+		gc.freeze()
+
+	stopping = False
+	def stop(signum: int, frame: typing.Any) -> None:
+		nonlocal stopping
+		stopping = True
+	signal.signal(signal.SIGTERM, stop)
+	signal.signal(signal.SIGINT, stop)
+
+	children: dict[int, float] = {} # pid -> when it was started
+	def spawn() -> None:
+		pid = os.fork()
+		if pid == 0:
+			_worker(app, sock, host, port, backlog, max_requests)
+		children[pid] = time.monotonic()
+
+	print('listening on', port, 'with', workers, 'workers')
+	for _ in range(workers):
+		spawn()
+
+	deadline = None
+	while children:
+		if stopping and deadline is None:
+			deadline = time.monotonic() + graceful_timeout
+			for pid in children:
+				os.kill(pid, signal.SIGTERM)
+		elif deadline is not None and time.monotonic() > deadline:
+			for pid in children:
+				os.kill(pid, signal.SIGKILL)
+			deadline = float('inf')
+
+		pid, status = os.waitpid(-1, os.WNOHANG)
+		if pid == 0:
+			time.sleep(0.1)
+			continue
+		started = children.pop(pid, None)
+		if started is None or stopping:
+			continue
+		if os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0:
+			print('worker', pid, 'died with status', status, file=sys.stderr)
+			if time.monotonic() - started < 1: # don't spin if workers die on startup
+				time.sleep(1)
+		spawn()
+
+	if sock is not None:
+		sock.close()
+
+def _listen(host: str, port: int, backlog: int, reuse_port: bool) -> socket.socket:
+	sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	if reuse_port:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+	sock.bind((host, port))
+	sock.listen(backlog)
+	return sock
+
+def _worker(app: PigWig, sock: socket.socket | None, host: str, port: int, backlog: int,
+		max_requests: int) -> typing.NoReturn:
+	""" serve requests until told to stop or until ``max_requests`` have been served """
+	status = 0
+	try:
+		stopping = False
+		def stop(signum: int, frame: typing.Any) -> None:
+			nonlocal stopping
+			stopping = True
+		signal.signal(signal.SIGTERM, stop)
+		signal.signal(signal.SIGINT, signal.SIG_IGN) # the master turns ^C into a SIGTERM
+
+		if sock is None:
+			sock = _listen(host, port, backlog, reuse_port=True)
+		server = make_server(app, sock)
+		server.timeout = 0.5 # how often to check whether we've been told to stop
+		while not stopping and (not max_requests or server.requests < max_requests):
+			server.handle_request()
+		server.server_close()
+		if app.metrics is not None:
+			app.metrics.flush()
+	except BaseException:
+		traceback.print_exc()
+		status = 1
+	finally:
+		sys.stdout.flush()
+		sys.stderr.flush()
+		os._exit(status)
+
+class _WorkerServer(wsgiref.simple_server.WSGIServer):
+	""" a ``WSGIServer`` on an already listening socket that counts the requests it handles """
+
+	requests = 0
+
+	def finish_request(self, request: typing.Any, client_address: typing.Any) -> None:
+		self.requests += 1
+		super().finish_request(request, client_address)
+
+def make_server(app: PigWig, sock: socket.socket) -> _WorkerServer:
+	""" build the server a worker runs on its listening socket """
+	server = _WorkerServer(sock.getsockname()[:2], wsgiref.simple_server.WSGIRequestHandler,
+			bind_and_activate=False)
+	server.socket.close()
+	server.socket = sock
+	host, port = sock.getsockname()[:2]
+	server.server_name = socket.getfqdn(host)
+	server.server_port = port
+	server.setup_environ()
+	server.set_app(app)
+	return server
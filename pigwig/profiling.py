@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import itertools
+import marshal
+import os
+import pstats
+import re
+import signal
+import threading
+import typing
+
+from . import exceptions
+from .request_response import Response
+
+if typing.TYPE_CHECKING:
+	from .request_response import Request
+
+class Profiler:
+	"""
+	profiles a sample of a :class:`.PigWig` app's route handlers (see its ``profiler`` param) with
+	``cProfile`` and adds up the stats for each route template. only one request is profiled at a
+	time; requests that come up for sampling while another is being profiled run unprofiled. under
+	ASGI, only plain (non-``async``) handlers are profiled.
+
+	:type every: int
+	:param every: profile one in this many requests
+	:param routes: if not ``None``, only requests matching these route templates (``'/post/<id>'``)
+	  are sampled
+	:type enabled: bool
+	:param enabled: whether to start out profiling. see ``signum``
+	:type directory: str
+	:param directory: if not ``None``, where :func:`dump` writes a ``.pstats`` file per route
+	:type token: str
+	:param token: the secret :func:`handler` requires. if ``None``, the handler always refuses
+	:param signum: if not ``None``, a signal (like ``signal.SIGUSR2``) that toggles ``enabled``.
+	  turning profiling off also calls :func:`dump`. the profiler must be created on the main thread
+	"""
+
+	def __init__(self, every: int=100, routes: typing.Iterable[str] | None=None, enabled: bool=True,
+			directory: str | None=None, token: str | None=None, signum: int | None=None) -> None:
+		self.every = every
+		self.routes = frozenset(routes) if routes is not None else None
+		self.enabled = enabled
+		self.directory = directory
+		self.token = token
+		self.stats: dict[str, pstats.Stats] = {}
+		self.samples: dict[str, int] = {}
+		self._counter = itertools.count()
+		self._profiling = threading.Lock()
+		self._stats_lock = threading.Lock()
+		if signum is not None:
+			signal.signal(signum, self._toggle)
+
+	def sample(self, request: Request) -> bool:
+		""" whether to profile this request's handler """
+		if not self.enabled or request.route is None:
+			return False
+		if self.routes is not None and request.route.path not in self.routes:
+			return False
+		return next(self._counter) % self.every == 0
+
+	def run(self, request: Request, handler: typing.Callable[..., Response], kwargs: dict) -> Response:
+		""" call ``handler``, profiling it unless another request is being profiled """
+		if not self._profiling.acquire(blocking=False):
+			return handler(request, **kwargs)
+		try:
+			profile = cProfile.Profile()
+			try:
+				return profile.runcall(handler, request, **kwargs)
+			finally:
+				self._add(request, profile)
+		finally:
+			self._profiling.release()
+
+	def _add(self, request: Request, profile: cProfile.Profile) -> None:
+		assert request.route is not None
+		route = request.route.path
+		with self._stats_lock:
+			stats = self.stats.get(route)
+			if stats is None:
+				self.stats[route] = pstats.Stats(profile)
+			else:
+				stats.add(profile)
+			self.samples[route] = self.samples.get(route, 0) + 1
+
+	def dump(self) -> list[str]:
+		""" write each route's stats to ``directory``, returning the paths written """
+		if self.directory is None:
+			return []
+		paths = []
+		with self._stats_lock:
+			for route, stats in self.stats.items():
+				filename = re.sub(r'[^A-Za-z0-9_-]+', '_', route).strip('_') or 'root'
+				path = os.path.join(self.directory, '%s.%d.pstats' % (filename, os.getpid()))
+				stats.dump_stats(path)
+				paths.append(path)
+		return paths
+
+	def clear(self) -> None:
+		with self._stats_lock:
+			self.stats.clear()
+			self.samples.clear()
+
+	def _toggle(self, signum: int, frame: typing.Any) -> None:
+		self.enabled = not self.enabled
+		if not self.enabled:
+			# the signal can land while a sample's stats are being added, so dump from another thread
+			threading.Thread(target=self.dump, daemon=True).start()
+
+	def handler(self, request: Request) -> Response:
+		"""
+		a route handler showing the stats. it needs the ``token`` in a ``token`` query param or an
+		``Authorization: Bearer <token>`` header. params:
+
+		* ``route`` - only show this route template. required for ``format=pstats``
+		* ``sort`` - a ``pstats`` sort key (default ``cumulative``)
+		* ``limit`` - how many functions to show per route (default 30)
+		* ``format=pstats`` - download the route's stats as a ``.pstats`` file
+		"""
+		check_token(request, self.token)
+
+		route = request.query.get('route')
+		with self._stats_lock:
+			if request.query.get('format') == 'pstats':
+				stats = self.stats.get(route) if isinstance(route, str) else None
+				if stats is None:
+					raise exceptions.HTTPException(404, 'no stats for route %r' % route)
+				data = marshal.dumps(stats.stats) # type: ignore[attr-defined] # the same bytes dump_stats writes
+				return Response(data, content_type='application/octet-stream')
+
+			sort = request.query.get('sort', 'cumulative')
+			try:
+				limit = int(typing.cast(str, request.query.get('limit', '30')))
+			except ValueError:
+				raise exceptions.HTTPException(400, 'invalid limit') from None
+			out = io.StringIO()
+			for name, stats in sorted(self.stats.items()):
+				if route is not None and name != route:
+					continue
+				out.write('==== %s (%d samples) ====\n' % (name, self.samples[name]))
+				stats.stream = out # type: ignore[attr-defined]
+				try:
+					stats.sort_stats(typing.cast(str, sort)).print_stats(limit)
+				except KeyError:
+					raise exceptions.HTTPException(400, 'invalid sort: %r' % sort) from None
+		return Response(out.getvalue())
+
+def check_token(request: Request, token: str | None) -> None:
+	"""
+	raise a 403 :class:`.exceptions.HTTPException` unless the request has ``token`` in a ``token``
+	query param or an ``Authorization: Bearer <token>`` header. always raises if ``token`` is ``None``
+	"""
+	given = request.query.get('token')
+	authorization = request.headers.get('Authorization', '')
+	if authorization.startswith('Bearer '):
+		given = authorization[len('Bearer '):]
+	if token is None or not isinstance(given, str) or not hmac.compare_digest(given.encode(), token.encode()):
+		raise exceptions.HTTPException(403, 'forbidden')
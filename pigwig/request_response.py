@@ -1,19 +1,25 @@
 from __future__ import annotations
 
 import datetime
+import functools
 import hashlib
 import hmac
 import http.cookies
-import io
 import json as jsonlib
 import time
 import typing
-from collections import UserDict
+import urllib.parse
 
-from . import exceptions
+from . import exceptions, multipart
+from .json_codec import encode_chunks
+from .timing import NO_TIMING
 
 if typing.TYPE_CHECKING:
 	from .pigwig import PigWig
+	from .routes import Route
+
+_LAZY: typing.Any = object()
+NO_JSON: typing.Any = object()
 
 class Request:
 	"""
@@ -30,19 +36,118 @@ class Request:
 	  `http.cookies.SimpleCookie <https://docs.python.org/3/library/http.cookies.html#http.cookies.SimpleCookie>`_
 	* ``wsgi_environ`` - the raw `WSGI environ <https://www.python.org/dev/peps/pep-0333/#environ-variables>`_
 	  handed down from the server
+	* ``route`` - the :class:`.routes.Route` that matched, or ``None`` before routing or if none did
+	* ``timing`` - a :class:`.timing.Timing` to record spans in. it does nothing unless the app has
+	  ``server_timing`` or a ``timing_handler``
+
+	``query``, ``headers``, ``body``, and ``cookies`` are parsed from ``wsgi_environ`` the first time
+	they are accessed (unless passed to the constructor), so handlers only pay for what they use.
+	a malformed query string or body raises its :class:`.exceptions.HTTPException` at that point.
+	``body_parsed`` says whether ``body`` has been.
+
+	uploads in ``body`` (see :meth:`uploads`) are closed once the response has been sent, so read
+	them before then.
 	"""
 
-	def __init__(self, app: PigWig, method: str, path: str, query: typing.Mapping[str, str |  list[str]],
-				headers: HTTPHeaders, body: dict, cookies: http.cookies.BaseCookie,
-				wsgi_environ: dict[str, typing.Any]) -> None:
+	def __init__(self, app: PigWig, method: str, path: str,
+				query: typing.Mapping[str, str | list[str]]=_LAZY, headers: HTTPHeaders=_LAZY,
+				body: typing.Any=_LAZY, cookies: http.cookies.BaseCookie=_LAZY,
+				wsgi_environ: dict[str, typing.Any]=_LAZY) -> None:
 		self.app = app
 		self.method = method
 		self.path = path
-		self.query = query
-		self.headers = headers
-		self.body = body
-		self.cookies = cookies
+		self._query = query
+		self._headers = headers
+		self._body = body
+		self._cookies = cookies
 		self.wsgi_environ = wsgi_environ
+		self.route: Route | None = None
+		self.timing = NO_TIMING
+
+	@property
+	def query(self) -> typing.Mapping[str, str | list[str]]:
+		if self._query is _LAZY:
+			with self.timing.span('query'):
+				self._query = parse_qs(self.wsgi_environ.get('QUERY_STRING', ''))
+		return self._query
+
+	@query.setter
+	def query(self, query: typing.Mapping[str, str | list[str]]) -> None:
+		self._query = query
+
+	@property
+	def headers(self) -> HTTPHeaders:
+		if self._headers is _LAZY:
+			self._headers = HTTPHeaders.from_environ(self.wsgi_environ)
+		return self._headers
+
+	@headers.setter
+	def headers(self, headers: HTTPHeaders) -> None:
+		self._headers = headers
+
+	@property
+	def body(self) -> typing.Any:
+		if self._body is _LAZY:
+			with self.timing.span('body'):
+				self._body = self._parse_body()
+		return self._body
+
+	@body.setter
+	def body(self, body: typing.Any) -> None:
+		self._body = body
+
+	@property
+	def body_parsed(self) -> bool:
+		return self._body is not _LAZY
+
+	def uploads(self) -> list[multipart.MultipartFile]:
+		""" the :class:`.multipart.MultipartFile` values of ``body``, if it has been parsed """
+		if not self.body_parsed or not isinstance(self._body, dict):
+			return []
+		uploads = []
+		for value in self._body.values():
+			for item in value if isinstance(value, list) else [value]:
+				if isinstance(item, multipart.MultipartFile):
+					uploads.append(item)
+		return uploads
+
+	def _parse_body(self) -> typing.Any:
+		content_type = self.wsgi_environ.get('CONTENT_TYPE')
+		if not content_type:
+			return {}
+		media_type, params = multipart.parse_header(content_type)
+		handler = self.app.content_handlers.get(media_type)
+		if handler is None:
+			return {}
+		body = self.wsgi_environ['wsgi.input']
+		content_length_str = self.wsgi_environ.get('CONTENT_LENGTH')
+		content_length = None
+		if content_length_str:
+			try:
+				content_length = int(content_length_str)
+			except ValueError:
+				raise exceptions.HTTPException(400, 'invalid Content-Length: %r' % content_length_str)
+		if handler is self.app.handle_multipart: # the built-in one, so pass it the route's limits
+			options = self.route.options if self.route is not None else {}
+			return handler(body, content_length, params,
+					max_size=options.get('max_body_size', self.app.max_body_size),
+					part_limit=options.get('max_multipart_parts', self.app.max_multipart_parts))
+		return handler(body, content_length, params)
+
+	@property
+	def cookies(self) -> http.cookies.BaseCookie:
+		if self._cookies is _LAZY:
+			cookies: http.cookies.BaseCookie = http.cookies.SimpleCookie()
+			http_cookie = self.wsgi_environ.get('HTTP_COOKIE')
+			if http_cookie:
+				with self.timing.span('cookies'):
+					cookies.load(http_cookie)
+			self._cookies = cookies
+		return self._cookies
+
+	@cookies.setter
+	def cookies(self, cookies: http.cookies.BaseCookie) -> None:
+		self._cookies = cookies
 
 	def get_secure_cookie(self, key: str, max_time: datetime.timedelta) -> str | None:
 		"""
@@ -84,18 +189,32 @@ class Response:
 	  * if a ``str``, the response body is UTF-8 encoded
 	  * if a ``bytes``, the response body is sent as-is
 	  * if a generator, the response streams the yielded bytes
+	  * if a binary file object, the response is the rest of the file from its current position. it
+	    is sent with the server's ``wsgi.file_wrapper`` if it has one (which may ``sendfile`` it) or
+	    else read in :attr:`file_chunk_size` chunks, and closed afterwards. set a Content-Length
+	    yourself if you know it. see :func:`.static.static_handler`
 	:type code: int
 	:param code: HTTP status code; the "reason phrase" is generated automatically from
 	  `http.client.responses <https://docs.python.org/3/library/http.client.html#http.client.responses>`_
 	:param content_type: sets the Content-Type header
 	:param location: if not ``None``, sets the Location header. you must still specify a 3xx code
 	:param extra_headers: if not ``None``, an iterable of extra header 2-tuples to be sent
+	:param etag: if not ``None``, sent as the ETag header, quotes included (``'"v2"'`` or
+	  ``'W/"v2"'``). :class:`.PigWig` answers a matching ``If-None-Match`` with a 304 without
+	  encoding or iterating the body, so pass this when a cheap validator (a version number, a row's
+	  update time) is known before the body is built
+	:type last_modified: datetime.datetime
+	:param last_modified: if not ``None``, sent as the Last-Modified header and checked against
+	  ``If-Modified-Since`` the same way. naive datetimes are taken to be UTC
 
 	has the following instance attrs:
 
 	* ``code``
 	* ``body``
 	* ``headers`` - a list of 2-tuples
+	* ``json_obj`` - the object passed to :func:`json`, or ``request_response.NO_JSON``
+	* ``etag``
+	* ``last_modified``
 	'''
 
 	DEFAULT_HEADERS: typing.Sequence[tuple[str, str]] = (
@@ -104,13 +223,19 @@ class Response:
 	)
 
 	json_encoder = jsonlib.JSONEncoder(indent='\t')
+	json_chunk_size = 4096
+	file_chunk_size = 64 * 1024
 	simple_cookie = http.cookies.SimpleCookie()
 
-	def __init__(self, body: str | bytes | typing.Iterator[bytes] | None=None, code: int=200,
+	def __init__(self, body: str | bytes | typing.Iterator[bytes] | typing.BinaryIO | None=None, code: int=200,
 				content_type: str='text/plain', location: str | None=None,
-				extra_headers: list[tuple[str, str]] | None=None) -> None:
+				extra_headers: list[tuple[str, str]] | None=None, etag: str | None=None,
+				last_modified: datetime.datetime | None=None) -> None:
 		self.body = body
 		self.code = code
+		self.json_obj = NO_JSON
+		self.etag = etag
+		self.last_modified = last_modified
 
 		headers = list(self.DEFAULT_HEADERS)
 		headers.append(('Content-Type', content_type))
@@ -174,58 +299,190 @@ class Response:
 		"""
 		generate a streaming :class:`.Response` object from an object with an ``application/json``
 		content type. the default :attr:`.json_encoder` indents with tabs - override if you want
-		different indentation or need special encoding.
+		different indentation or need special encoding. :attr:`.json_chunk_size` sets roughly how
+		many characters each streamed chunk holds (the same as bytes unless the encoder has
+		``ensure_ascii=False``). if the app has a ``json_codec``, it replaces the body with its own
+		encoding of ``obj`` instead.
 		"""
 		body = cls._gen_json(obj)
-		return Response(body, content_type='application/json; charset=utf-8')
+		response = Response(body, content_type='application/json; charset=utf-8')
+		response.json_obj = obj
+		return response
 
 	@classmethod
 	def _gen_json(cls, obj: typing.Any) -> typing.Iterator[bytes]:
-		"""
-		internal use generator for converting
-		`json.JSONEncoder.iterencode <https://docs.python.org/3/library/json.html#json.JSONEncoder.iterencode>`_
-		output to bytes
-		"""
-		buf = io.BytesIO()
-		for chunk in cls.json_encoder.iterencode(obj):
-			buf.write(chunk.encode('utf-8'))
-			if buf.tell() >= 4096:
-				yield buf.getvalue()
-				buf.seek(0)
-				buf.truncate(0)
-		if buf.tell() > 0:
-			yield buf.getvalue()
+		""" internal use generator for encoding ``obj`` with :attr:`.json_encoder` """
+		yield from encode_chunks(cls.json_encoder.iterencode(obj), cls.json_chunk_size)
 
 	@classmethod
-	def render(cls, request: Request, template: str, context: dict[str, typing.Any]) -> 'Response':
+	def render(cls, request: Request, template: str, context: dict[str, typing.Any],
+			stream: bool=False, cache_key: typing.Hashable=None, ttl: float | None=None) -> 'Response':
 		"""
-		generate a streaming :class:`.Response` object from a template and a context with a
-		``text/html`` content type.
+		generate a :class:`.Response` object from a template and a context with a ``text/html``
+		content type.
 
 		:type request: :class:`.Request`
 		:param request: the request to generate the response for
 		:type template: str
 		:param template: the template name to render, relative to ``request.app.template_dir``
 		:param context: if you used the default jinja2 template engine, this is a dict
+		:type stream: bool
+		:param stream: if true, use the template engine's ``.stream`` method so the page is sent as
+		  it renders instead of all at once. this keeps time-to-first-byte and memory flat for big
+		  pages, but an error partway through can only cut the response short
+		:param cache_key: if not ``None``, passed with ``ttl`` to the template engine's ``.render``
+		  to reuse a cached page (see ``render_cache_size`` on
+		  :class:`.templates_jinja.JinjaTemplateEngine`). cached pages are never streamed
 
 		"""
-		body = request.app.template_engine.render(template, context)
+		with request.timing.span('render'):
+			if cache_key is not None:
+				body = request.app.template_engine.render(template, context, cache_key=cache_key, ttl=ttl)
+			elif stream:
+				body = request.app.template_engine.stream(template, context)
+			else:
+				body = request.app.template_engine.render(template, context)
 		response = cls(body, content_type='text/html; charset=utf-8')
 		return response
 
+class BoundedReader:
+	""" wraps a body without a Content-Length, raising a 413 once more than ``limit`` bytes are read """
+
+	def __init__(self, fp: typing.BinaryIO, limit: int) -> None:
+		self.fp = fp
+		self.remaining = limit
+
+	def read(self, size: int=-1) -> bytes:
+		if size < 0 or size > self.remaining:
+			size = self.remaining + 1 # one extra byte tells us the body is over the limit
+		return self._check(self.fp.read(size))
+
+	def readline(self, size: int=-1) -> bytes:
+		if size < 0 or size > self.remaining:
+			size = self.remaining + 1
+		return self._check(self.fp.readline(size))
+
+	def _check(self, data: bytes) -> bytes:
+		self.remaining -= len(data)
+		if self.remaining < 0:
+			raise exceptions.HTTPException(413, 'request body too large')
+		return data
+
+def parse_qs(qs: str) -> typing.Mapping[str, str | list[str]]:
+	if not qs:
+		return {}
+	try:
+		parsed: typing.MutableMapping[str, typing.Any] = urllib.parse.parse_qs(qs,
+				keep_blank_values=True, strict_parsing=True, errors='strict')
+	except UnicodeDecodeError as e:
+		qs_trunc = qs
+		if len(qs_trunc) > 24:
+			qs_trunc = qs_trunc[:24] + '...'
+		raise exceptions.HTTPException(400, '%s\n%r' % (e, qs_trunc)) # "'utf-8' codec can't decode byte ..."
+	except ValueError as e:
+		raise exceptions.HTTPException(400, e.args[0]) # "bad query field: ..."
+	for k, v in parsed.items():
+		if len(v) == 1:
+			parsed[k] = v[0]
+	return parsed
+
 def _hash(value_ts: str, cookie_secret: bytes) -> str:
 	h = hmac.new(cookie_secret, value_ts.encode(), hashlib.sha256)
 	signature = h.hexdigest()
 	return signature
 
-class HTTPHeaders(UserDict): # inherit so that __init__ and fromkeys work (even though we never use them)
+class HTTPHeaders(typing.MutableMapping[str, str]):
 	"""
-	behaves like a regular :class:`dict` but
-	`casefolds <https://docs.python.org/3/library/stdtypes.html#str.casefold>`_ the keys
+	a case-insensitive mapping of header names to values that stores its items the way a
+	`WSGI environ <https://www.python.org/dev/peps/pep-0333/#environ-variables>`_ does
+	(``X-Requested-With`` is ``HTTP_X_REQUESTED_WITH``; ``Content-Type`` and ``Content-Length``
+	have no prefix). :attr:`Request.headers` is built with :func:`from_environ`, so it reads
+	straight from the request's environ without copying it - and writes go to the environ too.
+	iterating yields lowercased header names.
+
+	servers join repeated request headers into one comma-separated value; use :func:`get_all` to
+	split list headers (``Accept``, ``Cache-Control``, ``If-None-Match``...) back up.
 	"""
 
-	def __setitem__(self, key: str, value: str) -> None:
-		self.data[key.casefold()] = value
+	def __init__(self, headers: typing.Mapping[str, str] | typing.Iterable[tuple[str, str]] | None=None) -> None:
+		self.environ: dict[str, typing.Any] = {}
+		if headers:
+			self.update(headers)
+
+	@classmethod
+	def from_environ(cls, environ: dict[str, typing.Any]) -> HTTPHeaders:
+		headers = cls.__new__(cls)
+		headers.environ = environ
+		return headers
 
 	def __getitem__(self, key: str) -> str:
-		return self.data[key.casefold()]
+		return self.environ[_environ_key(key)]
+
+	def __setitem__(self, key: str, value: str) -> None:
+		self.environ[_environ_key(key)] = value
+
+	def __delitem__(self, key: str) -> None:
+		del self.environ[_environ_key(key)]
+
+	def __contains__(self, key: object) -> bool:
+		return isinstance(key, str) and _environ_key(key) in self.environ
+
+	def __iter__(self) -> typing.Iterator[str]:
+		for key in self.environ:
+			if key.startswith('HTTP_'):
+				yield key[5:].replace('_', '-').lower()
+			elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+				yield key.replace('_', '-').lower()
+
+	def __len__(self) -> int:
+		return sum(1 for _ in self)
+
+	def __repr__(self) -> str:
+		return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
+
+	def get_all(self, key: str) -> list[str]:
+		"""
+		split a comma-separated list header into a list of its stripped values, leaving commas in
+		quoted strings alone. other headers (whose values may contain commas, like dates and
+		``Cookie``) are returned whole in a list of one. ``[]`` if missing
+		"""
+		value = self.environ.get(_environ_key(key))
+		if not value:
+			return []
+		if key.lower() not in _LIST_HEADERS:
+			return [value]
+		return _split_list(value)
+
+# request headers whose values are comma-separated lists (RFC 9110 5.6.1)
+_LIST_HEADERS = frozenset([
+	'accept', 'accept-charset', 'accept-encoding', 'accept-language', 'cache-control', 'connection',
+	'content-encoding', 'content-language', 'expect', 'forwarded', 'if-match', 'if-none-match', 'pragma',
+	'te', 'trailer', 'transfer-encoding', 'upgrade', 'via', 'x-forwarded-for', 'x-forwarded-host',
+	'x-forwarded-proto',
+])
+
+def _split_list(value: str) -> list[str]:
+	if '"' not in value:
+		return [v.strip() for v in value.split(',') if v.strip()]
+	values = []
+	start = 0
+	quoted = escaped = False
+	for i, c in enumerate(value):
+		if escaped:
+			escaped = False
+		elif quoted and c == '\\':
+			escaped = True
+		elif c == '"':
+			quoted = not quoted
+		elif c == ',' and not quoted:
+			values.append(value[start:i].strip())
+			start = i + 1
+	values.append(value[start:].strip())
+	return [v for v in values if v]
+
+@functools.lru_cache(maxsize=256)
+def _environ_key(name: str) -> str:
+	key = name.upper().replace('-', '_')
+	if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+		return key
+	return 'HTTP_' + key
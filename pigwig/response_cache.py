@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import typing
+
+from .cache import LRUCache
+from .request_response import Response
+
+if typing.TYPE_CHECKING:
+	from .cache import CacheStore
+	from .request_response import Request
+
+class ResponseCache:
+	"""
+	stores whole responses for routes that opt in with a ``cache`` option giving a ttl in seconds:
+	``('GET', '/posts', posts, {'cache': 30})``. only ``GET`` requests answered with a 200 and no
+	``Set-Cookie`` are stored. generator bodies are read once and stored as ``bytes``. a hit skips
+	the handler and all serialization. ``HEAD`` requests are answered from the ``GET`` entries.
+
+	entries are keyed on the method, path, query string, and the values of any request headers
+	named in the route's ``cache_vary`` option (``{'cache': 30, 'cache_vary': ['Accept-Language']}``).
+	those names are also sent in a ``Vary`` header.
+
+	with :class:`.compression.Compression` on, each encoding of a response is stored separately
+	(alongside the uncompressed body) the first time it is sent, so later hits skip compressing too.
+
+	:param maxsize: the most responses to keep
+	:param max_bytes: the most body bytes to keep
+	:param store: if not ``None``, keep responses here instead of in an in-process
+	  :class:`.cache.LRUCache` built from ``maxsize`` and ``max_bytes``. for example, a
+	  :class:`.mmap_cache.MmapCache` shares one cache among all of a server's worker processes
+
+	has ``hits``, ``misses``, and ``evictions`` counters
+	"""
+
+	def __init__(self, maxsize: int=1024, max_bytes: int=64 * 1024 * 1024, store: CacheStore | None=None) -> None:
+		if store is None:
+			store = LRUCache(maxsize, max_bytes=max_bytes)
+		self.store = store
+
+	@property
+	def hits(self) -> int:
+		return self.store.hits
+
+	@property
+	def misses(self) -> int:
+		return self.store.misses
+
+	@property
+	def evictions(self) -> int:
+		return self.store.evictions
+
+	@staticmethod
+	def key(request: Request) -> tuple:
+		assert request.route is not None
+		vary = request.route.options.get('cache_vary', ())
+		headers = request.headers
+		method = 'GET' if request.method == 'HEAD' else request.method
+		return (method, request.path, request.wsgi_environ.get('QUERY_STRING', ''),
+				tuple(headers.get(name) for name in vary))
+
+	def get(self, request: Request, encoding: str | None=None) -> Response | None:
+		""" the stored response, or its ``encoding`` variant if not ``None`` """
+		key = self.key(request)
+		if encoding is not None:
+			key += (encoding,)
+		entry = self.store.get(key)
+		if entry is None:
+			return None
+		code, headers, body, etag, last_modified = entry
+		response = Response(body, code, etag=etag, last_modified=last_modified)
+		response.headers = list(headers)
+		return response
+
+	def set(self, request: Request, response: Response, ttl: float, encoding: str | None=None) -> None:
+		"""
+		store ``response``, which must have a ``bytes`` body. if ``encoding`` is not ``None``,
+		``response`` is that variant of a response that was already stored
+		"""
+		assert request.route is not None and isinstance(response.body, bytes)
+		key = self.key(request)
+		if encoding is None:
+			vary = request.route.options.get('cache_vary')
+			if vary:
+				response.headers.append(('Vary', ', '.join(vary)))
+		else:
+			key += (encoding,)
+		entry = (response.code, tuple(response.headers), response.body, response.etag, response.last_modified)
+		self.store.set(key, entry, ttl, len(response.body))
+
+	def clear(self) -> None:
+		self.store.clear()
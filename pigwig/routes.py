@@ -2,26 +2,40 @@ from __future__ import annotations
 
 import re
 import textwrap
-from typing import Callable, Iterable, Sequence, Tuple
+from typing import Any, Callable, Iterable, NamedTuple, Sequence, Tuple, Union
 
 from . import exceptions
+from .cache import LRUCache
+
+class Route(NamedTuple):
+	"""
+	one entry of the route list passed to :class:`.PigWig`. ``path`` is the route as written
+	(``/post/<id>``), not the path requested. ``options`` is the optional fourth item of the entry
+	or an empty dict
+	"""
+	method: str
+	path: str
+	handler: Callable
+	options: dict[str, Any]
 
 class RouteNode:
 	def __init__(self) -> None:
-		self.method_handlers: dict[str, Callable] = {}
+		self.method_handlers: dict[str, Route] = {}
 		self.static_children: dict[str, RouteNode] = {}
 		self.param_name: str | None = None
 		self.param_children: RouteNode | None = None
 		self.param_is_path: bool | None = None
+		self.static_routes: dict[str, dict[str, Route]] = {}
+		self.cache: LRUCache | None = None
 
 	param_re = re.compile(r'<([\w:]+)>')
-	def assign_route(self, path_elements: Sequence[str], method: str, handler: Callable) -> None:
+	def assign_route(self, path_elements: Sequence[str], route: Route) -> None:
 		if not path_elements or path_elements[0] == '':
 			if len(path_elements) > 1:
 				raise Exception('cannot have consecutive / in routes')
-			if method in self.method_handlers:
-				raise exceptions.RouteConflict(method, handler)
-			self.method_handlers[method] = handler
+			if route.method in self.method_handlers:
+				raise exceptions.RouteConflict(route.method, route.handler)
+			self.method_handlers[route.method] = route
 			return
 
 		element = path_elements[0]
@@ -38,7 +52,7 @@ class RouteNode:
 				else:
 					self.param_is_path = False
 			elif self.param_name != param.group(1):
-				raise exceptions.RouteConflict(method, handler)
+				raise exceptions.RouteConflict(route.method, route.handler)
 			else:
 				assert self.param_children is not None
 			child = self.param_children
@@ -47,41 +61,90 @@ class RouteNode:
 				self.static_children[element] = RouteNode()
 			child = self.static_children[element]
 
-		child.assign_route(remaining, method, handler)
-
-	def get_route(self, method: str, path_elements: list[str], params: dict[str, str]) -> tuple[Callable, dict]:
-		if not path_elements or path_elements[0] == '':
-			handler = self.method_handlers.get(method)
-			if handler is not None:
-				return handler, params
-			elif self.method_handlers:
-				raise exceptions.HTTPException(405, 'method %s not allowed' % method)
-			else:
-				raise exceptions.HTTPException(404, 'route not found')
+		child.assign_route(remaining, route)
 
-		element = path_elements[0]
-		remaining = path_elements[1:]
-		child = self.static_children.get(element)
-		if child is None:
-			if self.param_name is None:
-				raise exceptions.HTTPException(404, 'route not found')
-			if self.param_is_path:
-				params[self.param_name] = '/'.join(path_elements)
-				remaining = []
-			else:
-				params[self.param_name] = element
-			child = self.param_children
-			assert child is not None
-		return child.get_route(method, remaining, params)
+	def compile(self) -> None:
+		"""
+		build :attr:`static_routes`, a flat lookup from every fully static path (one with no
+		params) to the handlers registered on it. must be called again if routes are assigned
+		afterwards. :func:`build_route_tree` does this for you.
+		"""
+		self.static_routes = {}
+		stack: list[tuple[str, RouteNode]] = [('', self)]
+		while stack:
+			prefix, node = stack.pop()
+			if node.method_handlers:
+				self.static_routes[prefix or '/'] = node.method_handlers
+			for element, child in node.static_children.items():
+				stack.append((prefix + '/' + element, child))
 
 	def route(self, method: str, path: str) -> tuple[Callable, dict]:
-		path_elements = path[1:].split('/')
-		return self.get_route(method, path_elements, {})
+		""" returns the handler and params for a request. see :func:`match` """
+		route, params = self.match(method, path)
+		return route.handler, params
+
+	def match(self, method: str, path: str) -> tuple[Route, dict]:
+		"""
+		returns the :class:`Route` and params for a request or raises a 404 or 405
+		:class:`.exceptions.HTTPException`. ``HEAD`` requests fall back to the ``GET`` route. if
+		:attr:`cache` is set, both outcomes are remembered for each ``(method, path)``
+		"""
+		cache = self.cache
+		if cache is None:
+			return self._match(method, path)
+
+		key = (method, path)
+		result = cache.get(key)
+		if result is None:
+			try:
+				route, params = self._match(method, path)
+				result = (route, params, None)
+			except exceptions.HTTPException as e:
+				result = (None, None, (e.code, e.body))
+			cache.set(key, result)
+		route, params, error = result
+		if error is not None:
+			raise exceptions.HTTPException(*error)
+		return route, dict(params)
+
+	def _match(self, method: str, path: str) -> tuple[Route, dict]:
+		method_handlers = self.static_routes.get(path)
+		params: dict[str, str] = {}
+		if method_handlers is None:
+			node = self
+			path_elements = path[1:].split('/')
+			for i, element in enumerate(path_elements):
+				if element == '':
+					break
+				child = node.static_children.get(element)
+				if child is None:
+					param_name = node.param_name
+					if param_name is None:
+						raise exceptions.HTTPException(404, 'route not found')
+					child = node.param_children
+					assert child is not None
+					if node.param_is_path:
+						params[param_name] = '/'.join(path_elements[i:])
+						node = child
+						break
+					params[param_name] = element
+				node = child
+			method_handlers = node.method_handlers
+
+		route = method_handlers.get(method)
+		if route is None and method == 'HEAD':
+			route = method_handlers.get('GET')
+		if route is not None:
+			return route, params
+		elif method_handlers:
+			raise exceptions.HTTPException(405, 'method %s not allowed' % method)
+		else:
+			raise exceptions.HTTPException(404, 'route not found')
 
 	def __str__(self) -> str:
 		rval = []
-		for method, handler in self.method_handlers.items():
-			rval.append('%s: %s,' % (method, handler))
+		for method, route in self.method_handlers.items():
+			rval.append('%s: %s,' % (method, route.handler))
 		for element, node in self.static_children.items():
 			rval.append('%r: %s' % (element, node))
 		if self.param_name:
@@ -91,11 +154,15 @@ class RouteNode:
 			rval.append('%s: %s' % (name, self.param_children))
 		return '{\n%s\n}' % textwrap.indent('\n'.join(rval), '\t')
 
-RouteDefinition = Iterable[Tuple[str, str, Callable]]
+RouteDefinition = Iterable[Union[Tuple[str, str, Callable], Tuple[str, str, Callable, dict]]]
 
-def build_route_tree(routes: RouteDefinition) -> RouteNode:
+def build_route_tree(routes: RouteDefinition, cache_size: int=0) -> RouteNode:
 	root_node = RouteNode()
-	for method, path, handler in routes:
+	if cache_size > 0:
+		root_node.cache = LRUCache(cache_size)
+	for method, path, handler, *options in routes:
+		route = Route(method, path, handler, options[0] if options else {})
 		path_elements = path[1:].split('/')
-		root_node.assign_route(path_elements, method, handler)
+		root_node.assign_route(path_elements, route)
+	root_node.compile()
 	return root_node
@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import http.server
+import socketserver
+import sys
+import threading
+import typing
+import urllib.parse
+import wsgiref.util
+
+if typing.TYPE_CHECKING:
+	from .pigwig import PigWig
+
+class ThreadedServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+	"""
+	an HTTP/1.1 WSGI server that handles each connection in its own thread, running at most
+	``threads`` at once. connections are kept alive (and pipelined requests answered in order)
+	until the client closes them or sits idle for ``idle_timeout`` seconds. a client that stalls
+	for ``request_timeout`` seconds while sending a request or receiving a response is dropped.
+	responses without a ``Content-Length`` are sent with chunked transfer-encoding.
+
+	when all the threads are busy, new connections wait in the listen backlog.
+	"""
+
+	daemon_threads = True
+	allow_reuse_address = True # so that the reloader's execv can bind again right away
+	request_queue_size = 128
+
+	def __init__(self, address: tuple[str, int], app: PigWig, threads: int=32, idle_timeout: float=5.0,
+			request_timeout: float=30.0) -> None:
+		super().__init__(address, _RequestHandler)
+		self.app = app
+		self.idle_timeout = idle_timeout
+		self.request_timeout = request_timeout
+		self.slots = threading.BoundedSemaphore(threads)
+		self.base_environ: dict[str, typing.Any] = {
+			'SERVER_NAME': self.server_name,
+			'SERVER_PORT': str(self.server_port),
+			'SCRIPT_NAME': '',
+			'wsgi.version': (1, 0),
+			'wsgi.url_scheme': 'http',
+			'wsgi.errors': sys.stderr,
+			'wsgi.multithread': True,
+			'wsgi.multiprocess': False,
+			'wsgi.run_once': False,
+			'wsgi.file_wrapper': wsgiref.util.FileWrapper,
+		}
+
+	def process_request(self, request: typing.Any, client_address: typing.Any) -> None:
+		self.slots.acquire()
+		try:
+			super().process_request(request, client_address)
+		except BaseException:
+			self.slots.release()
+			raise
+
+	def process_request_thread(self, request: typing.Any, client_address: typing.Any) -> None:
+		try:
+			super().process_request_thread(request, client_address)
+		finally:
+			self.slots.release()
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	server: ThreadedServer
+
+	def handle_one_request(self) -> None:
+		self.connection.settimeout(self.server.idle_timeout)
+		try:
+			self.raw_requestline = self.rfile.readline(65537)
+		except OSError: # includes timeouts
+			self.close_connection = True
+			return
+		if not self.raw_requestline:
+			self.close_connection = True
+			return
+		self.connection.settimeout(self.server.request_timeout)
+		if len(self.raw_requestline) > 65536:
+			self.requestline = ''
+			self.request_version = ''
+			self.command = ''
+			self.send_error(414)
+			return
+		if not self.parse_request():
+			return
+		try:
+			self.run_wsgi()
+		except OSError: # the client went away or timed out
+			self.close_connection = True
+
+	def run_wsgi(self) -> None:
+		environ = self.build_environ()
+		if environ is None:
+			return
+		body = environ['wsgi.input']
+		response = _Response(self)
+		result = self.server.app(environ, response.start_response)
+		try:
+			sent = False
+			if isinstance(result, wsgiref.util.FileWrapper):
+				sent = response.sendfile(typing.cast(typing.BinaryIO, result.filelike))
+			if not sent:
+				for data in result:
+					response.write(data)
+			response.finish()
+		except Exception:
+			self.close_connection = True
+			if response.headers_sent:
+				self.log_error('error sending response: %s', sys.exc_info()[1])
+			else:
+				raise
+		finally:
+			close = getattr(result, 'close', None)
+			if close is not None:
+				close()
+		if not self.close_connection and not body.drain():
+			self.close_connection = True
+
+	def build_environ(self) -> dict[str, typing.Any] | None:
+		""" a WSGI environ for the request that was just parsed, or ``None`` if an error was sent """
+		environ = self.server.base_environ.copy()
+		rfile = typing.cast(typing.BinaryIO, self.rfile)
+		environ['SERVER_PROTOCOL'] = self.request_version
+		environ['REQUEST_METHOD'] = self.command
+		path, _, query = self.path.partition('?')
+		environ['PATH_INFO'] = urllib.parse.unquote(path, 'iso-8859-1')
+		environ['QUERY_STRING'] = query
+		environ['REMOTE_ADDR'] = self.client_address[0]
+		for name, value in self.headers.items():
+			key = name.upper().replace('-', '_')
+			if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+				key = 'HTTP_' + key
+			if key in environ:
+				separator = '; ' if key == 'HTTP_COOKIE' else ','
+				environ[key] += separator + value
+			else:
+				environ[key] = value
+
+		body: _Input
+		if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+			environ.pop('CONTENT_LENGTH', None)
+			body = _ChunkedInput(rfile)
+		else:
+			try:
+				length = int(environ.get('CONTENT_LENGTH') or 0)
+				if length < 0:
+					raise ValueError
+			except ValueError:
+				self.send_error(400, 'invalid Content-Length')
+				return None
+			body = _Input(rfile, length)
+		environ['wsgi.input'] = body
+
+		if environ.get('HTTP_EXPECT', '').lower() == '100-continue':
+			self.wfile.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+		return environ
+
+class _Response:
+	""" the ``start_response`` and framing of one response """
+
+	def __init__(self, handler: _RequestHandler) -> None:
+		self.handler = handler
+		self.status: str | None = None
+		self.headers: list[tuple[str, str]] = []
+		self.headers_sent = False
+		self.chunked = False
+
+	def start_response(self, status: str, headers: list[tuple[str, str]],
+			exc_info: typing.Any=None) -> typing.Callable[[bytes], None]:
+		if exc_info is not None:
+			if self.headers_sent:
+				raise exc_info[1].with_traceback(exc_info[2])
+		elif self.status is not None:
+			raise AssertionError('start_response called twice')
+		self.status = status
+		self.headers = headers
+		return self.write
+
+	def write(self, data: bytes) -> None:
+		if not data:
+			return
+		if not self.headers_sent:
+			self.handler.wfile.write(self._header_block(has_body=True) + self._frame(data))
+		else:
+			self.handler.wfile.write(self._frame(data))
+
+	def sendfile(self, f: typing.BinaryIO) -> bool:
+		""" send a file body with ``socket.sendfile`` if its length is known, returning whether it was """
+		if self.status is None or self.headers_sent:
+			return False
+		length = None
+		for name, value in self.headers:
+			if name.lower() == 'content-length':
+				length = int(value)
+		if length is None:
+			return False
+		try:
+			offset = f.tell()
+			f.fileno()
+		except (OSError, AttributeError, ValueError):
+			return False
+		self.handler.wfile.write(self._header_block(has_body=True))
+		if self.handler.command != 'HEAD':
+			self.handler.connection.sendfile(f, offset, length)
+		return True
+
+	def finish(self) -> None:
+		if not self.headers_sent:
+			self.handler.wfile.write(self._header_block(has_body=False))
+		elif self.chunked:
+			self.handler.wfile.write(b'0\r\n\r\n')
+
+	def _frame(self, data: bytes) -> bytes:
+		if self.chunked:
+			return b'%x\r\n%s\r\n' % (len(data), data)
+		return data
+
+	def _header_block(self, has_body: bool) -> bytes:
+		""" decide how the body is framed and whether to keep the connection, and serialize the headers """
+		assert self.status is not None, 'no start_response before the body'
+		handler = self.handler
+		code = int(self.status.split(' ', 1)[0])
+		names = {name.lower() for name, _ in self.headers}
+		headers = list(self.headers)
+
+		connection = handler.headers.get('Connection', '').lower()
+		if handler.request_version == 'HTTP/1.0':
+			keep_alive = connection == 'keep-alive'
+		else:
+			keep_alive = connection != 'close'
+
+		if 'content-length' in names or handler.command == 'HEAD' or code in (204, 304) or code < 200:
+			pass # the body is already delimited or there isn't one
+		elif not has_body:
+			headers.append(('Content-Length', '0'))
+		elif handler.request_version == 'HTTP/1.1':
+			headers.append(('Transfer-Encoding', 'chunked'))
+			self.chunked = True
+		else: # the body ends when the connection does
+			keep_alive = False
+
+		if not keep_alive:
+			handler.close_connection = True
+			headers.append(('Connection', 'close'))
+		elif handler.request_version == 'HTTP/1.0':
+			headers.append(('Connection', 'keep-alive'))
+		if 'date' not in names:
+			headers.append(('Date', handler.date_time_string()))
+		if 'server' not in names:
+			headers.append(('Server', handler.version_string()))
+
+		handler.log_request(code)
+		self.headers_sent = True
+		lines = ['%s %s' % (handler.protocol_version, self.status)]
+		lines.extend('%s: %s' % header for header in headers)
+		return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+class _Input:
+	""" ``wsgi.input`` for a body with a Content-Length """
+
+	max_drain = 64 * 1024
+
+	def __init__(self, rfile: typing.BinaryIO, length: int) -> None:
+		self.rfile = rfile
+		self.remaining = length
+
+	def read(self, size: int=-1) -> bytes:
+		if size < 0 or size > self.remaining:
+			size = self.remaining
+		data = self.rfile.read(size)
+		self.remaining -= len(data)
+		return data
+
+	def readline(self, size: int=-1) -> bytes:
+		if size < 0 or size > self.remaining:
+			size = self.remaining
+		data = self.rfile.readline(size)
+		self.remaining -= len(data)
+		return data
+
+	def __iter__(self) -> typing.Iterator[bytes]:
+		while True:
+			line = self.readline()
+			if not line:
+				return
+			yield line
+
+	def drain(self) -> bool:
+		"""
+		skip whatever the app didn't read so the next request on the connection can be parsed.
+		returns False if there was too much left to bother
+		"""
+		if self.remaining > self.max_drain:
+			return False
+		while self.read(self.max_drain):
+			pass
+		return True
+
+class _ChunkedInput(_Input):
+	""" ``wsgi.input`` for a body with chunked transfer-encoding """
+
+	def __init__(self, rfile: typing.BinaryIO) -> None:
+		super().__init__(rfile, 0)
+		self.done = False
+		self.drained = 0
+
+	def _next_chunk(self) -> None:
+		line = self.rfile.readline(1024)
+		try:
+			self.remaining = int(line.split(b';', 1)[0], 16)
+		except ValueError:
+			raise OSError('invalid chunk size: %r' % line) from None
+		if self.remaining == 0:
+			self.done = True
+			while self.rfile.readline(65537) not in (b'\r\n', b'\n', b''): # trailers
+				pass
+
+	def read(self, size: int=-1) -> bytes:
+		data = []
+		while not self.done and size != 0:
+			if self.remaining == 0:
+				self._next_chunk()
+				continue
+			chunk = super().read(size)
+			if not chunk:
+				raise OSError('truncated chunk')
+			data.append(chunk)
+			if size > 0:
+				size -= len(chunk)
+			if self.remaining == 0:
+				self.rfile.readline(3) # the CRLF after the chunk
+		return b''.join(data)
+
+	def readline(self, size: int=-1) -> bytes:
+		line = []
+		while size != 0:
+			c = self.read(1)
+			if not c:
+				break
+			line.append(c)
+			size -= 1
+			if c == b'\n':
+				break
+		return b''.join(line)
+
+	def drain(self) -> bool:
+		while not self.done:
+			self.drained += len(self.read(self.max_drain))
+			if self.drained > self.max_drain:
+				return False
+		return True
+
+def make_server(host: str, port: int, app: PigWig, threads: int=32, idle_timeout: float=5.0,
+		request_timeout: float=30.0) -> ThreadedServer:
+	return ThreadedServer((host, port), app, threads, idle_timeout, request_timeout)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import datetime
+import email.utils
+import mimetypes
+import os
+import stat
+import typing
+
+from . import exceptions
+from .cache import LRUCache
+from .request_response import Response
+
+if typing.TYPE_CHECKING:
+	from .request_response import Request
+
+class _FileInfo(typing.NamedTuple):
+	path: str
+	size: int
+	etag: str
+	last_modified: datetime.datetime
+	content_type: str
+
+def static_handler(directory: str, max_age: int | None=None, cache_size: int=1024,
+		cache_ttl: float=1.0) -> typing.Callable[..., Response]:
+	"""
+	build a route handler that serves the files under ``directory``. the route must have exactly
+	one param and it should be a ``path:`` param::
+
+		('GET', '/static/<path:path>', static_handler('/srv/app/static'))
+
+	files are sent as :class:`.Response` file bodies, so servers that offer ``wsgi.file_wrapper``
+	can send them without copying them through python (gunicorn uses ``sendfile``). responses have
+	an ETag and Last-Modified from the file's ``stat`` (so a matching ``If-None-Match`` or
+	``If-Modified-Since`` gets a 304) and honor a single-range ``Range`` header with a 206, or a
+	416 if it's out of bounds. paths that escape ``directory`` get a 404.
+
+	:type directory: str
+	:param directory: served files must be under this directory. symlinks are followed, but must
+	  resolve to somewhere inside it
+	:type max_age: int
+	:param max_age: if not ``None``, sends ``Cache-Control: public, max-age=<max_age>``
+	:type cache_size: int
+	:param cache_size: how many paths' resolved locations and ``stat`` results to remember
+	:type cache_ttl: float
+	:param cache_ttl: how many seconds to remember them for. a file that changes is served with its
+	  old length and validators for at most this long
+	"""
+	root = os.path.realpath(directory)
+	cache = LRUCache(cache_size, ttl=cache_ttl)
+	extra_headers = [('Accept-Ranges', 'bytes')]
+	if max_age is not None:
+		extra_headers.append(('Cache-Control', 'public, max-age=%d' % max_age))
+
+	def lookup(rel_path: str) -> _FileInfo:
+		info = cache.get(rel_path)
+		if info is not None:
+			return info
+		path = os.path.realpath(os.path.join(root, rel_path))
+		if not path.startswith(root + os.sep):
+			raise exceptions.HTTPException(404, 'not found')
+		try:
+			st = os.stat(path)
+		except OSError:
+			raise exceptions.HTTPException(404, 'not found') from None
+		if not stat.S_ISREG(st.st_mode):
+			raise exceptions.HTTPException(404, 'not found')
+		content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+		last_modified = datetime.datetime.fromtimestamp(int(st.st_mtime), datetime.timezone.utc)
+		info = _FileInfo(path, st.st_size, '"%x-%x"' % (st.st_mtime_ns, st.st_size), last_modified, content_type)
+		cache.set(rel_path, info)
+		return info
+
+	def handler(request: Request, **params: str) -> Response:
+		rel_path, = params.values()
+		info = lookup(rel_path)
+		try:
+			f = open(info.path, 'rb')
+		except OSError:
+			cache.delete(rel_path)
+			raise exceptions.HTTPException(404, 'not found') from None
+
+		response = Response(f, content_type=info.content_type, extra_headers=extra_headers,
+				etag=info.etag, last_modified=info.last_modified)
+		byte_range = _parse_range(request, info)
+		if byte_range is None:
+			response.headers.append(('Content-Length', str(info.size)))
+		elif byte_range is _UNSATISFIABLE:
+			f.close()
+			response.body = b''
+			response.code = 416
+			response.headers.append(('Content-Range', 'bytes */%d' % info.size))
+		else:
+			start, end = byte_range
+			response.code = 206
+			response.headers.append(('Content-Range', 'bytes %d-%d/%d' % (start, end, info.size)))
+			response.headers.append(('Content-Length', str(end - start + 1)))
+			if end == info.size - 1: # a file body is sent from the current position to the end
+				f.seek(start)
+			else:
+				response.body = _read_range(f, start, end - start + 1)
+		return response
+
+	return handler
+
+_UNSATISFIABLE: typing.Any = object()
+
+def _parse_range(request: Request, info: _FileInfo) -> tuple[int, int] | None:
+	""" the inclusive ``(start, end)`` of a satisfiable single-range request, ``_UNSATISFIABLE``, or ``None`` """
+	header = request.wsgi_environ.get('HTTP_RANGE')
+	if header is None or request.method not in ('GET', 'HEAD'):
+		return None
+	if_range = request.wsgi_environ.get('HTTP_IF_RANGE')
+	if if_range is not None and if_range != info.etag:
+		try:
+			if email.utils.parsedate_to_datetime(if_range) != info.last_modified:
+				return None
+		except (TypeError, ValueError):
+			return None
+
+	unit, _, spec = header.partition('=')
+	if unit.strip() != 'bytes' or ',' in spec: # multiple ranges aren't supported, so send the whole file
+		return None
+	first, _, last = spec.strip().partition('-')
+	try:
+		if first:
+			start = int(first)
+			end = int(last) if last else info.size - 1
+			if start >= info.size:
+				return _UNSATISFIABLE
+			if end < start:
+				return None
+		else:
+			suffix = int(last)
+			if suffix == 0 or info.size == 0:
+				return _UNSATISFIABLE
+			start = max(info.size - suffix, 0)
+			end = info.size - 1
+	except ValueError:
+		return None
+	return start, min(end, info.size - 1)
+
+def _read_range(f: typing.BinaryIO, offset: int, length: int) -> typing.Iterator[bytes]:
+	try:
+		f.seek(offset)
+		while length > 0:
+			chunk = f.read(min(length, Response.file_chunk_size))
+			if not chunk:
+				break
+			length -= len(chunk)
+			yield chunk
+	finally:
+		f.close()
+
+def file_chunks(f: typing.BinaryIO) -> typing.Iterator[bytes]:
+	""" read a file body in :attr:`.Response.file_chunk_size` chunks, for servers without ``wsgi.file_wrapper`` """
+	try:
+		while True:
+			chunk = f.read(Response.file_chunk_size)
+			if not chunk:
+				break
+			yield chunk
+	finally:
+		f.close()
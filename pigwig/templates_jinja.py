@@ -3,18 +3,173 @@ from __future__ import annotations
 import types
 import typing
 
+from .cache import LRUCache
+from .json_codec import encode_chunks
+
+if typing.TYPE_CHECKING:
+	from .cache import CacheStore
+
 try:
 	import jinja2
+	import jinja2.ext
+	import jinja2.nodes
 except ImportError:
 	jinja2: types.ModuleType = None # type: ignore[no-redef]
 
+DEFAULT_TEMPLATE_EXTENSIONS = ('html', 'htm', 'jinja', 'jinja2', 'j2', 'xml', 'txt')
+
 class JinjaTemplateEngine:
-	def __init__(self, template_dir: str) -> None:
+	"""
+	options other than ``template_dir`` can be passed with
+	``functools.partial(JinjaTemplateEngine, chunk_size=...)`` as :class:`.PigWig`'s
+	``template_engine``
+
+	:param chunk_size: :func:`stream` yields chunks of about this many characters of output, which
+	  is this many bytes only if the output is ASCII (see :func:`.json_codec.encode_chunks`)
+	:param bytecode_cache_dir: if set, compiled templates are saved to this directory with a
+	  ``jinja2.FileSystemBytecodeCache`` and loaded from it by every later process, so templates
+	  are only compiled once per change rather than once per worker
+	:param precompile: if true, :func:`precompile` is called right away. with :class:`.PigWig`,
+	  this happens when the app is constructed - before a prefork server forks its workers - so
+	  workers start with every template compiled
+	:param precompile_extensions: the file extensions (without the ``.``) :func:`precompile` treats
+	  as templates. ``None`` means every file
+	:param precompile_filter: if not ``None``, a function that is passed each template name and
+	  returns whether :func:`precompile` should load it. used in place of ``precompile_extensions``
+	:param render_cache_size: if non-zero, :func:`render` calls given a ``cache_key`` and
+	  ``{% cache %}`` blocks keep up to this many results in ``render_cache``, an
+	  :class:`.cache.LRUCache`
+	:param render_cache_ttl: default number of seconds a cached result is used for. ``None`` means
+	  until evicted or invalidated
+	:param render_cache: a :class:`.cache.CacheStore` to use as ``render_cache`` instead of an
+	  :class:`.cache.LRUCache` built from ``render_cache_size`` and ``render_cache_ttl`` - for
+	  example, a :class:`.mmap_cache.MmapCache` shared by all worker processes
+
+	templates can cache expensive fragments::
+
+	    {% cache 'sidebar', 60 %}...{% endcache %}
+
+	the first argument is the key (any expression) and the optional second is a ttl in seconds.
+	fragment keys share ``render_cache`` with :func:`render` but not its key space. without a
+	``render_cache_size``, ``{% cache %}`` blocks render every time
+	"""
+
+	def __init__(self, template_dir: str, chunk_size: int=8192, bytecode_cache_dir: str | None=None,
+			precompile: bool=False, render_cache_size: int=0, render_cache_ttl: float | None=None,
+			render_cache: CacheStore | None=None,
+			precompile_extensions: typing.Collection[str] | None=DEFAULT_TEMPLATE_EXTENSIONS,
+			precompile_filter: typing.Callable[[str], bool] | None=None) -> None:
 		if not jinja2:
 			raise Exception('Cannot use %s without jinja2 installed' % self.__class__)
 		loader = jinja2.FileSystemLoader(template_dir)
-		self.jinja_env = jinja2.Environment(loader=loader, auto_reload=False)
+		bytecode_cache = None
+		if bytecode_cache_dir is not None:
+			bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+		cache_size = -1 if precompile else 400 # precompiled templates must never be evicted
+		self.jinja_env = jinja2.Environment(loader=loader, auto_reload=False, bytecode_cache=bytecode_cache,
+				cache_size=cache_size, extensions=[FragmentCacheExtension])
+		self.chunk_size = chunk_size
+		self.precompile_extensions = precompile_extensions
+		self.precompile_filter = precompile_filter
+		if render_cache is None and render_cache_size > 0:
+			render_cache = LRUCache(render_cache_size, render_cache_ttl)
+		self.render_cache = render_cache
+		self.jinja_env.fragment_cache = self.render_cache # type: ignore[attr-defined]
+		if precompile:
+			self.precompile()
+
+	def precompile(self) -> list[str]:
+		"""
+		load and compile every template under ``template_dir`` (that matches
+		``precompile_extensions`` or ``precompile_filter``) into the environment's cache. returns
+		their names. a syntax error in any template is raised here
+		"""
+		if self.precompile_filter is not None:
+			names = self.jinja_env.list_templates(filter_func=self.precompile_filter)
+		else:
+			names = self.jinja_env.list_templates(self.precompile_extensions)
+		for name in names:
+			self.jinja_env.get_template(name)
+		return names
 
-	def render(self, template_name: str, context: dict[str, typing.Any]) -> str:
+	def render(self, template_name: str, context: dict[str, typing.Any], cache_key: typing.Hashable=None,
+			ttl: float | None=None) -> str:
+		"""
+		if ``cache_key`` is not ``None`` and there is a ``render_cache``, the result is cached under
+		``(template_name, cache_key)`` and reused (ignoring ``context``) until it expires or is
+		invalidated. ``ttl`` overrides ``render_cache_ttl``
+		"""
+		cache = self.render_cache
+		if cache is None or cache_key is None:
+			return self.jinja_env.get_template(template_name).render(context)
+		key = (template_name, cache_key)
+		rendered = cache.get(key)
+		if rendered is None:
+			rendered = self.jinja_env.get_template(template_name).render(context)
+			cache.set(key, rendered, ttl)
+		return rendered
+
+	def invalidate(self, template_name: str, cache_key: typing.Hashable=None) -> None:
+		"""
+		drop a cached :func:`render` result. if ``cache_key`` is ``None``, drop every cached result
+		of ``template_name``
+		"""
+		cache = self.render_cache
+		if cache is None:
+			return
+		if cache_key is not None:
+			cache.delete((template_name, cache_key))
+			return
+		for key in cache.keys():
+			if isinstance(key, tuple) and key[0] == template_name:
+				cache.delete(key)
+
+	def invalidate_fragment(self, key: typing.Hashable) -> None:
+		""" drop a cached ``{% cache %}`` block """
+		if self.render_cache is not None:
+			self.render_cache.delete(FragmentCacheExtension.cache_key(key))
+
+	def stream(self, template_name: str, context: dict[str, typing.Any]) -> typing.Iterator[bytes]:
+		"""
+		render incrementally with jinja's ``generate``, yielding UTF-8 chunks. the template is
+		loaded (and any ``TemplateNotFound`` raised) immediately; errors while rendering are only
+		raised as the body is sent
+		"""
 		template = self.jinja_env.get_template(template_name)
-		return template.render(context)
+		return encode_chunks(template.generate(context), self.chunk_size)
+
+if jinja2:
+	class FragmentCacheExtension(jinja2.ext.Extension):
+		""" implements ``{% cache key[, ttl] %}...{% endcache %}``. see :class:`JinjaTemplateEngine` """
+
+		tags = {'cache'} # noqa: RUF012
+
+		def __init__(self, environment: jinja2.Environment) -> None:
+			super().__init__(environment)
+			environment.extend(fragment_cache=None)
+
+		def parse(self, parser: jinja2.parser.Parser) -> jinja2.nodes.Node:
+			lineno = next(parser.stream).lineno
+			args = [parser.parse_expression()]
+			if parser.stream.skip_if('comma'):
+				args.append(parser.parse_expression())
+			else:
+				args.append(jinja2.nodes.Const(None))
+			body = parser.parse_statements(('name:endcache',), drop_needle=True)
+			return jinja2.nodes.CallBlock(self.call_method('_cache', args), [], [], body).set_lineno(lineno)
+
+		@staticmethod
+		def cache_key(key: typing.Hashable) -> tuple[str, typing.Hashable]:
+			# render() keys are (template name, key). no template is named this
+			return ('{% cache %}', key)
+
+		def _cache(self, key: typing.Hashable, ttl: float | None, caller: typing.Callable[[], str]) -> str:
+			cache = self.environment.fragment_cache # type: ignore[attr-defined]
+			if cache is None:
+				return caller()
+			key = self.cache_key(key)
+			rendered = cache.get(key)
+			if rendered is None:
+				rendered = caller()
+				cache.set(key, rendered, ttl)
+			return rendered
@@ -0,0 +1,15 @@
+from unittest import mock
+
+def wsgi_request(app, method, path, **environ):
+	""" call ``app`` like a WSGI server would, returning the status line, a dict of headers, and the body """
+	environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'wsgi.input': None, **environ}
+	start_response = mock.MagicMock()
+	result = app(environ, start_response)
+	try:
+		body = b''.join(result)
+	finally:
+		close = getattr(result, 'close', None)
+		if close is not None:
+			close()
+	status, headers = start_response.call_args[0]
+	return status, dict(headers), body
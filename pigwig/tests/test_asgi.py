@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import unittest
+import zlib
+
+from pigwig import PigWig, Response
+from pigwig.compression import Compression
+
+def call(app, method, path, body=b'', headers=()):
+	scope = {
+		'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+		'headers': [(k.encode(), v.encode()) for k, v in headers],
+	}
+	messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+			{'type': 'http.request', 'body': body[3:], 'more_body': False}]
+	sent = []
+	async def receive():
+		return messages.pop(0)
+	async def send(message):
+		sent.append(message)
+	asyncio.run(app.asgi(scope, receive, send))
+	start = sent[0]
+	assert all(message['type'] == 'http.response.body' for message in sent[1:])
+	return start['status'], dict(start['headers']), b''.join(message['body'] for message in sent[1:])
+
+class ASGITests(unittest.TestCase):
+	def test_handlers(self):
+		threads = []
+		async def async_handler(request, name):
+			await asyncio.sleep(0)
+			return Response('hello ' + name)
+		def sync_handler(request):
+			threads.append(threading.current_thread().name)
+			return Response.json(request.body)
+		uploads = []
+		def upload_handler(request):
+			uploads.append(request.body['file1'])
+			return Response(request.body['file1'].data)
+		async def gen():
+			yield b'a'
+			await asyncio.sleep(0)
+			yield b'b'
+		app = PigWig([
+			('GET', '/hello/<name>', async_handler),
+			('POST', '/echo', sync_handler),
+			('GET', '/gen', lambda request: Response(gen())),
+			('POST', '/raw', lambda request: Response(request.wsgi_environ['wsgi.input'])),
+			('POST', '/upload', upload_handler),
+		])
+
+		status, headers, body = call(app, 'GET', '/hello/world')
+		self.assertEqual((status, body), (200, b'hello world'))
+		self.assertEqual(headers[b'content-length'], b'11')
+		status, headers, body = call(app, 'POST', '/echo', b'{"a": 1}', [('Content-Type', 'application/json')])
+		self.assertEqual((status, body), (200, b'{\n\t"a": 1\n}'))
+		self.assertTrue(threads[0].startswith('pigwig-asgi'))
+		self.assertEqual(call(app, 'GET', '/gen')[2], b'ab')
+		self.assertEqual(call(app, 'HEAD', '/gen')[2], b'')
+		self.assertEqual(call(app, 'GET', '/missing')[0], 404)
+		self.assertEqual(call(app, 'POST', '/raw', b'raw body')[2], b'raw body')
+		upload = (b'--boundary\r\nContent-Disposition: form-data; name="file1"; filename="the_file"\r\n\r\n'
+				b'blah\r\n--boundary--\r\n')
+		status, _, body = call(app, 'POST', '/upload', upload,
+				[('Content-Type', 'multipart/form-data; boundary=boundary')])
+		self.assertEqual((status, body), (200, b'blah'))
+		self.assertTrue(uploads[0].file.closed)
+
+	def test_limits_and_compression(self):
+		async def gen():
+			yield b'x' * 100
+			yield b'y' * 100
+		app = PigWig([
+			('POST', '/', lambda request: Response(repr(request.body)), {'max_body_size': 4}),
+			('GET', '/gen', lambda request: Response(gen())),
+		], compression=Compression())
+		self.assertEqual(call(app, 'POST', '/', b'12345')[0], 413)
+		_, headers, body = call(app, 'GET', '/gen', headers=[('Accept-Encoding', 'deflate')])
+		self.assertEqual(headers[b'content-encoding'], b'deflate')
+		self.assertEqual(zlib.decompress(body), b'x' * 100 + b'y' * 100)
+
+	def test_lifespan(self):
+		app = PigWig([])
+		messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+		sent = []
+		async def receive():
+			return messages.pop(0)
+		async def send(message):
+			sent.append(message['type'])
+		asyncio.run(app.asgi({'type': 'lifespan'}, receive, send))
+		self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pigwig.cache import LRUCache
+
+try:
+	from pigwig.mmap_cache import MmapCache
+except ImportError: # no fcntl
+	MmapCache = None # type: ignore[assignment,misc]
+
+class LRUCacheTests(unittest.TestCase):
+	def test_max_bytes(self):
+		cache = LRUCache(10, max_bytes=10)
+		cache.set('a', 'a', size=4)
+		cache.set('b', 'b', size=4)
+		cache.set('a', 'a', size=4) # replacing doesn't count twice
+		self.assertEqual(cache.bytes, 8)
+		cache.set('c', 'c', size=4) # evicts b
+		self.assertEqual(cache.keys(), ['a', 'c'])
+		self.assertEqual((cache.bytes, cache.evictions), (8, 1))
+
+@unittest.skipIf(MmapCache is None, 'mmap_cache needs fcntl')
+class MmapCacheTests(unittest.TestCase):
+	def setUp(self):
+		fd, self.path = tempfile.mkstemp()
+		os.close(fd)
+		self.addCleanup(os.unlink, self.path)
+
+	def test_shared(self):
+		cache = MmapCache(self.path, slots=16, slot_size=256)
+		self.addCleanup(cache.close)
+		pid = os.fork()
+		if pid == 0:
+			cache.set(('GET', '/'), (200, (), b'body'))
+			os._exit(0)
+		os.waitpid(pid, 0)
+		self.assertEqual(cache.get(('GET', '/')), (200, (), b'body'))
+
+		other = MmapCache(self.path, slots=16, slot_size=256)
+		self.addCleanup(other.close)
+		self.assertEqual(other.keys(), [('GET', '/')])
+		other.delete(('GET', '/'))
+		self.assertIsNone(cache.get(('GET', '/')))
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+	def test_eviction(self):
+		cache = MmapCache(self.path, slots=2, slot_size=256, ways=2)
+		self.addCleanup(cache.close)
+		with mock.patch('time.time', side_effect=[1.0, 2.0, 3.0, 4.0]):
+			cache.set('a', 1)
+			cache.set('b', 2, ttl=10)
+			cache.set('c', 3) # replaces a, the oldest
+		self.assertEqual(sorted(cache.keys()), ['b', 'c'])
+		self.assertEqual(cache.evictions, 1)
+		self.assertIsNone(cache.get('b')) # expired
+
+		cache.clear()
+		cache.set('a', 1)
+		cache.set('b', 2)
+		cache.delete('a')
+		cache.set('b', 3) # replaces b rather than taking a's free slot
+		self.assertEqual(cache.keys(), ['b'])
+		self.assertEqual(cache.get('b'), 3)
+
+		cache.set('big', b'x' * 256)
+		self.assertIsNone(cache.get('big'))
+		cache.clear()
+		self.assertEqual(cache.keys(), [])
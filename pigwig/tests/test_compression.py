@@ -0,0 +1,87 @@
+import gzip
+import unittest
+import zlib
+
+from pigwig import PigWig, Response
+from pigwig.compression import Compression
+from pigwig.tests import wsgi_request
+
+class CompressionTests(unittest.TestCase):
+	def test_negotiate(self):
+		compression = Compression()
+		self.assertEqual(compression.negotiate('gzip, deflate, br'), 'gzip')
+		self.assertEqual(compression.negotiate('gzip;q=0.5, deflate'), 'deflate')
+		self.assertEqual(compression.negotiate('x-gzip'), 'gzip')
+		self.assertEqual(compression.negotiate('*;q=0.1, gzip;q=0'), 'deflate')
+		self.assertIsNone(compression.negotiate('br, identity'))
+		self.assertIsNone(compression.negotiate(None))
+
+	def test_compressible(self):
+		compression = Compression(min_size=10)
+		self.assertTrue(compression.compressible(Response(b'x' * 10, content_type='text/html; charset=utf-8')))
+		self.assertFalse(compression.compressible(Response(b'x' * 9)))
+		self.assertFalse(compression.compressible(Response(b'x' * 10, content_type='image/png')))
+		self.assertTrue(compression.compressible(Response(b'x' * 10, content_type='image/svg+xml')))
+		self.assertFalse(compression.compressible(Response(b'x' * 10, 204)))
+		self.assertFalse(compression.compressible(Response(b'x' * 10, extra_headers=[('Content-Encoding', 'br')])))
+
+	def test_stream(self):
+		closed = []
+		def gen():
+			try:
+				yield b'a' * 100
+				yield b''
+				yield b'b' * 100
+			finally:
+				closed.append(True)
+		response = Response(gen(), etag='"v1"')
+		Compression().compress(response, 'deflate')
+		self.assertEqual(response.etag, 'W/"v1"')
+		self.assertIn(('Content-Encoding', 'deflate'), response.headers)
+
+		decompressor = zlib.decompressobj()
+		# each chunk is flushed, so it can be decompressed as soon as it arrives
+		self.assertEqual(decompressor.decompress(next(response.body)), b'a' * 100)
+		self.assertEqual(decompressor.decompress(next(response.body)), b'b' * 100)
+		response.body.close()
+		self.assertEqual(closed, [True])
+
+	def test_app(self):
+		calls = []
+		def handler(request):
+			calls.append(request.path)
+			return Response('x' * 2000)
+		app = PigWig([
+			('GET', '/', handler, {'cache': 60}),
+			('GET', '/small', lambda request: Response('small')),
+			('GET', '/uncached', lambda request: Response('y' * 2000)),
+		], compression=Compression())
+
+		def get(path, method='GET', **environ):
+			_, headers, body = wsgi_request(app, method, path, **environ)
+			return body, headers
+
+		body, headers = get('/')
+		self.assertEqual(body, b'x' * 2000)
+		self.assertEqual(headers['Vary'], 'Accept-Encoding')
+		for _ in range(2):
+			body, headers = get('/', HTTP_ACCEPT_ENCODING='gzip')
+			self.assertEqual(gzip.decompress(body), b'x' * 2000)
+			self.assertEqual(headers['Content-Encoding'], 'gzip')
+			self.assertEqual(headers['Content-Length'], str(len(body)))
+		self.assertEqual(calls, ['/'])
+		self.assertEqual(app.response_cache.hits, 2) # the second gzip request used the stored variant
+		_, get_headers = get('/', HTTP_ACCEPT_ENCODING='gzip')
+		body, headers = get('/', 'HEAD', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(body, b'')
+		self.assertEqual(headers, get_headers)
+		self.assertEqual(headers['Content-Encoding'], 'gzip')
+		_, get_headers = get('/uncached', HTTP_ACCEPT_ENCODING='gzip')
+		body, headers = get('/uncached', 'HEAD', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(body, b'')
+		self.assertEqual(headers, get_headers)
+		self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+		body, headers = get('/small', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(body, b'small')
+		self.assertNotIn('Vary', headers)
@@ -0,0 +1,109 @@
+import io
+import textwrap
+import tracemalloc
+import typing
+import unittest
+from unittest import mock
+
+from pigwig import PigWig, Response
+from pigwig.memory import MemoryTracker, _resident_size
+from pigwig.tests import wsgi_request
+
+leaked: typing.List[bytearray] = []
+
+def leaky_handler(request, id):
+	leaked.append(bytearray(100000))
+	return Response('ok')
+
+class MemoryTests(unittest.TestCase):
+	def setUp(self):
+		leaked.clear()
+
+	def test_tracker(self):
+		samples = []
+		tracker = MemoryTracker(every=2, routes=['/post/<id>'], token='secret', report=samples.append)
+		app = PigWig([
+			('GET', '/post/<id>', leaky_handler),
+			('GET', '/other', lambda request: Response()),
+			('GET', '/memory', tracker.handler),
+		], memory_tracker=tracker)
+
+		def get(path, query=''):
+			status, _, body = wsgi_request(app, 'GET', path, QUERY_STRING=query)
+			return status, body
+
+		for i in range(4):
+			get('/post/%d' % i)
+			get('/other')
+		self.assertFalse(tracemalloc.is_tracing())
+		self.assertEqual(len(samples), 2)
+		sample = samples[0]
+		self.assertEqual(sample.request.path, '/post/0')
+		self.assertGreaterEqual(sample.net_bytes, 100000)
+		self.assertGreaterEqual(sample.peak, 100000)
+		site, size, _ = sample.sites[0]
+		self.assertIn('test_memory.py', site)
+		self.assertGreaterEqual(size, 100000)
+		stats = tracker.stats['/post/<id>']
+		self.assertEqual(stats.samples, 2)
+		self.assertGreaterEqual(stats.net_bytes, 200000)
+
+		self.assertEqual(get('/memory')[0], '403 Forbidden')
+		status, body = get('/memory', 'token=secret&limit=1')
+		self.assertEqual(status, '200 OK')
+		self.assertIn(b'==== /post/<id> (2 samples, pid ', body)
+		self.assertIn(b'test_memory.py', body)
+
+	def test_already_tracing(self):
+		samples = []
+		tracker = MemoryTracker(every=1, report=samples.append)
+		app = PigWig([('GET', '/post/<id>', leaky_handler)], memory_tracker=tracker)
+		tracemalloc.start()
+		try:
+			app({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/post/1', 'QUERY_STRING': ''}, mock.MagicMock())
+			self.assertTrue(tracemalloc.is_tracing())
+		finally:
+			tracemalloc.stop()
+		self.assertGreaterEqual(samples[0].net_bytes, 100000)
+		self.assertIsNone(samples[0].peak)
+
+	def test_body(self):
+		samples = []
+		tracker = MemoryTracker(every=1, report=samples.append)
+		app = PigWig([('POST', '/upload', lambda request: Response(str(len(request.body))))], memory_tracker=tracker)
+		multipart_body = textwrap.dedent('''\
+			--boundary
+			Content-Disposition: form-data; name="a"
+
+			1
+			--boundary
+			Content-Disposition: form-data; name="file1"; filename="the_file"
+
+			blah blah blah
+			--boundary--
+			''').encode()
+		wsgi_request(app, 'POST', '/upload', CONTENT_TYPE='multipart/form-data; boundary=boundary',
+				**{'wsgi.input': io.BytesIO(multipart_body)})
+		stats = tracker.stats['/upload']
+		self.assertEqual(stats.body_peak, len('a1') + len('file1blah blah blah'))
+		self.assertEqual(stats.multipart_peak, stats.body_peak)
+		self.assertEqual(samples[0].body_bytes, stats.body_peak)
+
+		wsgi_request(app, 'POST', '/upload', CONTENT_TYPE='application/x-www-form-urlencoded',
+				**{'wsgi.input': io.BytesIO(b'a=' + b'x' * 100)})
+		self.assertEqual(stats.body_peak, 101)
+		self.assertEqual(stats.multipart_peak, len('a1') + len('file1blah blah blah'))
+
+		nested: typing.List[typing.Any] = []
+		for _ in range(100000):
+			nested = [nested]
+		self.assertEqual(_resident_size({'a': nested}), 1)
+
+	def test_failed_measurement(self):
+		tracker = MemoryTracker(every=1)
+		app = PigWig([('GET', '/', lambda request: Response('ok'))], memory_tracker=tracker)
+		errors = io.StringIO()
+		with mock.patch.object(tracker, '_add', side_effect=RecursionError):
+			status, _, body = wsgi_request(app, 'GET', '/', **{'wsgi.errors': errors})
+		self.assertEqual((status, body), ('200 OK', b'ok'))
+		self.assertIn('RecursionError', errors.getvalue())
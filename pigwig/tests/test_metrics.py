@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from pigwig import PigWig, Response
+from pigwig.metrics import Metrics
+from pigwig.tests import wsgi_request
+
+class MetricsTests(unittest.TestCase):
+	def test_metrics(self):
+		metrics = Metrics(buckets=(0.5, 1))
+		app = PigWig([
+			('GET', '/post/<id>', lambda request, id: Response((s for s in [b'ab', b'c']))),
+			('GET', '/metrics', metrics.handler),
+		], metrics=metrics)
+
+		def get(path):
+			return wsgi_request(app, 'GET', path)[2]
+
+		get('/post/1')
+		get('/post/2')
+		get('/missing')
+		with mock.patch('time.perf_counter', side_effect=[0, 0.75]):
+			get('/post/3')
+		text = get('/metrics').decode()
+		self.assertIn('pigwig_requests_total{method="GET",route="/post/<id>",code="200"} 3', text)
+		self.assertIn('pigwig_requests_total{method="GET",route="",code="404"} 1', text)
+		self.assertIn('pigwig_response_bytes_total{method="GET",route="/post/<id>",code="200"} 9', text)
+		self.assertIn('pigwig_request_duration_seconds_bucket{method="GET",route="/post/<id>",le="0.5"} 2', text)
+		self.assertIn('pigwig_request_duration_seconds_bucket{method="GET",route="/post/<id>",le="1"} 3', text)
+		self.assertIn('pigwig_request_duration_seconds_count{method="GET",route="/post/<id>"} 3', text)
+
+	def test_directory(self):
+		with tempfile.TemporaryDirectory() as directory:
+			worker = Metrics(directory=directory)
+			worker.observe('GET', '/', 200, 0.1, 10)
+			with mock.patch('os.getpid', return_value=1):
+				worker.flush()
+			metrics = Metrics(directory=directory)
+			metrics.observe('GET', '/', 200, 0.2, 5)
+			requests, durations = metrics.collect()
+		self.assertEqual(requests[('GET', '/', '200')], [2, 15])
+		self.assertAlmostEqual(durations[('GET', '/')][-1], 0.3)
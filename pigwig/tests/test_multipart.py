@@ -0,0 +1,62 @@
+import io
+import unittest
+from unittest import mock
+
+from pigwig import multipart
+from pigwig.exceptions import HTTPException
+
+def _body(*parts, preamble=b''):
+	body = preamble
+	for headers, data in parts:
+		body += b'--boundary\r\n' + headers + b'\r\n\r\n' + data + b'\r\n'
+	return body + b'--boundary--\r\n'
+
+class MultipartTests(unittest.TestCase):
+	def parse(self, body, **kwargs):
+		return multipart.parse_multipart(io.BytesIO(body), {'boundary': b'boundary'}, len(body), **kwargs)
+
+	def test_chunked(self):
+		file_data = b'\r\n--boundaryish\r\n--boundary-\r\n' + bytes(range(256)) * 8
+		body = _body(
+			(b'Content-Disposition: form-data; name="a"', b'1'),
+			(b'Content-Disposition: form-data; name="f"; filename="f.bin"', file_data),
+			(b'Content-Disposition: form-data; name="a"', b''),
+			preamble=b'ignored\r\n',
+		)
+		for size in [1, 7, 64, 4096]:
+			with mock.patch.object(multipart, 'chunk_size', size):
+				form = self.parse(body)
+			self.assertEqual(form['a'], [b'1', b''])
+			self.assertEqual(form['f'][0].filename, 'f.bin')
+			self.assertEqual(form['f'][0].data, file_data)
+			self.assertEqual((form['f'][0].size, form['f'][0].in_memory), (len(file_data), True))
+
+	def test_length(self):
+		body = _body((b'Content-Disposition: form-data; name="a"', b'1'))
+		fp = io.BytesIO(body + b'next request')
+		form = multipart.parse_multipart(fp, {'boundary': b'boundary'}, len(body))
+		self.assertEqual(form, {'a': [b'1']})
+		self.assertEqual(fp.read(), b'next request')
+
+	def test_spool(self):
+		body = _body((b'Content-Disposition: form-data; name="f"; filename="big"', b'x' * 100))
+		with mock.patch.object(multipart, 'spool_size', 10):
+			f = self.parse(body)['f'][0]
+		self.assertIsNot(f.file._file.__class__, io.BytesIO) # rolled over to a real file
+		self.assertEqual((f.size, f.in_memory), (100, False))
+		self.assertEqual(f.file.read(), b'x' * 100)
+
+		old_file = f.file
+		f.data = b'y' * 5
+		self.assertTrue(old_file.closed)
+		self.assertEqual((f.data, f.size, f.in_memory), (b'y' * 5, 5, True))
+
+	def test_limits(self):
+		body = _body(*[(b'Content-Disposition: form-data; name="a"', b'1')] * 3)
+		with self.assertRaises(HTTPException) as cm:
+			self.parse(body, part_limit=2)
+		self.assertEqual(cm.exception.code, 413)
+		with self.assertRaises(HTTPException) as cm:
+			self.parse(body, max_size=len(body) - 1)
+		self.assertEqual(cm.exception.code, 413)
+		self.assertEqual(self.parse(body, max_size=len(body), part_limit=3), {'a': [b'1'] * 3})
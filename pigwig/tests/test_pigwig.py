@@ -1,12 +1,14 @@
+import datetime
 import io
 import math
 import textwrap
 import unittest
 from unittest import mock
 
-from pigwig import PigWig
+from pigwig import PigWig, Response
 from pigwig.exceptions import HTTPException
-from pigwig.pigwig import parse_qs
+from pigwig.request_response import parse_qs
+from pigwig.tests import wsgi_request
 
 class PigWigTests(unittest.TestCase):
 	def test_build_request(self):
@@ -17,34 +19,29 @@ class PigWigTests(unittest.TestCase):
 			'HTTP_COOKIE': 'a=1; a="2"',
 			'wsgi.input': None,
 		}
-		req, err = app.build_request(environ)
-		self.assertIsNone(err)
+		req = app.build_request(environ)
 		self.assertEqual(req.method, 'test method')
 		self.assertEqual(req.path, 'test path?a=1&b=2&b=3&c=你好')
 		self.assertEqual(req.query, {})
 		self.assertEqual(req.cookies['a'].value, '2')
 
 		environ['QUERY_STRING'] = 'a=1&b=2&b=3&c=你好'
-		req, err = app.build_request(environ)
-		self.assertIsNone(err)
+		req = app.build_request(environ)
 		self.assertEqual(req.query, {'a': '1', 'b': ['2', '3'], 'c': '你好'})
 
 		environ['CONTENT_TYPE'] = 'application/json; charset=utf8'
 		environ['wsgi.input'] = io.BytesIO(b'{"a": 1, "a": NaN}')
-		req, err = app.build_request(environ)
-		self.assertIsNone(err)
+		req = app.build_request(environ)
 		self.assertTrue(math.isnan(req.body['a']))
 
 		environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
 		environ['wsgi.input'] = io.BytesIO(b'a=1&b=2&b=3')
-		req, err = app.build_request(environ)
-		self.assertIsNone(err)
+		req = app.build_request(environ)
 		self.assertEqual(req.body, {'a': '1', 'b': ['2', '3']})
 
 		environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded; charset=latin1'
 		environ['wsgi.input'] = io.BytesIO('a=Ï'.encode('latin-1')) # capital I with diaresis, 0xCF in latin-1
-		req, err = app.build_request(environ)
-		self.assertIsNone(err)
+		req = app.build_request(environ)
 		self.assertEqual(req.body, {'a': 'Ï'})
 
 		environ['CONTENT_TYPE'] = 'multipart/form-data; boundary=boundary'
@@ -64,12 +61,193 @@ class PigWigTests(unittest.TestCase):
 		blah blah blah
 		--boundary--
 		''').encode())
-		req, err = app.build_request(environ)
-		self.assertIsNone(err)
+		req = app.build_request(environ)
 		self.assertEqual(req.body['a'], [b'1', b'2'])
 		self.assertEqual(req.body['file1'].data, b'blah blah blah')
 		self.assertEqual(req.body['file1'].filename, 'the_file')
 
+	def test_lazy_request(self):
+		app = PigWig([])
+		body = io.BytesIO(b'{"a": 1}')
+		environ = {
+			'REQUEST_METHOD': 'POST',
+			'PATH_INFO': '/',
+			'QUERY_STRING': 'a=%80',
+			'CONTENT_TYPE': 'application/json',
+			'CONTENT_LENGTH': '8',
+			'HTTP_X_REQUESTED_WITH': 'pigwig',
+			'wsgi.input': body,
+		}
+		req = app.build_request(environ)
+		self.assertEqual(body.tell(), 0)
+		with self.assertRaises(HTTPException) as cm:
+			req.query
+		self.assertEqual(cm.exception.code, 400)
+		self.assertEqual(req.body, {'a': 1})
+		self.assertIs(req.body, req.body)
+		self.assertEqual(req.headers['X-Requested-With'], 'pigwig')
+		self.assertEqual(req.headers['Content-Length'], '8')
+
+		req.query = {'b': '2'}
+		self.assertEqual(req.query, {'b': '2'})
+
+	def test_max_body_size(self):
+		def handler(request):
+			return Response(str(request.body))
+		app = PigWig([
+			('POST', '/', handler),
+			('POST', '/big', handler, {'max_body_size': 100}),
+			('POST', '/ignore', lambda request: Response()),
+			('POST', '/raw', lambda request: Response(request.wsgi_environ['wsgi.input'].read())),
+		], max_body_size=10)
+		start_response = mock.MagicMock()
+
+		def post(path, body, content_length=True):
+			environ = {
+				'REQUEST_METHOD': 'POST',
+				'PATH_INFO': path,
+				'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+				'wsgi.input': io.BytesIO(body),
+				'wsgi.errors': io.StringIO(),
+			}
+			if content_length:
+				environ['CONTENT_LENGTH'] = str(len(body))
+			app(environ, start_response)
+			return environ['wsgi.input']
+
+		fp = post('/', b'a=' + b'1' * 10)
+		self.assertTrue(start_response.call_args[0][0].startswith('413 '))
+		self.assertEqual(fp.tell(), 0)
+		post('/', b'a=' + b'1' * 10, content_length=False)
+		self.assertTrue(start_response.call_args[0][0].startswith('413 '))
+		post('/', b'a=1', content_length=False)
+		start_response.assert_called_with('200 OK', mock.ANY)
+		post('/big', b'a=' + b'1' * 10)
+		start_response.assert_called_with('200 OK', mock.ANY)
+		fp = post('/ignore', b'a=' + b'1' * 10)
+		self.assertTrue(start_response.call_args[0][0].startswith('413 '))
+		self.assertEqual(fp.tell(), 0)
+		post('/raw', b'a=' + b'1' * 10, content_length=False)
+		self.assertTrue(start_response.call_args[0][0].startswith('413 '))
+		post('/raw', b'a=1', content_length=False)
+		start_response.assert_called_with('200 OK', mock.ANY)
+
+	def test_max_multipart_parts(self):
+		app = PigWig([
+			('POST', '/', lambda request: Response(str(len(request.body['a'])))),
+			('POST', '/many', lambda request: Response(str(len(request.body['a']))), {'max_multipart_parts': 3}),
+		], max_multipart_parts=2)
+		body = b''.join(b'--boundary\r\nContent-Disposition: form-data; name="a"\r\n\r\n1\r\n' for _ in range(3))
+		body += b'--boundary--\r\n'
+
+		def post(path):
+			return wsgi_request(app, 'POST', path, CONTENT_TYPE='multipart/form-data; boundary=boundary',
+					CONTENT_LENGTH=str(len(body)), **{'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO()})
+
+		status, _, _ = post('/')
+		self.assertTrue(status.startswith('413 '))
+		status, _, response_body = post('/many')
+		self.assertEqual(status, '200 OK')
+		self.assertEqual(response_body, b'3')
+
+	def test_close_uploads(self):
+		uploads = []
+		def handler(request):
+			uploads.append(request.body['file1'])
+			return Response(request.body['file1'].data)
+		app = PigWig([('POST', '/', handler)])
+		body = (b'--boundary\r\nContent-Disposition: form-data; name="file1"; filename="the_file"\r\n\r\n'
+				b'blah blah blah\r\n--boundary--\r\n')
+		with mock.patch('pigwig.multipart.spool_size', 4):
+			status, _, response_body = wsgi_request(app, 'POST', '/',
+					CONTENT_TYPE='multipart/form-data; boundary=boundary', CONTENT_LENGTH=str(len(body)),
+					**{'wsgi.input': io.BytesIO(body)})
+		self.assertEqual((status, response_body), ('200 OK', b'blah blah blah'))
+		self.assertFalse(uploads[0].in_memory)
+		self.assertTrue(uploads[0].file.closed)
+
+	def test_response_cache(self):
+		calls = []
+		def handler(request):
+			calls.append(request.path)
+			return Response((s.encode() for s in ['a', request.headers.get('Accept-Language', '')]))
+		def cookie_handler(request):
+			calls.append(request.path)
+			response = Response('c')
+			response.set_cookie('c', 'd')
+			return response
+		app = PigWig([
+			('GET', '/', handler, {'cache': 60, 'cache_vary': ['Accept-Language']}),
+			('GET', '/cookie', cookie_handler, {'cache': 60}),
+		])
+
+		def get(path, **environ):
+			return wsgi_request(app, 'GET', path, **environ)[2]
+
+		self.assertEqual(get('/', HTTP_ACCEPT_LANGUAGE='en'), b'aen')
+		_, headers, body = wsgi_request(app, 'GET', '/', HTTP_ACCEPT_LANGUAGE='en')
+		self.assertEqual(body, b'aen')
+		self.assertEqual(headers['Vary'], 'Accept-Language')
+		self.assertEqual(get('/', HTTP_ACCEPT_LANGUAGE='fr'), b'afr')
+		self.assertEqual(get('/', QUERY_STRING='a=1'), b'a')
+		self.assertEqual(calls, ['/'] * 3)
+		self.assertEqual((app.response_cache.hits, app.response_cache.misses), (1, 3))
+
+		get('/cookie')
+		get('/cookie')
+		self.assertEqual(calls[3:], ['/cookie'] * 2)
+
+	def test_conditional_get(self):
+		def gen():
+			raise AssertionError('body should not be iterated')
+			yield b''
+		app = PigWig([
+			('GET', '/', lambda request: Response('hello')),
+			('GET', '/gen', lambda request: Response(gen(), etag='"v1"',
+					last_modified=datetime.datetime(2020, 1, 2, 3, 4, 5))),
+			('POST', '/', lambda request: Response('hello')),
+		])
+
+		def request(method, path, **environ):
+			return wsgi_request(app, method, path, **environ)
+
+		status, headers, body = request('GET', '/')
+		etag = headers['ETag']
+		self.assertTrue(etag.startswith('W/"'))
+		status, headers, body = request('GET', '/', HTTP_IF_NONE_MATCH='"other", ' + etag)
+		self.assertEqual((status, body), ('304 Not Modified', b''))
+		self.assertEqual(headers['ETag'], etag)
+		self.assertNotIn('Content-Type', headers)
+		status, headers, body = request('POST', '/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(status, '200 OK')
+
+		status, headers, body = request('GET', '/gen', HTTP_IF_NONE_MATCH='W/"v1"')
+		self.assertEqual(status, '304 Not Modified')
+		self.assertEqual(headers['Last-Modified'], 'Thu, 02 Jan 2020 03:04:05 GMT')
+		status, headers, body = request('GET', '/gen', HTTP_IF_MODIFIED_SINCE='Thu, 02 Jan 2020 03:04:05 GMT')
+		self.assertEqual(status, '304 Not Modified')
+		with self.assertRaises(AssertionError):
+			request('GET', '/gen', HTTP_IF_MODIFIED_SINCE='Thu, 02 Jan 2020 03:04:04 GMT')
+
+	def test_head(self):
+		def gen():
+			raise AssertionError('body should not be iterated')
+			yield b''
+		app = PigWig([
+			('GET', '/', lambda request: Response('hello')),
+			('GET', '/gen', lambda request: Response(gen())),
+		])
+		status, headers, body = wsgi_request(app, 'GET', '/')
+		self.assertEqual(body, b'hello')
+		self.assertEqual(headers['Content-Length'], '5')
+
+		status, headers, body = wsgi_request(app, 'HEAD', '/')
+		self.assertEqual((status, body), ('200 OK', b''))
+		self.assertEqual(headers['Content-Length'], '5')
+
+		status, headers, body = wsgi_request(app, 'HEAD', '/gen')
+		self.assertEqual((status, body), ('200 OK', b''))
+
 	def test_parse_qs(self):
 		self.assertEqual(parse_qs('a=1&b=2'), {'a': '1', 'b': '2'})
 		self.assertEqual(parse_qs(''), {})
@@ -0,0 +1,42 @@
+import os
+import signal
+import socket
+import time
+import unittest
+import urllib.request
+
+from pigwig import PigWig, Response
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+class PreforkTests(unittest.TestCase):
+	def test_serve(self):
+		with socket.socket() as s:
+			s.bind(('127.0.0.1', 0))
+			port = s.getsockname()[1]
+		app = PigWig([('GET', '/', lambda request: Response(str(os.getpid())))])
+
+		master = os.fork()
+		if master == 0:
+			devnull = os.open(os.devnull, os.O_WRONLY)
+			os.dup2(devnull, 1)
+			os.dup2(devnull, 2)
+			try:
+				app.serve('127.0.0.1', port, workers=2, max_requests=1)
+			finally:
+				os._exit(0)
+
+		try:
+			pids = set()
+			for _ in range(4):
+				for _ in range(50):
+					try:
+						with urllib.request.urlopen('http://127.0.0.1:%d/' % port, timeout=5) as r:
+							pids.add(r.read())
+						break
+					except OSError:
+						time.sleep(0.05)
+			self.assertEqual(len(pids), 4) # every worker was replaced after one request
+		finally:
+			os.kill(master, signal.SIGTERM)
+			_, status = os.waitpid(master, 0)
+		self.assertEqual(status, 0)
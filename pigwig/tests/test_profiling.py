@@ -0,0 +1,54 @@
+import marshal
+import os
+import signal
+import tempfile
+import unittest
+from unittest import mock
+
+from pigwig import PigWig, Response
+from pigwig.profiling import Profiler
+from pigwig.tests import wsgi_request
+
+def slow_function():
+	return sum(range(1000))
+
+class ProfilingTests(unittest.TestCase):
+	def test_profiler(self):
+		profiler = Profiler(every=2, routes=['/post/<id>'], token='secret')
+		app = PigWig([
+			('GET', '/post/<id>', lambda request, id: Response(str(slow_function()))),
+			('GET', '/other', lambda request: Response(str(slow_function()))),
+			('GET', '/profile', profiler.handler),
+		], profiler=profiler)
+
+		def get(path, query=''):
+			status, _, body = wsgi_request(app, 'GET', path, QUERY_STRING=query)
+			return status, body
+
+		for i in range(4):
+			get('/post/%d' % i)
+			get('/other')
+		self.assertEqual(profiler.samples, {'/post/<id>': 2})
+
+		self.assertEqual(get('/profile')[0], '403 Forbidden')
+		self.assertEqual(get('/profile', 'token=wrong')[0], '403 Forbidden')
+		status, body = get('/profile', 'token=secret')
+		self.assertEqual(status, '200 OK')
+		self.assertIn(b'==== /post/<id> (2 samples) ====', body)
+		self.assertIn(b'slow_function', body)
+		status, body = get('/profile', 'token=secret&route=/post/<id>&format=pstats')
+		self.assertTrue(any(key[2] == 'slow_function' for key in marshal.loads(body)))
+
+		with tempfile.TemporaryDirectory() as directory:
+			profiler.directory = directory
+			paths = profiler.dump()
+			self.assertEqual([os.path.basename(path) for path in paths], ['post_id.%d.pstats' % os.getpid()])
+
+	def test_signal(self):
+		with mock.patch('signal.signal') as mock_signal:
+			profiler = Profiler(signum=signal.SIGUSR2)
+		toggle = mock_signal.call_args[0][1]
+		toggle(signal.SIGUSR2, None)
+		self.assertFalse(profiler.enabled)
+		toggle(signal.SIGUSR2, None)
+		self.assertTrue(profiler.enabled)
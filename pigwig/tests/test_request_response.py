@@ -1,8 +1,11 @@
 import http.cookies
+import io
 import json
 import unittest
+from unittest import mock
 
 from pigwig import PigWig, Request, Response
+from pigwig.json_codec import JSONCodec
 from pigwig.request_response import HTTPHeaders
 
 class ResponseTests(unittest.TestCase):
@@ -22,6 +25,36 @@ class ResponseTests(unittest.TestCase):
 		self.assertGreater(len(chunks), 1)
 		self.assertEqual(b''.join(chunks), json.dumps(big_obj).encode())
 
+	def test_json_codec(self):
+		codec = JSONCodec(stream_min_items=3)
+		self.assertEqual(codec.encode({'a': [1, 2]}), b'{"a":[1,2]}')
+		self.assertEqual(codec.encode([1, 2, 3]), b'[1,2,3]') # streamed but small enough to buffer
+		codec = JSONCodec(stream_min_items=1, chunk_size=16, buffer_size=64)
+		self.assertEqual(codec.encode(['a' * 8] * 5), json.dumps(['a' * 8] * 5, separators=(',', ':')).encode())
+		chunks = list(codec.encode(['a' * 8] * 50))
+		self.assertGreater(len(chunks), 1)
+		self.assertEqual(b''.join(chunks), json.dumps(['a' * 8] * 50, separators=(',', ':')).encode())
+
+		self.assertEqual(codec.handle_json(io.BytesIO('"é"'.encode('utf-16')), None, {}), 'é')
+		self.assertEqual(codec.handle_json(io.BytesIO('"é"'.encode('latin-1')), None, {'charset': 'latin-1'}), 'é')
+
+		class UpperCodec(JSONCodec):
+			def loads(self, data):
+				return super().loads(data).upper()
+
+		app = PigWig([('POST', '/', lambda request: Response.json({'body': request.body}))],
+				json_codec=UpperCodec())
+		environ = {
+			'REQUEST_METHOD': 'POST',
+			'PATH_INFO': '/',
+			'CONTENT_TYPE': 'application/json',
+			'wsgi.input': io.BytesIO(b'"abc"'),
+		}
+		start_response = mock.MagicMock()
+		body = app(environ, start_response)
+		self.assertEqual(b''.join(body), b'{"body":"ABC"}')
+		self.assertEqual(HTTPHeaders(start_response.call_args[0][1])['Content-Length'], '14')
+
 	def test_cookie(self):
 		app = PigWig([])
 		r = Response()
@@ -56,3 +89,31 @@ class HTTPHeadersTests(unittest.TestCase):
 		h = HTTPHeaders()
 		h['COOKIE'] = 'abc'
 		self.assertEqual(h['cookie'], 'abc')
+
+	def test_environ(self):
+		environ = {
+			'HTTP_ACCEPT_ENCODING': 'gzip, deflate',
+			'CONTENT_TYPE': 'text/plain',
+			'wsgi.input': None,
+		}
+		h = HTTPHeaders.from_environ(environ)
+		self.assertEqual(h['Accept-Encoding'], 'gzip, deflate')
+		self.assertEqual(h.get_all('accept-encoding'), ['gzip', 'deflate'])
+		self.assertEqual(h.get_all('Range'), [])
+		self.assertEqual(h['content-type'], 'text/plain')
+		self.assertIn('Content-Type', h)
+		self.assertNotIn('wsgi.input', h)
+		self.assertEqual(sorted(h), ['accept-encoding', 'content-type'])
+
+		h['X-Forwarded-For'] = '127.0.0.1'
+		self.assertEqual(environ['HTTP_X_FORWARDED_FOR'], '127.0.0.1')
+
+	def test_get_all(self):
+		h = HTTPHeaders({
+			'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT',
+			'If-None-Match': '"a,b", W/"c\\"d,", "e"',
+			'Cache-Control': 'no-cache,, max-age=0',
+		})
+		self.assertEqual(h.get_all('If-Modified-Since'), ['Wed, 21 Oct 2015 07:28:00 GMT'])
+		self.assertEqual(h.get_all('if-none-match'), ['"a,b"', 'W/"c\\"d,"', '"e"'])
+		self.assertEqual(h.get_all('Cache-Control'), ['no-cache', 'max-age=0'])
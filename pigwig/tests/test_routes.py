@@ -48,3 +48,55 @@ class RouteTests(unittest.TestCase):
 			build_route_tree([
 				('GET', '/<p1>//', 1),
 			])
+
+	def test_static_routes(self):
+		t = build_route_tree([
+			('GET', '/', 0),
+			('GET', '/one/two', 1),
+			('POST', '/one/two', 2),
+			('GET', '/one/<p>/three', 3),
+		])
+		self.assertEqual(t.static_routes.keys(), {'/', '/one/two'})
+		self.assertEqual(t.route('POST', '/one/two'), (2, {}))
+		self.assertEqual(t.route('GET', '/one/two/'), (1, {}))
+		self.assertEqual(t.route('GET', '/one/x/three'), (3, {'p': 'x'}))
+		with self.assertRaises(exceptions.HTTPException) as cm:
+			t.route('PUT', '/one/two')
+		self.assertEqual(cm.exception.code, 405)
+		with self.assertRaises(exceptions.HTTPException) as cm:
+			t.route('GET', '/one/two/three') # static children win; no backtracking into <p>
+		self.assertEqual(cm.exception.code, 404)
+		with self.assertRaises(exceptions.HTTPException) as cm:
+			t.route('GET', '/one/x')
+		self.assertEqual(cm.exception.code, 404)
+
+	def test_cache(self):
+		t = build_route_tree([
+			('GET', '/post/<id>', 1),
+		], cache_size=2)
+		self.assertEqual(t.route('GET', '/post/1'), (1, {'id': '1'}))
+		t.route('GET', '/post/1')[1]['id'] = 'mutated'
+		self.assertEqual(t.route('GET', '/post/1'), (1, {'id': '1'}))
+		for _ in range(2):
+			with self.assertRaises(exceptions.HTTPException) as cm:
+				t.route('POST', '/post/1')
+			self.assertEqual(cm.exception.code, 405)
+		self.assertEqual((t.cache.hits, t.cache.misses), (3, 2))
+
+		t.route('GET', '/post/2') # evicts ('GET', '/post/1'), the least recently used
+		self.assertEqual(t.cache.evictions, 1)
+		t.route('GET', '/post/1')
+		self.assertEqual(t.cache.misses, 4)
+
+	def test_head(self):
+		t = build_route_tree([
+			('GET', '/', 1),
+			('GET', '/both', 2),
+			('HEAD', '/both', 3),
+			('POST', '/post', 4),
+		])
+		self.assertEqual(t.route('HEAD', '/'), (1, {}))
+		self.assertEqual(t.route('HEAD', '/both'), (3, {}))
+		with self.assertRaises(exceptions.HTTPException) as cm:
+			t.route('HEAD', '/post')
+		self.assertEqual(cm.exception.code, 405)
@@ -0,0 +1,73 @@
+import http.client
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from pigwig import PigWig, Response
+from pigwig.server import ThreadedServer
+
+class ThreadedServerTests(unittest.TestCase):
+	def setUp(self):
+		def gen():
+			yield b'a'
+			yield b'b'
+		app = PigWig([
+			('GET', '/', lambda request: Response('hello')),
+			('GET', '/gen', lambda request: Response(gen())),
+			('POST', '/echo', lambda request: Response(request.wsgi_environ['wsgi.input'].read())),
+			('GET', '/cookies', lambda request: Response(
+					'&'.join('%s=%s' % (k, v.value) for k, v in sorted(request.cookies.items())))),
+		])
+		self.server = ThreadedServer(('127.0.0.1', 0), app, threads=2, idle_timeout=1)
+		patcher = mock.patch.object(self.server.RequestHandlerClass, 'log_message')
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+		self.thread.start()
+		self.port = self.server.server_address[1]
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		self.thread.join()
+
+	def test_keep_alive(self):
+		conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+		conn.request('GET', '/')
+		response = conn.getresponse()
+		self.assertEqual(response.read(), b'hello')
+		sock = conn.sock
+		conn.request('GET', '/gen')
+		response = conn.getresponse()
+		self.assertEqual(response.getheader('Transfer-Encoding'), 'chunked')
+		self.assertEqual(response.read(), b'ab')
+		conn.request('POST', '/echo', body=iter([b'12', b'345']), encode_chunked=True)
+		self.assertEqual(conn.getresponse().read(), b'12345')
+		self.assertIs(conn.sock, sock) # all on one connection
+		conn.close()
+
+	def test_pipelining(self):
+		with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+			sock.sendall(b'POST /echo HTTP/1.1\r\nHost: x\r\nContent-Length: 3\r\n\r\nabc'
+					b'GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+			data = b''
+			while True:
+				chunk = sock.recv(4096)
+				if not chunk:
+					break
+				data += chunk
+		self.assertEqual(data.count(b'HTTP/1.1 200 OK'), 2)
+		self.assertTrue(data.endswith(b'hello'))
+		self.assertIn(b'\r\n\r\nabc', data)
+
+	def test_repeated_cookie_headers(self):
+		with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+			sock.sendall(b'GET /cookies HTTP/1.1\r\nHost: x\r\nCookie: a=1\r\nCookie: b=2\r\nConnection: close\r\n\r\n')
+			data = b''
+			while True:
+				chunk = sock.recv(4096)
+				if not chunk:
+					break
+				data += chunk
+		self.assertTrue(data.endswith(b'\r\n\r\na=1&b=2'))
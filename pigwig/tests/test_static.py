@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+import wsgiref.util
+
+from pigwig import PigWig
+from pigwig.compression import Compression
+from pigwig.static import static_handler
+from pigwig.tests import wsgi_request
+
+class StaticTests(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		root = os.path.join(self.tempdir.name, 'static')
+		os.mkdir(root)
+		with open(os.path.join(root, 'a.txt'), 'wb') as f:
+			f.write(b'0123456789')
+		with open(os.path.join(self.tempdir.name, 'secret'), 'wb') as f:
+			f.write(b'secret')
+		self.app = PigWig([('GET', '/static/<path:path>', static_handler(root))])
+
+	def tearDown(self):
+		self.tempdir.cleanup()
+
+	def get(self, path, **environ):
+		return wsgi_request(self.app, 'GET', path, **environ)
+
+	def test_file(self):
+		status, headers, body = self.get('/static/a.txt', **{'wsgi.file_wrapper': wsgiref.util.FileWrapper})
+		self.assertEqual((status, body), ('200 OK', b'0123456789'))
+		self.assertEqual(headers['Content-Type'], 'text/plain')
+		self.assertEqual(headers['Content-Length'], '10')
+		status, headers, body = self.get('/static/a.txt', HTTP_IF_NONE_MATCH=headers['ETag'])
+		self.assertEqual((status, body), ('304 Not Modified', b''))
+
+		self.assertEqual(self.get('/static/../secret')[0], '404 Not Found')
+		self.assertEqual(self.get('/static/')[0], '404 Not Found')
+		self.assertEqual(self.get('/static/missing')[0], '404 Not Found')
+
+	def test_range(self):
+		status, headers, body = self.get('/static/a.txt', HTTP_RANGE='bytes=2-4')
+		self.assertEqual((status, body), ('206 Partial Content', b'234'))
+		self.assertEqual(headers['Content-Range'], 'bytes 2-4/10')
+		self.assertEqual(headers['Content-Length'], '3')
+		status, headers, body = self.get('/static/a.txt', HTTP_RANGE='bytes=7-')
+		self.assertEqual((status, body), ('206 Partial Content', b'789'))
+		status, headers, body = self.get('/static/a.txt', HTTP_RANGE='bytes=-2')
+		self.assertEqual((status, body), ('206 Partial Content', b'89'))
+		status, headers, body = self.get('/static/a.txt', HTTP_RANGE='bytes=10-')
+		self.assertTrue(status.startswith('416 '))
+		self.assertEqual(headers['Content-Range'], 'bytes */10')
+		status, headers, body = self.get('/static/a.txt', HTTP_RANGE='bytes=0-1,4-5')
+		self.assertEqual((status, body), ('200 OK', b'0123456789'))
+		status, headers, body = self.get('/static/a.txt', HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"')
+		self.assertEqual(status, '200 OK')
+
+	def test_range_compression(self):
+		root = os.path.join(self.tempdir.name, 'static')
+		with open(os.path.join(root, 'a.css'), 'wb') as f:
+			f.write(b'a { color: red }\n' * 500)
+		app = PigWig([('GET', '/static/<path:path>', static_handler(root))], compression=Compression())
+		status, headers, body = wsgi_request(app, 'GET', '/static/a.css', HTTP_RANGE='bytes=0-1999',
+				HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(status, '206 Partial Content')
+		self.assertEqual(headers['Content-Range'], 'bytes 0-1999/8500')
+		self.assertNotIn('Content-Encoding', headers)
+		self.assertEqual(headers['Content-Length'], '2000')
+		self.assertEqual(body, (b'a { color: red }\n' * 500)[:2000])
@@ -0,0 +1,84 @@
+import functools
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from pigwig import PigWig, Request, Response
+from pigwig.templates_jinja import JinjaTemplateEngine
+
+try:
+	import jinja2
+except ImportError:
+	jinja2 = None # type: ignore[assignment]
+
+@unittest.skipIf(jinja2 is None, 'jinja2 not installed')
+class JinjaTests(unittest.TestCase):
+	def setUp(self):
+		self.template_dir = tempfile.TemporaryDirectory()
+		self.addCleanup(self.template_dir.cleanup)
+		with open(os.path.join(self.template_dir.name, 'list.jinja2'), 'w') as f:
+			f.write('{% for i in items %}<li>{{ i }}é</li>{% endfor %}')
+
+	def test_stream(self):
+		engine = JinjaTemplateEngine(self.template_dir.name, chunk_size=64)
+		context = {'items': range(100)}
+		chunks = list(engine.stream('list.jinja2', context))
+		self.assertGreater(len(chunks), 1)
+		self.assertEqual(b''.join(chunks).decode('utf-8'), engine.render('list.jinja2', context))
+
+		with self.assertRaises(jinja2.TemplateNotFound):
+			engine.stream('missing.jinja2', {})
+
+		app = PigWig([], template_dir=self.template_dir.name)
+		request = Request(app, 'GET', '/')
+		response = Response.render(request, 'list.jinja2', context, stream=True)
+		self.assertEqual(b''.join(response.body), b''.join(chunks))
+
+	def test_precompile(self):
+		with tempfile.TemporaryDirectory() as cache_dir:
+			engine = JinjaTemplateEngine(self.template_dir.name, bytecode_cache_dir=cache_dir, precompile=True)
+			self.assertEqual(len(engine.jinja_env.cache), 1)
+			self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+			engine = JinjaTemplateEngine(self.template_dir.name, bytecode_cache_dir=cache_dir)
+			with unittest.mock.patch.object(engine.jinja_env, 'compile') as compile:
+				engine.render('list.jinja2', {'items': [1]})
+			compile.assert_not_called()
+
+	def test_precompile_skips_other_files(self):
+		with open(os.path.join(self.template_dir.name, 'app.js'), 'w') as f:
+			f.write('var x = {{;')
+		with open(os.path.join(self.template_dir.name, 'logo.png'), 'wb') as f:
+			f.write(b'\x89PNG\r\n\x1a\n\xff\xfe{#')
+		engine = JinjaTemplateEngine(self.template_dir.name, precompile=True)
+		self.assertEqual(engine.precompile(), ['list.jinja2'])
+
+		engine = JinjaTemplateEngine(self.template_dir.name, precompile_filter=lambda name: name.endswith('.js'))
+		with self.assertRaises(jinja2.TemplateSyntaxError):
+			engine.precompile()
+
+	def test_render_cache(self):
+		with open(os.path.join(self.template_dir.name, 'fragment.jinja2'), 'w') as f:
+			f.write('{{ a }}{% cache "frag", 60 %}{{ b }}{% endcache %}')
+		engine = JinjaTemplateEngine(self.template_dir.name, render_cache_size=10)
+		self.assertEqual(engine.render('fragment.jinja2', {'a': 1, 'b': 2}), '12')
+		self.assertEqual(engine.render('fragment.jinja2', {'a': 3, 'b': 4}), '32')
+		engine.invalidate_fragment('frag')
+		self.assertEqual(engine.render('fragment.jinja2', {'a': 3, 'b': 4}), '34')
+
+		app = PigWig([], template_dir=self.template_dir.name,
+				template_engine=functools.partial(JinjaTemplateEngine, render_cache_size=10))
+		request = Request(app, 'GET', '/')
+		response = Response.render(request, 'list.jinja2', {'items': [1]}, cache_key='k')
+		self.assertEqual(response.body, '<li>1é</li>')
+		response = Response.render(request, 'list.jinja2', {'items': [2]}, cache_key='k')
+		self.assertEqual(response.body, '<li>1é</li>')
+		app.template_engine.invalidate('list.jinja2')
+		response = Response.render(request, 'list.jinja2', {'items': [2]}, cache_key='k')
+		self.assertEqual(response.body, '<li>2é</li>')
+
+		Response.render(request, 'list.jinja2', {'items': [3]}, cache_key='ttl', ttl=1)
+		with unittest.mock.patch('time.monotonic', return_value=1e12):
+			response = Response.render(request, 'list.jinja2', {'items': [4]}, cache_key='ttl')
+		self.assertEqual(response.body, '<li>4é</li>') # expired
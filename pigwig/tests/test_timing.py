@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+
+from pigwig import PigWig, Response
+from pigwig.timing import NO_TIMING, Timing
+
+class TimingTests(unittest.TestCase):
+	def test_server_timing(self):
+		def handler(request):
+			with request.timing.span('db', 'load "posts"'):
+				pass
+			return Response.json({'a': request.query['a']})
+		timing_handler = mock.MagicMock()
+		app = PigWig([('GET', '/', handler)], server_timing=True, timing_handler=timing_handler)
+		start_response = mock.MagicMock()
+		environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'QUERY_STRING': 'a=1', 'wsgi.input': None}
+		b''.join(app(environ, start_response))
+
+		header = dict(start_response.call_args[0][1])['Server-Timing']
+		names = [metric.split(';')[0] for metric in header.split(', ')]
+		self.assertEqual(names, ['route', 'db', 'query', 'handler', 'serialize', 'total'])
+		self.assertIn(r'db;dur=', header)
+		self.assertIn(r';desc="load \"posts\""', header)
+		request, timing = timing_handler.call_args[0]
+		self.assertIs(request.timing, timing)
+
+	def test_disabled(self):
+		seen = []
+		def handler(request):
+			seen.append(request.timing)
+			with request.timing.span('db'):
+				pass
+			return Response('')
+		app = PigWig([('GET', '/', handler)])
+		start_response = mock.MagicMock()
+		app({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'wsgi.input': None}, start_response)
+		self.assertIs(seen[0], NO_TIMING)
+		self.assertEqual(NO_TIMING.spans, [])
+		self.assertNotIn('Server-Timing', dict(start_response.call_args[0][1]))
+
+	def test_add(self):
+		timing = Timing()
+		timing.add('cache', 1500000)
+		self.assertEqual(timing.header(), 'cache;dur=1.500')
@@ -0,0 +1,78 @@
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+
+from pigwig import PigWig, Response
+from pigwig.watchdog import SlowRequest, Watchdog, log_slow_request
+
+class WatchdogTests(unittest.TestCase):
+	def test_watchdog(self):
+		samples = []
+		sampled = threading.Event()
+		release = threading.Event()
+		def handler(slow):
+			samples.append(slow)
+			if slow.sample == 3:
+				sampled.set()
+		watchdog = Watchdog(threshold=0.1, interval=0.01, max_samples=3, handler=handler)
+		self.addCleanup(watchdog.stop)
+
+		def stuck_handler(request, id):
+			release.wait(5)
+			return Response('done')
+		app = PigWig([('GET', '/post/<id>', stuck_handler)], watchdog=watchdog)
+
+		environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/post/1', 'QUERY_STRING': '', 'wsgi.input': None}
+		result = []
+		thread = threading.Thread(target=lambda: result.append(b''.join(app(environ, mock.MagicMock()))))
+		thread.start()
+		self.assertTrue(sampled.wait(5))
+		time.sleep(0.05) # no more than max_samples are taken
+		release.set()
+		thread.join()
+		self.assertEqual(result, [b'done'])
+
+		self.assertEqual(len(samples), 3)
+		slow = samples[0]
+		self.assertEqual(slow.request.route.path, '/post/<id>')
+		self.assertEqual(slow.thread_id, thread.ident)
+		self.assertEqual(slow.sample, 1)
+		self.assertIn('in stuck_handler', slow.stack)
+		self.assertFalse(slow.unchanged)
+		self.assertEqual([slow.sample for slow in samples], [1, 2, 3])
+		self.assertTrue(all(slow.unchanged for slow in samples[1:])) # the handler is still waiting
+		self.assertLess(samples[0].elapsed, samples[2].elapsed)
+		self.assertEqual(watchdog._in_flight, {})
+
+	def test_concurrent_start(self):
+		watchdog = Watchdog(interval=60)
+		self.addCleanup(watchdog.stop)
+		barrier = threading.Barrier(8)
+		def begin():
+			barrier.wait()
+			watchdog.begin(mock.Mock())
+		threads = [threading.Thread(target=begin) for _ in range(8)]
+		with mock.patch.object(watchdog, '_start', wraps=watchdog._start) as start:
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		self.assertEqual(start.call_count, 1)
+		self.assertEqual(set(watchdog._in_flight), {thread.ident for thread in threads})
+
+	def test_log(self):
+		app = PigWig([('GET', '/post/<id>', lambda request, id: Response())])
+		errors = io.StringIO()
+		environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/post/1', 'QUERY_STRING': '', 'wsgi.errors': errors}
+		request = app.build_request(environ)
+		app._dispatch(request, None)
+		log_slow_request(SlowRequest(request, 6.25, 1, '  File "x.py", line 1, in f\n', 2))
+		self.assertEqual(errors.getvalue(), 'slow request: GET /post/1 (route /post/<id>) running for 6.2s, sample 2:\n'
+				'  File "x.py", line 1, in f\n')
+		errors.truncate(0)
+		errors.seek(0)
+		log_slow_request(SlowRequest(request, 7.25, 1, '  File "x.py", line 1, in f\n', 3, True))
+		self.assertEqual(errors.getvalue(),
+				'slow request: GET /post/1 (route /post/<id>) running for 7.2s, sample 3: stack unchanged\n')
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import time
+import typing
+
+class Timing:
+	"""
+	the timed spans of one request, available as ``request.timing`` when a :class:`.PigWig` app has
+	``server_timing`` or a ``timing_handler``. pigwig records these spans:
+
+	* ``query``, ``cookies``, and ``body`` - parsing them, the first time they're accessed
+	* ``route`` - matching the route (and looking in the response cache)
+	* ``handler`` - the route handler, including any spans it records
+	* ``render`` - :func:`.Response.render`. streamed pages render after the headers are sent, so
+	  this only covers loading the template
+	* ``serialize`` - encoding the body (JSON encoding with a ``json_codec``, ``str`` encoding)
+	* ``compress`` - compressing a ``bytes`` body
+	* ``total`` - everything before the headers are sent
+
+	handlers add their own with :func:`span`::
+
+		with request.timing.span('db', 'load posts'):
+			posts = db.load_posts()
+
+	has a ``spans`` attr: a list of ``(name, nanoseconds, description)`` tuples in the order they ended
+	"""
+
+	enabled = True
+
+	def __init__(self, start: int | None=None) -> None:
+		if start is None:
+			start = time.perf_counter_ns()
+		self.start = start
+		self.spans: list[tuple[str, int, str | None]] = []
+
+	def span(self, name: str, description: str | None=None) -> typing.ContextManager[typing.Any]:
+		""" a context manager that records how long its block takes """
+		return _Span(self, name, description)
+
+	def add(self, name: str, nanoseconds: int, description: str | None=None) -> None:
+		""" record a span that was timed some other way """
+		self.spans.append((name, nanoseconds, description))
+
+	def header(self) -> str:
+		""" the spans formatted for a ``Server-Timing`` header. durations are in milliseconds """
+		metrics = []
+		for name, nanoseconds, description in self.spans:
+			metric = '%s;dur=%.3f' % (name, nanoseconds / 1e6)
+			if description is not None:
+				metric += ';desc="%s"' % description.replace('\\', '\\\\').replace('"', '\\"')
+			metrics.append(metric)
+		return ', '.join(metrics)
+
+class _Span:
+	__slots__ = ('description', 'name', 'start', 'timing')
+
+	def __init__(self, timing: Timing, name: str, description: str | None) -> None:
+		self.timing = timing
+		self.name = name
+		self.description = description
+		self.start = 0
+
+	def __enter__(self) -> _Span:
+		self.start = time.perf_counter_ns()
+		return self
+
+	def __exit__(self, *exc_info: typing.Any) -> None:
+		self.timing.spans.append((self.name, time.perf_counter_ns() - self.start, self.description))
+
+class _NoTiming(Timing):
+	""" what ``request.timing`` is when timing is off. every method does nothing """
+
+	enabled = False
+
+	def __init__(self) -> None:
+		self.start = 0
+		self.spans = []
+
+	def span(self, name: str, description: str | None=None) -> typing.ContextManager[typing.Any]:
+		return _null_span
+
+	def add(self, name: str, nanoseconds: int, description: str | None=None) -> None:
+		pass
+
+class _NullSpan:
+	__slots__ = ()
+
+	def __enter__(self) -> None:
+		pass
+
+	def __exit__(self, *exc_info: typing.Any) -> None:
+		pass
+
+_null_span = _NullSpan()
+NO_TIMING: Timing = _NoTiming()
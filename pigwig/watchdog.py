@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+import traceback
+import typing
+
+if typing.TYPE_CHECKING:
+	from .request_response import Request
+
+class SlowRequest(typing.NamedTuple):
+	""" one stack sample of a slow request, passed to a :class:`Watchdog`'s ``handler`` """
+
+	request: Request
+	elapsed: float #: seconds since the request started
+	thread_id: int
+	stack: str #: formatted like a traceback, most recent call last
+	sample: int #: 1 for the first sample of this request, 2 for the next...
+	unchanged: bool = False #: whether ``stack`` is the same as the previous sample's
+
+def log_slow_request(slow: SlowRequest) -> None:
+	"""
+	the default ``handler``: writes the request and stack to ``wsgi.errors`` (or stderr). an
+	unchanged stack isn't written again
+	"""
+	request = slow.request
+	route = request.route.path if request.route is not None else None
+	errors = typing.cast(typing.TextIO, request.wsgi_environ.get('wsgi.errors', sys.stderr))
+	if slow.unchanged:
+		errors.write('slow request: %s %s (route %s) running for %.1fs, sample %d: stack unchanged\n' % (
+				request.method, request.path, route, slow.elapsed, slow.sample))
+	else:
+		errors.write('slow request: %s %s (route %s) running for %.1fs, sample %d:\n%s' % (
+				request.method, request.path, route, slow.elapsed, slow.sample, slow.stack))
+
+class Watchdog:
+	"""
+	watches the requests a :class:`.PigWig` app (see its ``watchdog`` param) is handling from a
+	background thread. once a request has run for ``threshold`` seconds, the stack of the thread
+	handling it is sampled with ``sys._current_frames`` every ``interval`` seconds and passed to
+	``handler`` so you can see where it's stuck. samples that find the same stack as the previous
+	one are marked ``unchanged`` (and logged without it), so a request stuck in one place still
+	shows up until ``max_samples``.
+
+	requests are watched until the app returns the response to the WSGI server, so a stuck
+	streamed body isn't caught. under ASGI, only plain (non-``async``) handlers are watched, since
+	``async`` ones share the event loop's thread
+
+	:type threshold: float
+	:param threshold: how many seconds a request runs before its stack is sampled
+	:type interval: float
+	:param interval: how many seconds between samples (and checks for slow requests)
+	:type max_samples: int
+	:param max_samples: the most samples to take of one request
+	:param handler: a function that is passed a :class:`SlowRequest` for each sample. it runs on
+	  the watchdog thread. defaults to :func:`log_slow_request`
+	"""
+
+	def __init__(self, threshold: float=5.0, interval: float=1.0, max_samples: int=10,
+			handler: typing.Callable[[SlowRequest], typing.Any]=log_slow_request) -> None:
+		self.threshold = threshold
+		self.interval = interval
+		self.max_samples = max_samples
+		self.handler = handler
+		self._in_flight: dict[int, _InFlight] = {}
+		self._pid: int | None = None
+		self._lock = threading.Lock()
+		self._stopped = threading.Event()
+
+	def begin(self, request: Request) -> None:
+		""" start watching ``request``, which is being handled on this thread """
+		if self._pid != os.getpid(): # not started yet, or we're in a forked worker
+			with self._lock:
+				if self._pid != os.getpid(): # another thread didn't just start it
+					self._start()
+		self._in_flight[threading.get_ident()] = _InFlight(request, time.monotonic())
+
+	def end(self) -> None:
+		""" stop watching the request being handled on this thread """
+		self._in_flight.pop(threading.get_ident(), None)
+
+	def run(self, request: Request, func: typing.Callable[[], typing.Any]) -> typing.Any:
+		""" call ``func`` while watching ``request`` """
+		self.begin(request)
+		try:
+			return func()
+		finally:
+			self.end()
+
+	def stop(self) -> None:
+		self._stopped.set()
+
+	def _start(self) -> None:
+		self._in_flight.clear() # a forked worker doesn't have its parent's threads
+		self._stopped.clear()
+		threading.Thread(target=self._watch, name='pigwig-watchdog', daemon=True).start()
+		self._pid = os.getpid() # last, so that other threads wait on the lock until it's started
+
+	def _watch(self) -> None:
+		while not self._stopped.wait(self.interval):
+			try:
+				self.check()
+			except Exception:
+				traceback.print_exc()
+
+	def check(self) -> None:
+		""" sample every request that has run past the threshold. the watchdog thread calls this """
+		now = time.monotonic()
+		slow = [(thread_id, in_flight) for thread_id, in_flight in self._in_flight.copy().items()
+				if now - in_flight.start >= self.threshold and in_flight.samples < self.max_samples]
+		if not slow:
+			return
+		frames = sys._current_frames()
+		for thread_id, in_flight in slow:
+			frame = frames.get(thread_id)
+			if frame is None or self._in_flight.get(thread_id) is not in_flight: # it just finished
+				continue
+			stack = ''.join(traceback.format_stack(frame))
+			unchanged = stack == in_flight.last_stack
+			in_flight.last_stack = stack
+			in_flight.samples += 1
+			self.handler(SlowRequest(in_flight.request, now - in_flight.start, thread_id, stack, in_flight.samples,
+					unchanged))
+
+class _InFlight:
+	__slots__ = ('last_stack', 'request', 'samples', 'start')
+
+	def __init__(self, request: Request, start: float) -> None:
+		self.request = request
+		self.start = start
+		self.samples = 0
+		self.last_stack: str | None = None